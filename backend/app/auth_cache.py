@@ -0,0 +1,109 @@
+"""
+Caches behind get_current_user, so an authenticated request usually costs a
+hash and two dict lookups instead of a JWT verification and a user query.
+
+- verified_tokens: sha256 of a token -> its claims, for tokens that passed
+  jwt.decode. An entry never outlives the token's `exp`.
+- principals: user id (the token's `uid` claim) -> the user, as schemas.User.
+
+Both are per worker, bounded, least recently used evicted first, and entries
+expire after a TTL. Committed writes to a User (a password or profile change,
+a deletion) evict that user in this worker; the TTL bounds how long other
+workers keep serving the old row. Logging out evicts the token.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import config, models
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, expires_at), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """Cache value for the TTL, or until expires_at if that comes first."""
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        expires_at = min(time.time() + self.ttl_seconds, expires_at or float("inf"))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def token_key(token: str) -> str:
+    # The token itself isn't kept in memory
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+verified_tokens = TTLCache(config.AUTH_TOKEN_CACHE_SIZE, config.AUTH_TOKEN_CACHE_TTL)
+principals = TTLCache(config.AUTH_USER_CACHE_SIZE, config.AUTH_USER_CACHE_TTL)
+
+
+def forget_token(token: str) -> None:
+    verified_tokens.pop(token_key(token))
+
+
+@event.listens_for(Session, "after_flush")
+def _note_user_changes(session, flush_context):
+    changed = session.dirty | session.deleted
+    user_ids = {obj.id for obj in changed if isinstance(obj, models.User)}
+    if user_ids:
+        session.info.setdefault("users_changed", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_on_commit(session):
+    for user_id in session.info.pop("users_changed", ()):
+        principals.pop(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("users_changed", None)
@@ -1,13 +1,26 @@
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from . import config
 
 SECRET_KEY = "SECRET_KEY_FOR_DEV_ONLY"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = config.AUTH_ACCESS_TOKEN_MINUTES
+REFRESH_TOKEN_EXPIRE_DAYS = config.AUTH_REFRESH_TOKEN_DAYS
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Hashes made with other Argon2 parameters still verify, and need_update()
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=config.AUTH_ARGON2_TIME_COST,
+    argon2__memory_cost=config.AUTH_ARGON2_MEMORY_KIB,
+    argon2__parallelism=config.AUTH_ARGON2_PARALLELISM,
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -15,16 +28,75 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class HasherBusyError(Exception):
+    """Raised when the password hasher already has its maximum number of pending hashes."""
+
+class PasswordHasher:
+    """
+    Argon2 off the event loop. A hash costs tens to hundreds of milliseconds
+    of CPU; argon2-cffi releases the GIL while it runs, so a few threads keep
+    the event loop free. Hashes past the queue limit are refused rather than
+    piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        # Running hashes plus the ones waiting for a thread
+        self.max_pending = workers + queue_size
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HasherBusyError(f"{self._pending} password hashes already pending")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+            self._pending += 1
+            future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Whether password matches, and a new hash if this one used old parameters."""
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+password_hasher = PasswordHasher(config.AUTH_HASH_WORKERS, config.AUTH_HASH_QUEUE_SIZE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti: the ID a logout revokes (app.revocation)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token(data: dict):
+    """
+    A long-lived token that only POST /auth/refresh accepts, exchanged there
+    for a new access token and a new refresh token.
+    """
+    return create_access_token(
+        {**data, "type": "refresh"}, expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+
 def decode_access_token(token: str) -> Optional[dict]:
     """
     Decode and validate a JWT token.
@@ -0,0 +1,233 @@
+"""
+Product catalog change tracking and the in-memory catalog.
+
+Code that keeps a copy of the catalog in memory remembers the version it
+loaded and reloads once `version()` moves on. The version is bumped after
+every committed ORM transaction that inserted, updated or deleted a Product.
+Writes to a product's variants count as writes to the product. Bulk
+UPDATE/DELETE statements bypass the ORM and must call `bump()` themselves.
+subscribe() tells which products each ORM commit wrote.
+
+With CATALOG_VERSION_BACKEND=local the version lives in the process, and a
+write made by one uvicorn worker goes unnoticed by the others. "file" keeps it
+in CATALOG_VERSION_FILE, shared by every worker on the host (a local stand-in
+for Redis), so all of them reload after any write.
+
+CatalogCache serves GET /products from memory: every product pre-serialized,
+indexed by id and category, reloaded when the version changes. Responses
+carry a strong ETag derived from their content, the same in every worker,
+so clients revalidate with If-None-Match and get a 304. Sorted orders and
+filter counts for listing.Listing are built on first use and kept with the
+snapshot.
+"""
+import hashlib
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from fastapi import Response, status
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import config, models, schemas, variants
+
+
+class LocalVersion:
+    """Catalog version of this process."""
+
+    def __init__(self):
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        return self._version
+
+    def bump(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+class FileVersion:
+    """Catalog version in a file, shared by the processes on a host."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        try:
+            return int(self.path.read_text() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def bump(self) -> int:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path.with_name(f"{self.path.name}.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                version = self.get() + 1
+                # Readers see the old or the new number, never a partial write
+                tmp_path = self.path.with_name(f"{self.path.name}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(str(version))
+                tmp_path.replace(self.path)
+                return version
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_version_backend():
+    if config.CATALOG_VERSION_BACKEND == "local":
+        return LocalVersion()
+    if config.CATALOG_VERSION_BACKEND == "file":
+        return FileVersion(config.CATALOG_VERSION_FILE)
+    raise ValueError(f"Unknown CATALOG_VERSION_BACKEND: {config.CATALOG_VERSION_BACKEND}")
+
+
+_backend = create_version_backend()
+
+
+def version() -> int:
+    return _backend.get()
+
+
+def bump() -> int:
+    return _backend.bump()
+
+
+_subscribers: List[Callable[[int, Set[int]], None]] = []
+
+
+def subscribe(callback: Callable[[int, Set[int]], None]) -> None:
+    """Call callback(version, product_ids) after each commit that wrote products."""
+    _subscribers.append(callback)
+
+
+@event.listens_for(Session, "after_flush")
+def _note_product_changes(session, flush_context):
+    # new/dirty/deleted still describe what was just flushed at this point
+    changed = session.new | session.dirty | session.deleted
+    product_ids = {obj.id for obj in changed if isinstance(obj, models.Product)}
+    product_ids |= {obj.product_id for obj in changed if isinstance(obj, models.ProductVariant)}
+    if product_ids:
+        session.info.setdefault("catalog_changed", set()).update(product_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    product_ids = session.info.pop("catalog_changed", None)
+    if product_ids:
+        new_version = bump()
+        for callback in _subscribers:
+            callback(new_version, product_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("catalog_changed", None)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether a request's If-None-Match names etag, so a 304 will do."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match asks for
+    return "*" in candidates or etag in (tag.removeprefix("W/") for tag in candidates)
+
+
+class CatalogSnapshot:
+    """The whole catalog at one version, serialized and indexed."""
+
+    def __init__(self, version: int, products: Iterable[models.Product],
+                 options: Iterable[Tuple[int, str, str]] = ()):
+        self.version = version
+        # (size, color) of each product's available variants
+        self.options: dict[int, Set[Tuple[str, str]]] = {}
+        for product_id, size, color in options:
+            self.options.setdefault(product_id, set()).add((size, color))
+        self.json: dict[int, bytes] = {}
+        self.hashes: dict[int, str] = {}
+        self.ids: List[int] = []
+        self.ids_by_category: dict[str, List[int]] = defaultdict(list)
+        self.products: dict[int, schemas.Product] = {}
+        self._sorted: dict[tuple, tuple] = {}
+        self._counts: dict = {}
+        for product in products:
+            validated = schemas.Product.model_validate(product, from_attributes=True)
+            data = validated.model_dump_json().encode()
+            self.products[product.id] = validated
+            self.json[product.id] = data
+            self.hashes[product.id] = hashlib.sha256(data).hexdigest()
+            self.ids.append(product.id)
+            self.ids_by_category[product.category].append(product.id)
+
+    def sorted(self, category: Optional[str], attribute: str) -> Tuple[List[tuple], List[int]]:
+        """(sort key, id) pairs of a category in ascending order, and the ids alone."""
+        cached = self._sorted.get((category, attribute))
+        if cached is None:
+            ids = self.ids if category is None else self.ids_by_category.get(category, [])
+            keys = sorted((getattr(self.products[i], attribute), i) for i in ids)
+            cached = self._sorted[(category, attribute)] = (keys, [i for _, i in keys])
+        return cached
+
+    def count(self, key, compute: Callable[["CatalogSnapshot"], int]) -> int:
+        """compute(self), remembered under key for the life of the snapshot."""
+        if key not in self._counts:
+            self._counts[key] = compute(self)
+        return self._counts[key]
+
+    def respond(self, ids: List[int], if_none_match: Optional[str], single: bool = False,
+                headers: Optional[dict] = None) -> Response:
+        """The products as a JSON array (one object if single), or a 304 if the client has them.
+
+        Extra headers are sent along and count towards the ETag.
+        """
+        headers = dict(headers or {})
+        if single:
+            etag = f'"{self.hashes[ids[0]]}"'
+        else:
+            parts = [self.hashes[i] for i in ids] + [f"{k}={v}" for k, v in sorted(headers.items())]
+            etag = '"' + hashlib.sha256(",".join(parts).encode()).hexdigest() + '"'
+        headers.update({"ETag": etag, "Cache-Control": f"public, max-age={config.CATALOG_MAX_AGE}"})
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if single:
+            content = self.json[ids[0]]
+        else:
+            content = b"[" + b",".join(self.json[i] for i in ids) + b"]"
+        return Response(content, media_type="application/json", headers=headers)
+
+
+class CatalogCache:
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+
+    async def snapshot(self, db: AsyncSession) -> CatalogSnapshot:
+        """The current catalog, loaded through db if it changed since last time."""
+        current = version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == current:
+            return snapshot
+        # Concurrent misses may each load it; a write during the load bumps
+        # the version again, so a stale snapshot never outlives the next request
+        products = await db.scalars(select(models.Product).order_by(models.Product.id))
+        Variant = models.ProductVariant
+        options = await db.execute(
+            select(Variant.product_id, Variant.size, Variant.color).where(variants.available())
+        )
+        snapshot = CatalogSnapshot(current, products, options)
+        self._snapshot = snapshot
+        return snapshot
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,182 @@
+"""
+Runtime settings, read from the environment (and a local .env file if present).
+"""
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database. SQLite by default; a postgresql:// URL is served through asyncpg.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+# Read-only engine for GET routes that only read: a replica at DATABASE_READ_URL,
+# or with DB_READ_ENGINE=true a separate read-only pool on DATABASE_URL.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+DB_READ_ENGINE = os.getenv("DB_READ_ENGINE", "false").lower() == "true"
+# Connection pool, per engine and per worker process. Checkouts past size +
+# overflow wait up to DB_POOL_TIMEOUT seconds.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this many seconds are replaced (-1: never)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test connections on checkout and replace the ones the server dropped
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# SQLite pragmas set on every connection. WAL lets readers run alongside the
+# writer; busy_timeout makes writers queue for the lock instead of failing
+# with "database is locked".
+DB_SQLITE_JOURNAL_MODE = os.getenv("DB_SQLITE_JOURNAL_MODE", "WAL")
+DB_SQLITE_SYNCHRONOUS = os.getenv("DB_SQLITE_SYNCHRONOUS", "NORMAL")
+DB_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("DB_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DB_SQLITE_CACHE_MB = int(os.getenv("DB_SQLITE_CACHE_MB", "64"))
+DB_SQLITE_MMAP_MB = int(os.getenv("DB_SQLITE_MMAP_MB", "256"))
+
+# Product catalog served from memory, with ETags, by GET /products
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+# Cache-Control max-age of catalog responses, seconds
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))
+# Where the catalog version lives: "local" (per process) or "file" (shared by
+# the workers on a host, so a write in one reloads the catalog in all)
+CATALOG_VERSION_BACKEND = os.getenv("CATALOG_VERSION_BACKEND", "local")
+CATALOG_VERSION_FILE = os.getenv("CATALOG_VERSION_FILE", "temp/catalog.version")
+
+# Product search backend for GET /products/search: "memory" (inverted index in
+# each worker, kept current from the catalog) or "fts5" (SQLite full-text table)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory")
+
+# Authentication caches, per worker: verified tokens (never kept past their
+# exp) and the users they belong to. A user changed through another worker
+# may be served from here for up to AUTH_USER_CACHE_TTL seconds. 0 disables.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# Password hashing. Argon2 runs on AUTH_HASH_WORKERS threads, off the event
+# loop; with AUTH_HASH_QUEUE_SIZE more waiting, signups and logins get a 429.
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+AUTH_HASH_QUEUE_SIZE = int(os.getenv("AUTH_HASH_QUEUE_SIZE", "32"))
+# Argon2id cost. Passwords hashed with other values are rehashed at their
+# next login.
+AUTH_ARGON2_TIME_COST = int(os.getenv("AUTH_ARGON2_TIME_COST", "3"))
+AUTH_ARGON2_MEMORY_KIB = int(os.getenv("AUTH_ARGON2_MEMORY_KIB", "65536"))
+AUTH_ARGON2_PARALLELISM = int(os.getenv("AUTH_ARGON2_PARALLELISM", "4"))
+
+# Token lifetimes. Access tokens are short-lived; a refresh token gets a new
+# pair from POST /auth/refresh without the password, and is replaced each time.
+AUTH_ACCESS_TOKEN_MINUTES = int(os.getenv("AUTH_ACCESS_TOKEN_MINUTES", "15"))
+AUTH_REFRESH_TOKEN_DAYS = int(os.getenv("AUTH_REFRESH_TOKEN_DAYS", "30"))
+# Revoked tokens (logout, used refresh tokens) are kept in the database until
+# they expire, behind a Bloom filter in each worker sized for
+# AUTH_REVOCATION_FILTER_CAPACITY tokens at AUTH_REVOCATION_FILTER_ERROR_RATE
+# false positives. Workers pick up each other's revocations every
+# AUTH_REVOCATION_SYNC_INTERVAL seconds and delete expired ones every
+# AUTH_REVOCATION_PURGE_INTERVAL.
+AUTH_REVOCATION_FILTER_CAPACITY = int(os.getenv("AUTH_REVOCATION_FILTER_CAPACITY", "100000"))
+AUTH_REVOCATION_FILTER_ERROR_RATE = float(os.getenv("AUTH_REVOCATION_FILTER_ERROR_RATE", "0.001"))
+AUTH_REVOCATION_SYNC_INTERVAL = int(os.getenv("AUTH_REVOCATION_SYNC_INTERVAL", "5"))
+AUTH_REVOCATION_PURGE_INTERVAL = int(os.getenv("AUTH_REVOCATION_PURGE_INTERVAL", "3600"))
+
+# Lines allowed in one PUT /cart or POST /cart/items:batch
+CART_BATCH_MAX_LINES = int(os.getenv("CART_BATCH_MAX_LINES", "200"))
+
+# Virtual try-on job queue
+# Number of worker threads running renders concurrently.
+TRYON_WORKERS = int(os.getenv("TRYON_WORKERS", "2"))
+# Jobs allowed to wait for a free worker before new submissions get a 429.
+TRYON_QUEUE_SIZE = int(os.getenv("TRYON_QUEUE_SIZE", "16"))
+# How long finished jobs stay pollable.
+TRYON_JOB_TTL_SECONDS = int(os.getenv("TRYON_JOB_TTL_SECONDS", "900"))
+# Time budget per render, queueing included, before it degrades to the fallback
+# image. Clients can pick their own with X-Request-Deadline, up to the max.
+TRYON_DEADLINE_SECONDS = float(os.getenv("TRYON_DEADLINE_SECONDS", "90"))
+TRYON_DEADLINE_MAX_SECONDS = float(os.getenv("TRYON_DEADLINE_MAX_SECONDS", "300"))
+
+# Try-on model backend: "gradio" (OOTDiffusion on Hugging Face), "stub" (in-process
+# compositing, for tests / local dev / load tests) or "subprocess" (model server child process)
+TRYON_BACKEND = os.getenv("TRYON_BACKEND", "gradio")
+# Artificial delay per render of the stub engine, in seconds.
+TRYON_STUB_LATENCY = float(os.getenv("TRYON_STUB_LATENCY", "0"))
+# Command starting the model server for the subprocess backend. Empty runs the
+# bundled stub server (python -m app.try_on.model_server).
+TRYON_SUBPROCESS_COMMAND = os.getenv("TRYON_SUBPROCESS_COMMAND", "")
+# Backends kept connected and warm, shared by the job queue's workers.
+TRYON_BACKEND_POOL_SIZE = int(os.getenv("TRYON_BACKEND_POOL_SIZE", "2"))
+# How long a render waits for a free backend before giving up, in seconds.
+TRYON_BACKEND_ACQUIRE_TIMEOUT = float(os.getenv("TRYON_BACKEND_ACQUIRE_TIMEOUT", "30"))
+# Idle backends are health-checked this often; reconnects back off up to the max.
+TRYON_BACKEND_HEALTH_INTERVAL = float(os.getenv("TRYON_BACKEND_HEALTH_INTERVAL", "30"))
+TRYON_BACKEND_BACKOFF_MAX = float(os.getenv("TRYON_BACKEND_BACKOFF_MAX", "60"))
+# Consecutive render failures that open the circuit breaker, and how long it stays open.
+TRYON_BREAKER_THRESHOLD = int(os.getenv("TRYON_BREAKER_THRESHOLD", "5"))
+TRYON_BREAKER_RESET_SECONDS = float(os.getenv("TRYON_BREAKER_RESET_SECONDS", "30"))
+
+# Rendered try-on cache
+TRYON_CACHE_ENABLED = os.getenv("TRYON_CACHE_ENABLED", "true").lower() == "true"
+TRYON_CACHE_DIR = os.getenv("TRYON_CACHE_DIR", "cache/try-on")
+TRYON_CACHE_MAX_MB = int(os.getenv("TRYON_CACHE_MAX_MB", "512"))
+TRYON_CACHE_TTL_SECONDS = int(os.getenv("TRYON_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Coalescing of identical in-flight renders; the directory holds the lock
+# files shared by all uvicorn workers on this machine
+TRYON_FLIGHT_DIR = os.getenv("TRYON_FLIGHT_DIR", "temp/flights")
+# How long a finished render's result id stays available to other workers
+TRYON_FLIGHT_RESULT_TTL = float(os.getenv("TRYON_FLIGHT_RESULT_TTL", "60"))
+# Lock and result files unused for TRYON_FLIGHT_MAX_AGE_SECONDS are deleted,
+# checked every TRYON_FLIGHT_SWEEP_INTERVAL seconds
+TRYON_FLIGHT_MAX_AGE_SECONDS = int(os.getenv("TRYON_FLIGHT_MAX_AGE_SECONDS", "3600"))
+TRYON_FLIGHT_SWEEP_INTERVAL = int(os.getenv("TRYON_FLIGHT_SWEEP_INTERVAL", "300"))
+
+# Where rendered try-on images are stored and served from ("local" only for now)
+TRYON_RESULT_STORE = os.getenv("TRYON_RESULT_STORE", "local")
+TRYON_RESULT_DIR = os.getenv("TRYON_RESULT_DIR", "results/try-on")
+# Results are deleted TRYON_CACHE_TTL_SECONDS after they were last stored,
+# checked this often
+TRYON_RESULT_SWEEP_INTERVAL = int(os.getenv("TRYON_RESULT_SWEEP_INTERVAL", "3600"))
+
+# Shopper photo uploads
+TRYON_UPLOAD_MAX_MB = int(os.getenv("TRYON_UPLOAD_MAX_MB", "15"))
+# Uploads up to this size are kept in memory, bigger ones spill to TRYON_UPLOAD_TMP_DIR
+TRYON_UPLOAD_MEMORY_KB = int(os.getenv("TRYON_UPLOAD_MEMORY_KB", "1024"))
+TRYON_UPLOAD_TMP_DIR = os.getenv("TRYON_UPLOAD_TMP_DIR", "temp/uploads")
+# Temp files older than this are considered orphaned and removed by the janitor
+TRYON_UPLOAD_ORPHAN_SECONDS = int(os.getenv("TRYON_UPLOAD_ORPHAN_SECONDS", "3600"))
+TRYON_UPLOAD_JANITOR_INTERVAL = int(os.getenv("TRYON_UPLOAD_JANITOR_INTERVAL", "300"))
+
+# Photo preprocessing before inference
+TRYON_PREPROCESS_ENABLED = os.getenv("TRYON_PREPROCESS_ENABLED", "true").lower() == "true"
+# Size of the preprocessing process pool; 0 runs it on the job's own thread
+TRYON_PREPROCESS_WORKERS = int(os.getenv("TRYON_PREPROCESS_WORKERS", "2"))
+# OOTDiffusion's working resolution
+TRYON_MODEL_WIDTH = int(os.getenv("TRYON_MODEL_WIDTH", "768"))
+TRYON_MODEL_HEIGHT = int(os.getenv("TRYON_MODEL_HEIGHT", "1024"))
+# "pad" (letterbox) or "crop" to reach the model aspect ratio
+TRYON_PREPROCESS_FIT = os.getenv("TRYON_PREPROCESS_FIT", "pad")
+TRYON_JPEG_QUALITY = int(os.getenv("TRYON_JPEG_QUALITY", "90"))
+
+# Render quality tiers: sampler settings and the resolution the photo is sent
+# at. A tier with "upgrade_to" is delivered progressively: its render is
+# published as a preview, then the job carries on with the upgrade tier.
+# Override with a JSON object of the same shape in TRYON_QUALITY_TIERS.
+TRYON_QUALITY_TIERS = json.loads(os.getenv("TRYON_QUALITY_TIERS") or "null") or {
+    "preview": {
+        "n_samples": 1, "n_steps": 8, "image_scale": 2.0,
+        "width": TRYON_MODEL_WIDTH // 2, "height": TRYON_MODEL_HEIGHT // 2,
+        "upgrade_to": "final",
+    },
+    "final": {
+        "n_samples": 1, "n_steps": 30, "image_scale": 2.5,
+        "width": TRYON_MODEL_WIDTH, "height": TRYON_MODEL_HEIGHT,
+    },
+}
+# Tier used when a request doesn't ask for one
+TRYON_DEFAULT_QUALITY = os.getenv("TRYON_DEFAULT_QUALITY", "final")
+
+# Garment images prepared at model resolution on startup
+TRYON_GARMENT_DIR = os.getenv("TRYON_GARMENT_DIR", "cache/garments")
+TRYON_GARMENT_CACHE_MB = int(os.getenv("TRYON_GARMENT_CACHE_MB", "64"))
+
+# Batched try-on (one photo, several garments)
+TRYON_BATCH_MAX_ITEMS = int(os.getenv("TRYON_BATCH_MAX_ITEMS", "12"))
+# Renders of one batch allowed on the job queue at the same time
+TRYON_BATCH_CONCURRENCY = int(os.getenv("TRYON_BATCH_CONCURRENCY", "3"))
@@ -0,0 +1,216 @@
+"""
+Product listing: filters, sort orders and cursor pagination for GET /products.
+
+A page is found by keyset, not offset: the cursor carries the sort key and id
+of the last product served, and the next page starts right after it. Every
+sort order ends with the product id, so the order is total and a product is
+never served twice or skipped while paging. Cursors are opaque to clients.
+
+The same listing runs against the in-memory catalog (catalog.CatalogSnapshot)
+or as SQL, where the composite indexes on Product cover each sort order
+within a category.
+"""
+import base64
+import bisect
+import json
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, variants
+
+# Sort parameter -> (Product attribute, descending)
+SORTS = {
+    "id": ("id", False),
+    "-id": ("id", True),
+    "price": ("price", False),
+    "-price": ("price", True),
+    "name": ("name", False),
+    "-name": ("name", True),
+}
+
+# JSON types a cursor's sort key may have, by Product attribute
+KEY_TYPES = {
+    "id": (int,),
+    "price": (int, float),
+    "name": (str,),
+}
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that wasn't issued for this sort order."""
+
+
+def encode_cursor(sort: str, key, product_id: int) -> str:
+    data = json.dumps([sort, key, product_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """(sort key, id) of the last product of the previous page."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, product_id = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if cursor_sort != sort:
+        raise InvalidCursor(f"Cursor was issued for sort={cursor_sort}")
+    # Anything else would fail comparing against the catalog or in the query
+    key_types = KEY_TYPES[SORTS[sort][0]]
+    if not _is_instance(key, key_types) or not _is_instance(product_id, (int,)):
+        raise InvalidCursor("Malformed cursor")
+    return key, product_id
+
+
+def _is_instance(value, types: tuple) -> bool:
+    # JSON true/false decode to bool, which is an int
+    return isinstance(value, types) and not isinstance(value, bool)
+
+
+@dataclass(frozen=True)
+class ProductFilter:
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    brand: Optional[str] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+
+    def matches(self, product, options: Set[Tuple[str, str]]) -> bool:
+        """
+        Everything but the category, which the catalog's index takes care of.
+        options are the (size, color) of the product's available variants.
+        """
+        return (
+            (self.min_price is None or product.price >= self.min_price)
+            and (self.max_price is None or product.price <= self.max_price)
+            and (self.brand is None or product.brand == self.brand)
+            and (self._any_option() or any(self._offers(size, color) for size, color in options))
+        )
+
+    def clauses(self) -> list:
+        Product = models.Product
+        clauses = []
+        if self.category:
+            clauses.append(Product.category == self.category)
+        if self.min_price is not None:
+            clauses.append(Product.price >= self.min_price)
+        if self.max_price is not None:
+            clauses.append(Product.price <= self.max_price)
+        if self.brand is not None:
+            clauses.append(Product.brand == self.brand)
+        if not self._any_option():
+            # One variant in both the size and the color, not one of each
+            Variant = models.ProductVariant
+            variant = select(Variant.id).where(Variant.product_id == Product.id, variants.available())
+            if self.size is not None:
+                variant = variant.where(Variant.size == self.size)
+            if self.color is not None:
+                variant = variant.where(Variant.color == self.color)
+            clauses.append(variant.exists())
+        return clauses
+
+    def _any_option(self) -> bool:
+        return self.size is None and self.color is None
+
+    def _offers(self, size: str, color: str) -> bool:
+        return (self.size is None or size == self.size) and (self.color is None or color == self.color)
+
+
+@dataclass
+class Page:
+    ids: List[int]
+    next_cursor: Optional[str]
+    # Products matching the filter on all pages, when asked for
+    total: Optional[int] = None
+    # The page's Product rows, on the database path
+    products: Optional[list] = None
+
+
+@dataclass(frozen=True)
+class Listing:
+    filter: ProductFilter
+    sort: str = "id"
+    cursor: Optional[str] = None
+    limit: int = 20
+    # Kept for old clients; skipped after the cursor position
+    offset: int = 0
+    with_total: bool = False
+
+    def in_memory(self, snapshot) -> Page:
+        """Page through a catalog.CatalogSnapshot."""
+        attribute, descending = SORTS[self.sort]
+        keys, ids = snapshot.sorted(self.filter.category, attribute)
+        if self.cursor is None:
+            start = len(keys) - 1 if descending else 0
+        else:
+            key, product_id = decode_cursor(self.cursor, self.sort)
+            if descending:
+                start = bisect.bisect_left(keys, (key, product_id)) - 1
+            else:
+                start = bisect.bisect_right(keys, (key, product_id))
+        unfiltered = self._unfiltered()
+        if unfiltered:
+            # Every product in the order matches: skip the offset by position
+            start += -self.offset if descending else self.offset
+        positions = range(start, -1, -1) if descending else range(max(start, 0), len(keys))
+
+        matching = (ids[i] for i in positions)
+        if not unfiltered:
+            matching = (i for i in matching if self.filter.matches(snapshot.products[i], snapshot.options.get(i, ())))
+        page = []
+        for i, product_id in enumerate(matching):
+            if not unfiltered and i < self.offset:
+                continue
+            if len(page) == self.limit:
+                # One more exists: there is a next page
+                return self._page(snapshot, attribute, page, more=True)
+            page.append(product_id)
+        return self._page(snapshot, attribute, page, more=False)
+
+    async def from_db(self, db: AsyncSession) -> Page:
+        attribute, descending = SORTS[self.sort]
+        Product = models.Product
+        column = getattr(Product, attribute)
+        clauses = self.filter.clauses()
+
+        query = select(Product).where(*clauses)
+        if self.cursor is not None:
+            position = tuple_(column, Product.id)
+            key = tuple_(*decode_cursor(self.cursor, self.sort))
+            query = query.where(position < key if descending else position > key)
+        if descending:
+            query = query.order_by(column.desc(), Product.id.desc())
+        else:
+            query = query.order_by(column, Product.id)
+        rows = (await db.scalars(query.offset(self.offset).limit(self.limit + 1))).all()
+
+        products = rows[:self.limit]
+        next_cursor = None
+        if len(rows) > self.limit and products:
+            last = products[-1]
+            next_cursor = encode_cursor(self.sort, getattr(last, attribute), last.id)
+        total = None
+        if self.with_total:
+            # Counts the filter's rows in the index, without fetching them
+            total = await db.scalar(select(func.count()).select_from(Product).where(*clauses))
+        return Page([p.id for p in products], next_cursor, total, products)
+
+    def _unfiltered(self) -> bool:
+        return self.filter == ProductFilter(category=self.filter.category)
+
+    def _page(self, snapshot, attribute: str, page: List[int], more: bool) -> Page:
+        next_cursor = None
+        if more and page:
+            last = snapshot.products[page[-1]]
+            next_cursor = encode_cursor(self.sort, getattr(last, attribute), last.id)
+        total = snapshot.count(self.filter, self._count) if self.with_total else None
+        return Page(page, next_cursor, total)
+
+    def _count(self, snapshot) -> int:
+        _, ids = snapshot.sorted(self.filter.category, "id")
+        if self._unfiltered():
+            return len(ids)
+        return sum(1 for i in ids if self.filter.matches(snapshot.products[i], snapshot.options.get(i, ())))
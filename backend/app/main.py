@@ -1,20 +1,80 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import auth, products, cart, try_on
-from .database import engine, Base, SessionLocal, init_db
+from .database import (
+    engine, async_engine, async_read_engine, AsyncReadSessionLocal, Base, SessionLocal, init_db,
+    add_missing_columns, add_missing_indexes, merge_duplicate_cart_items,
+)
+from . import config, search
+from .variants import backfill_product_variants
+from .auth_utils import password_hasher
+from .revocation import revoked_tokens, run_revocation_sync
+from .try_on.jobs import job_queue
+from .try_on.uploads import run_janitor
+from .try_on.results import result_store, run_result_sweeper
+from .try_on.preprocess import preprocessor
+from .try_on.garments import garment_registry
+from .try_on.pool import backend_pool, run_health_checks
+from .try_on.singleflight import render_flights, run_sweeper
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+merge_duplicate_cart_items(engine)
+add_missing_indexes(engine)
+backfill_product_variants(engine)
+if config.SEARCH_BACKEND == "fts5":
+    search.create_fts_table(engine)
 
 # Seed Data
 db = SessionLocal()
 init_db(db)
 db.close()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(garment_registry.warm)
+    async with AsyncReadSessionLocal() as db:
+        await search.product_search.warm(db)
+    await asyncio.to_thread(revoked_tokens.rebuild, engine)
+    # Connect the model backends before taking traffic; failures are retried
+    await asyncio.to_thread(backend_pool.connect)
+    janitor = asyncio.create_task(run_janitor(
+        config.TRYON_UPLOAD_JANITOR_INTERVAL, config.TRYON_UPLOAD_ORPHAN_SECONDS
+    ))
+    health_checker = asyncio.create_task(run_health_checks(
+        backend_pool, config.TRYON_BACKEND_HEALTH_INTERVAL
+    ))
+    flight_sweeper = asyncio.create_task(run_sweeper(
+        render_flights, config.TRYON_FLIGHT_SWEEP_INTERVAL, config.TRYON_FLIGHT_MAX_AGE_SECONDS
+    ))
+    result_sweeper = asyncio.create_task(run_result_sweeper(
+        result_store, config.TRYON_RESULT_SWEEP_INTERVAL
+    ))
+    revocation_sync = asyncio.create_task(run_revocation_sync(
+        revoked_tokens, engine, config.AUTH_REVOCATION_SYNC_INTERVAL, config.AUTH_REVOCATION_PURGE_INTERVAL
+    ))
+    yield
+    janitor.cancel()
+    revocation_sync.cancel()
+    result_sweeper.cancel()
+    health_checker.cancel()
+    flight_sweeper.cancel()
+    # Let running renders finish, drop the ones still waiting
+    job_queue.shutdown(wait=True)
+    preprocessor.shutdown()
+    password_hasher.shutdown()
+    backend_pool.close()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+
 app = FastAPI(
     title="Virtual Wardrobe API",
     description="Backend for Virtual Wardrobe application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -26,6 +86,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"],
 )
 
 # Include Routers
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, JSON, Table
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Float, JSON, Table
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -32,11 +32,52 @@ class Product(Base):
     category = Column(String, index=True)
     description = Column(String)
     
-    # Store lists as JSON
+    # Store lists as JSON. Every size in every color is offered: writing
+    # sizes or colors updates the product's variants to match (app.variants).
     colors = Column(JSON)
     sizes = Column(JSON)
     details = Column(JSON)
 
+    # Virtual try-on: OOTDiffusion garment category ("Upper-body", "Lower-body", "Dress")
+    # and the garment image sent to the model. Products without them can't be tried on.
+    garment_category = Column(String, nullable=True)
+    try_on_image = Column(String, nullable=True)
+
+    # GET /products pages by keyset over (sort column, id), within a category or not
+    __table_args__ = (
+        Index("ix_products_category_price_id", "category", "price", "id"),
+        Index("ix_products_category_name_id", "category", "name", "id"),
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_brand", "brand"),
+    )
+
+    # Deleted along with the product, by the database or app.variants
+    variants = relationship("ProductVariant", back_populates="product", passive_deletes="all")
+
+class ProductVariant(Base):
+    """A size and color of a product, as stocked and sold."""
+    __tablename__ = "product_variants"
+    __table_args__ = (
+        # Looking up one variant (add to cart) and a product's variants
+        Index("uq_product_variants_option", "product_id", "size", "color", unique=True),
+        # Filtering products by size, color or both
+        Index("ix_product_variants_size_color", "size", "color", "product_id"),
+        Index("ix_product_variants_color", "color", "product_id"),
+        # SKUs are made from the id: never hand a deleted variant's id out again
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    size = Column(String, nullable=False)
+    color = Column(String, nullable=False)
+    # Units on hand; None when stock isn't tracked. Available unless it is 0.
+    stock = Column(Integer, nullable=True)
+    sku = Column(String, unique=True, nullable=True)
+
+    product = relationship("Product", back_populates="variants")
+
 class Cart(Base):
     __tablename__ = "carts"
 
@@ -49,6 +90,10 @@ class Cart(Base):
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    # One line per product, size and color; adding the same again raises the quantity
+    __table_args__ = (
+        Index("uq_cart_items_line", "cart_id", "product_id", "size", "color", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     cart_id = Column(Integer, ForeignKey("carts.id"))
@@ -59,3 +104,15 @@ class CartItem(Base):
 
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
+
+class RevokedToken(Base):
+    """A token ID (the JWT `jti` claim) that is no longer accepted, until the token expires."""
+    __tablename__ = "revoked_tokens"
+    # Workers read rows past the last id they saw: never hand a purged row's id out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    # Workers load revocations made elsewhere by id, in order
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, nullable=False)
+    # Unix time of the token's exp; past it the row can go
+    expires_at = Column(Integer, nullable=False, index=True)
@@ -0,0 +1,186 @@
+"""
+Revoked tokens: logged out access tokens and refresh tokens already used.
+
+Every token carries a random `jti`. Revoking one writes a row to the
+revoked_tokens table, kept until the token would have expired anyway, and
+adds the jti to a Bloom filter in this worker. get_current_user asks the
+filter on every request: nearly every token is definitely not revoked, which
+costs one hash and a few bit tests. Only the jtis the filter may contain are
+looked up in the table, so a false positive costs a query, never a wrong
+answer.
+
+A token revoked through another worker is in the table but not yet in this
+worker's filter; run_revocation_sync() adds such rows every
+AUTH_REVOCATION_SYNC_INTERVAL seconds, reading only rows past the last id it
+saw. A Bloom filter can't forget, so every worker rebuilds its filter when it
+purges expired rows.
+"""
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import config, models
+
+Revoked = models.RevokedToken
+
+
+class BloomFilter:
+    """Set membership with no false negatives and error_rate false positives, up to capacity keys."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        array = self._array
+        for position in self._positions(key):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.checks = 0
+        # The filter said maybe, and the table said...
+        self.confirmed = 0
+        self.false_positives = 0
+        self._filter = BloomFilter(capacity, error_rate)
+        # Highest revoked_tokens.id already in the filter
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _add(self, jtis: Iterable[str]) -> None:
+        with self._lock:
+            for jti in jtis:
+                self._filter.add(jti)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        return jti in self._filter
+
+    async def is_revoked(self, db: AsyncSession, jti: str) -> bool:
+        if not self.might_be_revoked(jti):
+            return False
+        revoked = await db.scalar(select(Revoked.id).where(Revoked.jti == jti)) is not None
+        if revoked:
+            self.confirmed += 1
+        else:
+            self.false_positives += 1
+        return revoked
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: int) -> bool:
+        """
+        Revoke the token until expires_at (Unix time) and commit. False if it
+        was already revoked, so of two requests using the same refresh token
+        only one gets True.
+        """
+        db.add(Revoked(jti=jti, expires_at=int(expires_at)))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return False
+        self._add([jti])
+        return True
+
+    def sync(self, engine) -> int:
+        """Add revocations made since the last sync, by any worker. Returns how many."""
+        with engine.connect() as conn:
+            # Another worker purged the rows past ours, and their ids may be handed out again
+            if (conn.scalar(select(func.max(Revoked.id))) or 0) < self._last_id:
+                purged = True
+            else:
+                purged = False
+                rows = conn.execute(
+                    select(Revoked.id, Revoked.jti).where(Revoked.id > self._last_id).order_by(Revoked.id)
+                ).all()
+        if purged:
+            self.rebuild(engine)
+            return 0
+        if rows:
+            self._add(jti for _, jti in rows)
+            self._last_id = max(self._last_id, rows[-1].id)
+        # Past capacity the false positive rate climbs; start over with room to spare
+        if self._filter.count > self.capacity:
+            self.capacity *= 2
+            self.rebuild(engine)
+        return len(rows)
+
+    def rebuild(self, engine) -> None:
+        """Refill the filter from the table, leaving out what was purged."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        with engine.connect() as conn:
+            last_id = conn.scalar(select(func.max(Revoked.id))) or 0
+            for (jti,) in conn.execute(select(Revoked.jti).where(Revoked.id <= last_id)):
+                bloom.add(jti)
+        with self._lock:
+            self._filter = bloom
+            self._last_id = last_id
+        # Revoked here while the filter was being built
+        self.sync(engine)
+
+    def purge(self, engine, now: Optional[float] = None) -> int:
+        """
+        Delete revocations of tokens that have expired and rebuild the filter.
+        Returns how many were deleted. Rebuilds even if none were: another
+        worker may have purged them first.
+        """
+        now = time.time() if now is None else now
+        with engine.begin() as conn:
+            deleted = conn.execute(delete(Revoked).where(Revoked.expires_at < now)).rowcount
+        self.rebuild(engine)
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tokens": self._filter.count,
+                "capacity": self.capacity,
+                "bits": self._filter.bits,
+                "checks": self.checks,
+                "confirmed": self.confirmed,
+                "false_positives": self.false_positives,
+            }
+
+
+async def run_revocation_sync(revocations: RevocationList, engine, sync_interval: int, purge_interval: int) -> None:
+    """Pick up other workers' revocations and purge expired ones, until cancelled."""
+    last_purge = time.monotonic()
+    while True:
+        await asyncio.sleep(sync_interval)
+        if time.monotonic() - last_purge >= purge_interval:
+            last_purge = time.monotonic()
+            deleted = await asyncio.to_thread(revocations.purge, engine)
+            if deleted:
+                print(f"Purged {deleted} expired token revocations")
+        else:
+            await asyncio.to_thread(revocations.sync, engine)
+
+
+revoked_tokens = RevocationList(config.AUTH_REVOCATION_FILTER_CAPACITY, config.AUTH_REVOCATION_FILTER_ERROR_RATE)
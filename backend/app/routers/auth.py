@@ -1,19 +1,29 @@
+from typing import Optional
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .. import models, schemas
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import auth_cache, models, schemas
 from ..database import get_db
-from ..auth_utils import verify_password, get_password_hash, create_access_token, SECRET_KEY, ALGORITHM
+from ..auth_utils import (
+    HasherBusyError, password_hasher, create_access_token, create_refresh_token, decode_access_token,
+    SECRET_KEY, ALGORITHM,
+)
+from ..revocation import revoked_tokens
 from jose import JWTError, jwt
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.User:
     """
     Dependency to get the current authenticated user from JWT token.
     Raises 401 if token is invalid or expired.
+
+    Tokens already verified and users already loaded are served from the
+    caches in auth_cache; a warm request runs no crypto and no query. The
+    revocation check is a Bloom filter lookup (app.revocation).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -21,39 +31,74 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    key = auth_cache.token_key(token)
+    payload = auth_cache.verified_tokens.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError as e:
+            # Check if token is expired
+            if "expired" in str(e).lower():
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token has expired",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
             raise credentials_exception
-    except JWTError as e:
-        # Check if token is expired
-        if "expired" in str(e).lower():
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.email == email).first()
+        # Refresh tokens are only good for POST /auth/refresh
+        if payload.get("sub") is None or payload.get("type") == "refresh":
+            raise credentials_exception
+        auth_cache.verified_tokens.put(key, payload, expires_at=payload.get("exp"))
+    # Tokens from before they had a jti can't be revoked; they expire soon enough
+    jti = payload.get("jti")
+    if jti is not None and await revoked_tokens.is_revoked(db, jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user_id = payload.get("uid")
+    user = auth_cache.principals.get(user_id) if user_id is not None else None
     if user is None:
+        if user_id is not None:
+            row = await db.get(models.User, user_id)
+        else:
+            # Tokens issued before they carried the user id
+            row = await db.scalar(select(models.User).where(models.User.email == payload["sub"]))
+        if row is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(row)
+        auth_cache.principals.put(user.id, user)
+    # A token stops working once its user's email changes
+    if user.email != payload["sub"]:
         raise credentials_exception
     return user
 
+def hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many logins in progress, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+def issue_tokens(user) -> dict:
+    claims = {"sub": user.email, "uid": user.id}
+    return {"token": create_access_token(claims), "refresh_token": create_refresh_token(claims), "user": user}
+
 @router.get("/me", response_model=schemas.User)
-async def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: schemas.User = Depends(get_current_user)):
     """
     Get the current authenticated user.
     """
     return current_user
 
 @router.post("/signup", response_model=schemas.AuthResponse, status_code=status.HTTP_201_CREATED)
-async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Create a new user account and return authentication token.
     """
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -67,7 +112,10 @@ async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
             detail="Password must be at least 8 characters long"
         )
     
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HasherBusyError:
+        raise hasher_busy_exception()
     
     # Create new user
     new_user = models.User(
@@ -76,39 +124,90 @@ async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
-    # Create and return token directly
-    access_token = create_access_token(data={"sub": new_user.email})
-    return {"token": access_token, "user": new_user}
+    # Create and return tokens directly
+    return issue_tokens(new_user)
 
 @router.post("/login", response_model=schemas.AuthResponse)
-async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
     """
-    Authenticate user and return JWT token.
+    Authenticate user and return an access token and a refresh token.
     """
-    user = db.query(models.User).filter(models.User.email == user_credentials.email).first()
+    user = await db.scalar(select(models.User).where(models.User.email == user_credentials.email))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
-    if not verify_password(user_credentials.password, user.hashed_password):
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(
+            user_credentials.password, user.hashed_password
+        )
+    except HasherBusyError:
+        raise hasher_busy_exception()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
+    if new_hash is not None:
+        # Hashed with Argon2 parameters since changed
+        user.hashed_password = new_hash
+        await db.commit()
     
-    access_token = create_access_token(data={"sub": user.email})
-    return {"token": access_token, "user": user}
+    return issue_tokens(user)
+
+@router.post("/refresh", response_model=schemas.AuthResponse)
+async def refresh(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and refresh token, without
+    the password. Each refresh token works once: it is revoked here, and a
+    second use gets a 401.
+    """
+    invalid_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = decode_access_token(body.refresh_token)
+    if payload is None or payload.get("type") != "refresh" or payload.get("jti") is None:
+        raise invalid_exception
+    user = await db.get(models.User, payload.get("uid"))
+    if user is None or user.email != payload.get("sub"):
+        raise invalid_exception
+    user = schemas.User.model_validate(user)
+    if not await revoked_tokens.revoke(db, payload["jti"], payload["exp"]):
+        raise invalid_exception
+    return issue_tokens(user)
 
 @router.post("/logout")
-async def logout(current_user: models.User = Depends(get_current_user)):
+async def logout(
+    body: Optional[schemas.RefreshRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Logout endpoint (token invalidation handled on client side).
+    Revoke the access token, and the refresh token if one is sent, in every
+    worker. The token and the user are dropped from this worker's auth caches.
     """
+    payload = decode_access_token(token)
+    if payload is not None and payload.get("jti") is not None:
+        await revoked_tokens.revoke(db, payload["jti"], payload["exp"])
+    if body is not None:
+        refresh_payload = decode_access_token(body.refresh_token)
+        if (
+            refresh_payload is not None
+            and refresh_payload.get("type") == "refresh"
+            and refresh_payload.get("uid") == current_user.id
+            and refresh_payload.get("jti") is not None
+        ):
+            await revoked_tokens.revoke(db, refresh_payload["jti"], refresh_payload["exp"])
+    auth_cache.forget_token(token)
+    auth_cache.principals.pop(current_user.id)
     return {"message": "Successfully logged out"}
 
 @router.post("/forgot-password")
@@ -1,142 +1,320 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from sqlalchemy.orm import Session
-from .. import models, schemas
+from fastapi import APIRouter, HTTPException, Depends, status
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from .. import config, models, schemas, variants
 from ..database import get_db
 from .auth import get_current_user
 
 router = APIRouter(tags=["Cart", "Wishlist"])
 
+# Lazy loading can't happen under an AsyncSession: relationships the response
+# needs are loaded up front, in a fixed number of queries whatever the cart size.
+
+async def load_cart(db: AsyncSession, user: schemas.User, create: bool = True) -> Optional[models.Cart]:
+    """
+    The user's cart with its items and their products. Created if missing, unless create is False.
+    Two queries: the cart, then its items joined to their products.
+    """
+    query = (
+        select(models.Cart)
+        .where(models.Cart.user_id == user.id)
+        .options(selectinload(models.Cart.items).joinedload(models.CartItem.product, innerjoin=True))
+        # Pick up items added or removed since the cart was last loaded
+        .execution_options(populate_existing=True)
+    )
+    cart = await db.scalar(query)
+    if cart is None and create:
+        db.add(models.Cart(user_id=user.id))
+        await db.commit()
+        cart = await db.scalar(query)
+    return cart
+
+# Cart mutations are one transaction each: lock the cart, change its lines in
+# SQL, recompute the total in SQL from what is now in the table, commit.
+
+async def lock_cart(db: AsyncSession, user: schemas.User, create: bool = True) -> Optional[int]:
+    """
+    Id of the user's cart, created if missing unless create is False. On Postgres
+    the cart row stays locked until commit, so mutations of a cart run one at a
+    time; SQLite has a single writer anyway.
+    """
+    cart_id = await db.scalar(
+        select(models.Cart.id).where(models.Cart.user_id == user.id).with_for_update()
+    )
+    if cart_id is None and create:
+        cart = models.Cart(user_id=user.id, total=0.0)
+        db.add(cart)
+        await db.flush()
+        cart_id = cart.id
+    return cart_id
+
+LINE_KEY = ["cart_id", "product_id", "size", "color"]
+
+async def upsert_cart_items(db: AsyncSession, cart_id: int, lines: List[dict], replace: bool = False) -> None:
+    """
+    Add lines ({product_id, size, color, quantity}), or raise the quantity of
+    the line already in the cart with the same product, size and color. With
+    replace, the quantity of such a line is set instead. One statement.
+    """
+    if not lines:
+        return
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(models.CartItem)
+    if replace:
+        quantity = statement.excluded.quantity
+    else:
+        quantity = models.CartItem.quantity + statement.excluded.quantity
+    await db.execute(
+        statement.on_conflict_do_update(index_elements=LINE_KEY, set_={"quantity": quantity}),
+        [dict(line, cart_id=cart_id) for line in lines],
+    )
+
+async def delete_cart_items(db: AsyncSession, cart_id: int, keys: List[Tuple[int, str, str]]) -> None:
+    """Remove the lines with these (product_id, size, color). One statement."""
+    if not keys:
+        return
+    await db.execute(delete(models.CartItem).where(
+        models.CartItem.cart_id == cart_id,
+        tuple_(models.CartItem.product_id, models.CartItem.size, models.CartItem.color).in_(keys),
+    ))
+
+async def update_cart_total(db: AsyncSession, cart_id: int) -> None:
+    line_totals = (
+        select(func.coalesce(func.sum(models.Product.price * models.CartItem.quantity), 0.0))
+        .select_from(models.CartItem)
+        .join(models.Product, models.Product.id == models.CartItem.product_id)
+        .where(models.CartItem.cart_id == cart_id)
+        .scalar_subquery()
+    )
+    await db.execute(update(models.Cart).where(models.Cart.id == cart_id).values(total=line_totals))
+
+async def check_products(db: AsyncSession, product_ids: Iterable[int]) -> None:
+    """404 unless all these products exist, in one query."""
+    wanted = set(product_ids)
+    if not wanted:
+        return
+    found = set(await db.scalars(select(models.Product.id).where(models.Product.id.in_(wanted))))
+    if found != wanted:
+        raise HTTPException(status_code=404, detail=f"Products not found: {sorted(wanted - found)}")
+
+async def check_variants(db: AsyncSession, keys: Iterable[Tuple[int, str, str]]) -> None:
+    """
+    404 unless all the products exist, 422 unless each (product_id, size,
+    color) is an available variant. One query when they are.
+    """
+    wanted = set(keys)
+    if not wanted:
+        return
+    Variant = models.ProductVariant
+    found = set((await db.execute(
+        select(Variant.product_id, Variant.size, Variant.color)
+        .where(tuple_(Variant.product_id, Variant.size, Variant.color).in_(wanted), variants.available())
+    )).all())
+    if found != wanted:
+        await check_products(db, {product_id for product_id, _, _ in wanted - found})
+        missing = ", ".join(f"{size}/{color} of product {product_id}"
+                            for product_id, size, color in sorted(wanted - found))
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail=f"Not available: {missing}")
+
+def fold_operations(operations: List[schemas.CartBatchOperation]) -> Dict[Tuple[int, str, str], Tuple[str, int]]:
+    """
+    Net effect of operations applied in order, per line (product_id, size, color):
+    ("add", n) raises the quantity by n, ("set", n) makes it n, 0 removing the line.
+    """
+    lines = {}
+    for operation in operations:
+        if operation.quantity < 0:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                                detail="Quantities can't be negative")
+        key = (operation.product_id, operation.size, operation.color)
+        mode, quantity = lines.get(key, ("add", 0))
+        if operation.op == "add":
+            lines[key] = (mode, quantity + operation.quantity)
+        elif operation.op == "set":
+            lines[key] = ("set", operation.quantity)
+        else:
+            lines[key] = ("set", 0)
+    return lines
+
+def line_values(key: Tuple[int, str, str], quantity: int) -> dict:
+    product_id, size, color = key
+    return {"product_id": product_id, "size": size, "color": color, "quantity": quantity}
+
+def check_batch_size(lines: list) -> None:
+    if len(lines) > config.CART_BATCH_MAX_LINES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"At most {config.CART_BATCH_MAX_LINES} lines per request",
+        )
+
+async def load_wishlist_owner(db: AsyncSession, user: schemas.User) -> models.User:
+    """The user's row with their wishlist, in one query through the association table."""
+    query = (
+        select(models.User)
+        .where(models.User.id == user.id)
+        .options(joinedload(models.User.wishlist))
+        .execution_options(populate_existing=True)
+    )
+    return (await db.scalars(query)).unique().one()
+
+async def load_wishlist(db: AsyncSession, user: schemas.User) -> List[models.Product]:
+    """The user's wishlist, in one query through the association table."""
+    return (await load_wishlist_owner(db, user)).wishlist
+
+
 # Cart Endpoints
 @router.get("/cart", response_model=schemas.Cart)
 async def get_cart(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    if not current_user.cart:
-        new_cart = models.Cart(user_id=current_user.id)
-        db.add(new_cart)
-        db.commit()
-        db.refresh(current_user)
-    
-    return current_user.cart
+    return await load_cart(db, current_user)
 
 @router.post("/cart/items", response_model=schemas.Cart)
 async def add_to_cart(
     item: schemas.CartItemCreate, 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Ensure cart exists
-    if not current_user.cart:
-        new_cart = models.Cart(user_id=current_user.id)
-        db.add(new_cart)
-        db.commit()
-        db.refresh(current_user)
-    
-    cart = current_user.cart
-
-    # Check product
-    product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Check if item exists in cart
-    existing_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart.id,
-        models.CartItem.product_id == item.product_id,
-        models.CartItem.size == item.size,
-        models.CartItem.color == item.color
-    ).first()
-    
-    if existing_item:
-        existing_item.quantity += item.quantity
-    else:
-        new_item = models.CartItem(
-            cart_id=cart.id,
-            product_id=product.id,
-            quantity=item.quantity,
-            size=item.size,
-            color=item.color
+    # Added to the line's quantity as is, so it must add something
+    if item.quantity < 1:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail="Quantity must be at least 1")
+    # Check the size and color are sold, by the variant's index
+    Variant = models.ProductVariant
+    variant = (await db.execute(
+        select(Variant.id, Variant.stock).where(
+            Variant.product_id == item.product_id, Variant.size == item.size, Variant.color == item.color
         )
-        db.add(new_item)
-    
-    # Recalculate total
-    # Need to flush to ensure items are up to date for calculation?
-    # Or just calculate from what we have.
-    # Since we modified existing or added new, let's commit first to be safe or calculate manually.
-    # A cleaner way is to sum it up.
-    
-    db.commit() 
-    db.refresh(cart)
-    
-    # Recalculate total based on DB state
-    new_total = sum(i.product.price * i.quantity for i in cart.items)
-    cart.total = new_total
-    db.commit()
-    db.refresh(cart)
+    )).first()
+    if variant is None:
+        if await db.get(models.Product, item.product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail=f"Product {item.product_id} doesn't come in {item.size}/{item.color}")
+    if variant.stock == 0:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                            detail=f"{item.size}/{item.color} of product {item.product_id} is out of stock")
+
+    cart_id = await lock_cart(db, current_user)
+    await upsert_cart_items(db, cart_id, [item.model_dump()])
+    await update_cart_total(db, cart_id)
+    await db.commit()
     
-    return cart
+    return await load_cart(db, current_user)
 
 @router.delete("/cart/items/{item_id}", response_model=schemas.Cart)
 async def remove_from_cart(
     item_id: int, 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    cart = current_user.cart
-    if not cart:
+    cart_id = await lock_cart(db, current_user, create=False)
+    if cart_id is None:
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    item = db.query(models.CartItem).filter(models.CartItem.id == item_id, models.CartItem.cart_id == cart.id).first()
-    if not item:
+    result = await db.execute(
+        delete(models.CartItem).where(models.CartItem.id == item_id, models.CartItem.cart_id == cart_id)
+    )
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Item not found")
         
-    db.delete(item)
-    db.commit()
-    db.refresh(cart)
-    
-    # Recalculate total
-    cart.total = sum(i.product.price * i.quantity for i in cart.items)
-    db.commit()
-    db.refresh(cart)
+    await update_cart_total(db, cart_id)
+    await db.commit()
 
-    return cart
+    return await load_cart(db, current_user)
+
+@router.put("/cart", response_model=schemas.Cart)
+async def replace_cart(
+    cart: schemas.CartReplace,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Replace the cart's contents. Lines given twice are added up, quantity 0 leaves a line out."""
+    check_batch_size(cart.items)
+    lines = fold_operations([schemas.CartBatchOperation(**item.model_dump()) for item in cart.items])
+    await check_variants(db, [key for key, (_, n) in lines.items() if n])
+
+    cart_id = await lock_cart(db, current_user)
+    await db.execute(delete(models.CartItem).where(models.CartItem.cart_id == cart_id))
+    await upsert_cart_items(db, cart_id, [line_values(key, n) for key, (_, n) in lines.items() if n])
+    await update_cart_total(db, cart_id)
+    await db.commit()
+
+    return await load_cart(db, current_user)
+
+@router.post("/cart/items:batch", response_model=schemas.Cart)
+async def batch_update_cart(
+    batch: schemas.CartBatch,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Add, set and remove many lines at once, in order. All of them are
+    applied, in one transaction, or none if a product doesn't exist or
+    doesn't come in the size and color.
+    """
+    check_batch_size(batch.operations)
+    lines = fold_operations(batch.operations)
+    # Lines can always be removed, even of variants no longer sold
+    await check_variants(db, [key for key, (_, n) in lines.items() if n])
+    removed = [key for key, (mode, n) in lines.items() if mode == "set" and not n]
+    replaced = [line_values(key, n) for key, (mode, n) in lines.items() if mode == "set" and n]
+    added = [line_values(key, n) for key, (mode, n) in lines.items() if mode == "add" and n]
+
+    cart_id = await lock_cart(db, current_user)
+    await delete_cart_items(db, cart_id, removed)
+    await upsert_cart_items(db, cart_id, replaced, replace=True)
+    await upsert_cart_items(db, cart_id, added)
+    await update_cart_total(db, cart_id)
+    await db.commit()
+
+    return await load_cart(db, current_user)
 
 # Wishlist Endpoints
 @router.get("/wishlist", response_model=List[schemas.Product])
-async def get_wishlist(current_user: models.User = Depends(get_current_user)):
-    return current_user.wishlist
+async def get_wishlist(
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    return await load_wishlist(db, current_user)
 
 @router.post("/wishlist/items")
 async def add_to_wishlist(
     item: schemas.WishlistItemCreate, 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
+    product = await db.get(models.Product, item.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
         
-    if product in current_user.wishlist:
+    # Changes to the wishlist go through the user's row, kept referenced here
+    owner = await load_wishlist_owner(db, current_user)
+    if product in owner.wishlist:
         return {"message": "Product already in wishlist"}
         
-    current_user.wishlist.append(product)
-    db.commit()
+    owner.wishlist.append(product)
+    await db.commit()
     
     return {"message": "Product added to wishlist"}
 
 @router.delete("/wishlist/items/{product_id}")
 async def remove_from_wishlist(
     product_id: int, 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    product = next((p for p in current_user.wishlist if p.id == product_id), None)
+    owner = await load_wishlist_owner(db, current_user)
+    product = next((p for p in owner.wishlist if p.id == product_id), None)
     if not product:
          return {"message": "Product not in wishlist"} # Or 404
     
-    current_user.wishlist.remove(product)
-    db.commit()
+    owner.wishlist.remove(product)
+    await db.commit()
     
     return {"message": "Product removed from wishlist"}
@@ -1,27 +1,120 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from .. import models, schemas
-from ..database import get_db
+import json
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Response
+from typing import List, Literal, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import config, models, schemas, search
+from ..catalog import catalog_cache
+from ..database import get_read_db
+from ..listing import InvalidCursor, Listing, ProductFilter
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
+# The listing and single-product routes answer from the in-memory catalog,
+# with ETag and Cache-Control, unless CATALOG_CACHE_ENABLED is off. Search
+# always filters and serves from it.
+
 @router.get("/", response_model=List[schemas.Product])
 async def get_products(
+    response: Response,
     category: Optional[str] = None,
-    limit: int = 20,
-    offset: int = 0,
-    db: Session = Depends(get_db)
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    brand: Optional[str] = None,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    sort: Literal["id", "-id", "price", "-price", "name", "-name"] = "id",
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=0),
+    offset: int = Query(0, ge=0),
+    total: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    query = db.query(models.Product)
-    if category and category != "All":
-        query = query.filter(models.Product.category == category)
-    
-    return query.offset(offset).limit(limit).all()
+    """
+    One page of products. X-Next-Cursor holds the cursor of the next page
+    (absent on the last one) and X-Total-Count the number of matching
+    products, if total is set.
+    """
+    listing = Listing(
+        ProductFilter(
+            category=category if category != "All" else None,
+            min_price=min_price, max_price=max_price, brand=brand, size=size, color=color,
+        ),
+        sort=sort, cursor=cursor, limit=limit, offset=offset, with_total=total,
+    )
+    try:
+        if config.CATALOG_CACHE_ENABLED:
+            snapshot = await catalog_cache.snapshot(db)
+            page = listing.in_memory(snapshot)
+        else:
+            page = await listing.from_db(db)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {}
+    if page.next_cursor is not None:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        headers["X-Total-Count"] = str(page.total)
+    if config.CATALOG_CACHE_ENABLED:
+        return snapshot.respond(page.ids, if_none_match, headers=headers)
+
+    response.headers.update(headers)
+    return page.products
+
+@router.get("/search", response_model=schemas.ProductSearchResults)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    prefix: bool = True,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    brand: Optional[str] = None,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    limit: int = Query(20, ge=0, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Products matching every word of q in their name, brand, description or
+    details, best match first. With prefix (type-ahead) the last word may be
+    the start of a word. Facets count the filtered matches.
+    """
+    snapshot = await catalog_cache.snapshot(db)
+    scores = await search.product_search.match(db, snapshot, search.tokenize(q), prefix)
+
+    if category == "All":
+        category = None
+    product_filter = ProductFilter(min_price=min_price, max_price=max_price, brand=brand, size=size, color=color)
+    ranked = sorted(
+        (
+            product_id for product_id in scores
+            # Products written since the snapshot may not be in it yet
+            if product_id in snapshot.products
+            and (category is None or snapshot.products[product_id].category == category)
+            and product_filter.matches(snapshot.products[product_id], snapshot.options.get(product_id, ()))
+        ),
+        key=lambda product_id: (-scores[product_id], product_id),
+    )
+    facets = json.dumps(search.facet_counts(snapshot, ranked), separators=(",", ":")).encode()
+    items = b",".join(snapshot.json[product_id] for product_id in ranked[offset:offset + limit])
+    content = b'{"total":%d,"facets":%s,"items":[%s]}' % (len(ranked), facets, items)
+    return Response(content, media_type="application/json")
 
 @router.get("/{id}", response_model=schemas.Product)
-async def get_product(id: int, db: Session = Depends(get_db)):
-    product = db.query(models.Product).filter(models.Product.id == id).first()
+async def get_product(
+    id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if config.CATALOG_CACHE_ENABLED:
+        snapshot = await catalog_cache.snapshot(db)
+        if id not in snapshot.json:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return snapshot.respond([id], if_none_match, single=True)
+
+    product = await db.get(models.Product, id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
@@ -1,46 +1,38 @@
-from fastapi import APIRouter, File, UploadFile, Form
-from ..schemas import TryOnResult
-import os 
-import shutil
-import uuid
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+from fastapi import APIRouter, File, UploadFile, Form, Depends, Header, HTTPException, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from ..schemas import TryOnJob, TryOnBatchItem
+from .. import config
+from ..catalog import etag_matches
+from ..try_on.jobs import FAILED, JobQueue, QueueFullError, get_job_queue, publish_partial
+from ..try_on.cache import render_cache, render_key
+from ..try_on.garments import GarmentAsset, garment_registry
+from ..try_on.results import result_store, media_type, result_tier
+from ..try_on.uploads import SharedUpload, SpooledUpload, UploadTooLargeError, receive_upload
+from ..try_on.preprocess import InvalidImageError, preprocessor
+from ..try_on.pool import backend_pool
+from ..try_on.singleflight import render_flights
+from ..try_on.deadlines import Deadline, DeadlineExceeded, RequestCancelled, deadline_counters
+import asyncio
+import base64
+import json
+from collections import deque
+from typing import Callable, Optional
 
 router = APIRouter(prefix="/try-on", tags=["Virtual Try-On"])
 
+FALLBACK_IMAGE = "/assets/try-on-fallback.jpg"
+
 # AI Fashion Try-On Agent Logic
 class TryOnAgent:
+    # Quality tier settings sent to the model as sampler parameters
+    sampler_settings = ("n_samples", "n_steps", "image_scale")
+
     def __init__(self):
         self.supported_models = ["OOTDiffusion"]
-        self.ootd_client = None
-        self._clients_initialized = False
-        
-    def _init_clients(self):
-        """Initialize OOTDiffusion client"""
-        if not self._clients_initialized:
-            from gradio_client import Client
-            hf_token = os.getenv("HUGGINGFACE_TOKEN")
-            
-            if hf_token:
-                os.environ["HF_TOKEN"] = hf_token
-            
-            # Initialize OOTDiffusion
-            try:
-                print("Initializing OOTDiffusion Client...")
-                self.ootd_client = Client("levihsu/OOTDiffusion")
-                print("✓ OOTDiffusion Client initialized successfully.")
-            except Exception as e:
-                print(f"✗ OOTDiffusion unavailable: {e}")
-                
-            self._clients_initialized = True
-            
-            if not self.ootd_client:
-                print("⚠ OOTDiffusion client not available - will use fallback image")
         
-    async def analyze_image(self, image: UploadFile) -> dict:
+    def analyze_image(self, image: SpooledUpload) -> dict:
         """Analyze the uploaded image to confirm suitability for try-on."""
         return {
             "is_front_facing": True,
@@ -49,118 +41,478 @@ class TryOnAgent:
             "pose_valid": True
         }
 
-    def get_garment_category(self, product_id: int) -> str:
-        """Map product ID to garment category for OOTDiffusion"""
-        # OOTDiffusion supports: "Upper-body", "Lower-body", "Dress"
-        mapping = {
-            1: "Upper-body",   # Blouse
-            2: "Upper-body",   # Blazer
-            3: "Dress",        # Dress
-            4: "Lower-body",   # Trousers
-            5: "Upper-body",   # Sweater
-            6: "Lower-body"    # Skirt
-        }
-        return mapping.get(product_id, "Upper-body")
-
-    def get_garment_image_path(self, product_id: int) -> str:
-        """Return file path for the garment image based on product ID."""
-        # Map product IDs to actual asset filenames
-        filename_map = {
-            1: "clothing-1.jpg",  # Blouse
-            2: "clothing-2.jpg",  # Blazer
-            3: "clothing-3.jpg",  # Dress
-            4: "clothing-4.jpg",  # Trousers
-            5: "clothing-5.jpg",  # Sweater
-            6: "clothing-6.jpg"   # Skirt
-        }
-        filename = filename_map.get(product_id, "clothing-1.jpg")
-        base_path = Path(__file__).parent.parent.parent.parent / "frontend" / "public" / "assets"
-        return str(base_path / filename)
+    def get_garment(self, product_id: int, color: Optional[str] = None) -> Optional[GarmentAsset]:
+        """
+        Prepared garment image and OOTDiffusion category for the product,
+        in the requested colour if we have it. None if it can't be tried on.
+        """
+        return garment_registry.get(product_id, color)
 
+    def model_input(self, user_image: SpooledUpload, width: int, height: int) -> SpooledUpload:
+        """
+        The photo as sent to the model at a tier's resolution. Preprocessed
+        once per upload and size, so the renders of a batch share the work.
+        """
+        if not config.TRYON_PREPROCESS_ENABLED:
+            return user_image
 
-    async def perform_virtual_try_on(self, user_image: UploadFile, product_id: int) -> str:
-        """Execute the virtual try-on process using OOTDiffusion."""
+        def preprocess():
+            processed = SpooledUpload.from_bytes(
+                preprocessor.run(user_image.read_bytes(), width, height)
+            )
+            print(f"📊 Photo preprocessed: {user_image.size} -> {processed.size} bytes ({width}x{height})")
+            return processed
+
+        try:
+            return user_image.derived(f"preprocessed-{width}x{height}", preprocess)
+        except InvalidImageError as e:
+            print(f"⚠ Could not decode photo, sending it as-is: {e}")
+            return user_image
+
+    def perform_virtual_try_on(self, user_image: SpooledUpload, product_id: int,
+                               color: Optional[str] = None,
+                               deadline: Optional[Deadline] = None,
+                               quality: Optional[str] = None) -> str:
+        """
+        Execute the virtual try-on process on the configured model backend,
+        at the given quality tier (TRYON_DEFAULT_QUALITY if None).
+        Blocks for the whole render, so it runs on a job queue worker thread.
+        Returns the URL of the stored result (or of the fallback image), the
+        fallback too when the deadline runs out. Raises RequestCancelled if
+        the client cancelled.
+        """
+        quality = quality or config.TRYON_DEFAULT_QUALITY
+        tier = config.TRYON_QUALITY_TIERS[quality]
+        sampler = {name: tier[name] for name in self.sampler_settings}
         
+        # 0. Abandoned or out of time while waiting in the queue
+        if deadline is not None:
+            if deadline.cancelled:
+                deadline_counters.incr("cancelled")
+                raise RequestCancelled("Cancelled by the client")
+            if deadline.expired:
+                deadline_counters.incr("expired_in_queue")
+                print("Try-on deadline passed while queued, using fallback")
+                return FALLBACK_IMAGE
+
         # 1. Analysis
-        analysis = await self.analyze_image(user_image)
+        analysis = self.analyze_image(user_image)
         if not analysis["pose_valid"]:
             raise ValueError("Invalid user pose detected.")
 
-        # 2. Initialize OOTDiffusion client
-        self._init_clients()
-        
-        if not self.ootd_client:
-            print("OOTDiffusion client not available, using fallback")
-            return "/assets/try-on-fallback.jpg"
-
-        # 3. Prepare Inputs
-        temp_dir = Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        user_img_path = temp_dir / f"user_{uuid.uuid4()}.jpg"
-        
-        with open(user_img_path, "wb") as buffer:
-            shutil.copyfileobj(user_image.file, buffer)
-            
-        garment_img_path = self.get_garment_image_path(product_id)
-        if not os.path.exists(garment_img_path):
-            print(f"Garment image not found at: {garment_img_path}")
-            if os.path.exists(user_img_path):
-                os.remove(user_img_path)
-            return "/assets/try-on-fallback.jpg"
-
-        # 4. Get garment category
-        category = self.get_garment_category(product_id)
+        # 2. Resolve the garment
+        garment = self.get_garment(product_id, color)
+        if not garment:
+            print(f"Product {product_id} has no try-on garment")
+            return FALLBACK_IMAGE
+
+        category = garment.category
         print(f"📊 Garment category: {category}")
-        print(f"📊 Garment image: {garment_img_path}")
+        print(f"📊 Garment image: {garment.path} ({garment.color or 'default'})")
 
-        # 5. Run OOTDiffusion
-        try:
-            from gradio_client import handle_file
-            print(f"Running OOTDiffusion for product {product_id}")
-            
-            result = self.ootd_client.predict(
-                vton_img=handle_file(str(user_img_path)),
-                garm_img=handle_file(garment_img_path),
-                category=category,
-                n_samples=1,
-                n_steps=30,
-                image_scale=2.5,
-                seed=-1,
-                api_name="/process_dc"
+        # 3. Serve a previous render of the exact same inputs
+        key = render_key(
+            user_image.sha256,
+            garment.sha256,
+            category,
+            {
+                **sampler,
+                "backend": config.TRYON_BACKEND,
+                "preprocess": {
+                    **preprocessor.params, "width": tier["width"], "height": tier["height"],
+                } if config.TRYON_PREPROCESS_ENABLED else None,
+            },
+        )
+        if config.TRYON_CACHE_ENABLED:
+            cached = render_cache.get(key)
+            if cached is not None:
+                print(f"✓ Try-on cache hit ({quality})")
+                return result_store.url_for(result_store.save(cached, quality))
+
+        # 4. Fail fast while the model backend is known to be down
+        if not backend_pool.available():
+            print("Try-on backend circuit is open, using fallback")
+            return FALLBACK_IMAGE
+
+        def render_and_store() -> str:
+            # 5. Shrink the photo to what the model actually uses
+            model_input = self.model_input(user_image, tier["width"], tier["height"])
+
+            # 6. Render
+            print(f"Rendering product {product_id} at {quality} quality on the {config.TRYON_BACKEND} backend")
+            generated = backend_pool.render(
+                model_input.as_file(), garment.path, category, {**sampler, "seed": -1}, deadline,
+                garment_data=garment_registry.read(garment),
             )
-            
-            if result and len(result) > 0:
-                generated_img_path = result[0]['image']
-                
-                import base64
-                with open(generated_img_path, 'rb') as img_file:
-                    img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                
-                if os.path.exists(user_img_path):
-                    os.remove(user_img_path)
-                
-                print("✓ OOTDiffusion succeeded")
-                return f"data:image/jpeg;base64,{img_data}"
+            if config.TRYON_CACHE_ENABLED:
+                render_cache.put(key, generated)
+            return result_store.save(generated, quality)
+
+        try:
+            # Identical requests in flight share one render
+            result_id = render_flights.do(key, render_and_store, deadline)
+            print("✓ Try-on render succeeded")
+            return result_store.url_for(result_id)
                 
+        except RequestCancelled:
+            deadline_counters.incr("cancelled")
+            print("Try-on cancelled by the client")
+            raise
+        except DeadlineExceeded as e:
+            deadline_counters.incr("expired_in_render")
+            print(f"✗ {e}")
         except Exception as e:
-            print(f"✗ OOTDiffusion failed: {e}")
-            if os.path.exists(user_img_path):
-                os.remove(user_img_path)
+            print(f"✗ Try-on render failed: {e}")
         
-        # 6. Final fallback
-        print("OOTDiffusion failed, using fallback image")
-        return "/assets/try-on-fallback.jpg"
+        # 7. Final fallback
+        print("Try-on render failed, using fallback image")
+        return FALLBACK_IMAGE
 
 agent = TryOnAgent()
 
-@router.post("/", response_model=TryOnResult)
+def render(user_image: SpooledUpload, product_id: int, color: Optional[str] = None,
+           inline: bool = False, deadline: Optional[Deadline] = None,
+           quality: Optional[str] = None) -> str:
+    """Render, degrading to the fallback image on any error but cancellation."""
+    try:
+        result_url = agent.perform_virtual_try_on(user_image, product_id, color, deadline, quality)
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        print(f"Try-on failed: {e}")
+        return FALLBACK_IMAGE
+    return inline_result(result_url) if inline else result_url
+
+def render_progressive(user_image: SpooledUpload, product_id: int, color: Optional[str] = None,
+                       inline: bool = False, deadline: Optional[Deadline] = None,
+                       quality: Optional[str] = None) -> str:
+    """
+    Render at `quality`. If the tier has an upgrade, its render is published
+    as the job's preview and the job goes on to render the upgrade tier.
+    When the upgrade falls back (e.g. out of time), the preview is the result.
+    """
+    quality = quality or config.TRYON_DEFAULT_QUALITY
+    result = render(user_image, product_id, color, inline, deadline, quality)
+    upgrade = config.TRYON_QUALITY_TIERS[quality].get("upgrade_to")
+    while upgrade and result != FALLBACK_IMAGE:
+        publish_partial(result)
+        upgraded = render(user_image, product_id, color, inline, deadline, upgrade)
+        if upgraded == FALLBACK_IMAGE:
+            break
+        result = upgraded
+        upgrade = config.TRYON_QUALITY_TIERS[upgrade].get("upgrade_to")
+    return result
+
+def run_try_on(user_image: SpooledUpload, product_id: int, color: Optional[str] = None,
+               inline: bool = False, deadline: Optional[Deadline] = None,
+               quality: Optional[str] = None) -> str:
+    """Job body for a single try-on. Owns the upload and releases it whatever happens."""
+    with user_image:
+        return render_progressive(user_image, product_id, color, inline, deadline, quality)
+
+def run_batch_item(photo: SharedUpload, product_id: int, color: Optional[str] = None,
+                   deadline: Optional[Deadline] = None, quality: Optional[str] = None) -> str:
+    """Job body for one garment of a batch. The photo is shared with the other renders."""
+    try:
+        return render_progressive(photo.upload, product_id, color, deadline=deadline, quality=quality)
+    finally:
+        photo.release()
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Calls on_close once the response is over, whether it finished, the client
+    disconnected or the request was cancelled, and even if the body was never
+    iterated. Starlette skips background tasks after a disconnect.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+def inline_result(result_url: str) -> str:
+    """Pre-result-store format: the image itself as a base64 data URI."""
+    result_id = result_url.rsplit("/", 1)[-1]
+    path = result_store.locate(result_id)
+    if path is None:
+        # Fallback asset, served by the frontend
+        return result_url
+    img_data = base64.b64encode(path.read_bytes()).decode('utf-8')
+    return f"data:{media_type(result_id)};base64,{img_data}"
+
+def job_response(snapshot: dict) -> dict:
+    return {
+        "job_id": snapshot["job_id"],
+        "status": snapshot["status"],
+        "result_image": snapshot["result"],
+        "preview_image": snapshot["partial"],
+        "error": snapshot["error"],
+    }
+
+async def receive_photo(userImage: UploadFile) -> SpooledUpload:
+    try:
+        return await receive_upload(userImage)
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Photo must be smaller than {config.TRYON_UPLOAD_MAX_MB} MB",
+        )
+
+def deadline_budget(
+    x_request_deadline: Optional[float] = Header(
+        None, gt=0, description="Seconds the client is willing to wait for the render"
+    )
+) -> float:
+    """
+    Time budget for a render, from submission to result. Clients may ask for
+    less or more than the default, up to TRYON_DEADLINE_MAX_SECONDS.
+    """
+    if x_request_deadline is None:
+        return config.TRYON_DEADLINE_SECONDS
+    deadline_counters.incr("client_deadlines")
+    return min(x_request_deadline, config.TRYON_DEADLINE_MAX_SECONDS)
+
+def quality_tier(
+    quality: Optional[str] = Form(
+        None, description="Quality tier from TRYON_QUALITY_TIERS, e.g. preview or final"
+    )
+) -> str:
+    if quality is None:
+        return config.TRYON_DEFAULT_QUALITY
+    if quality not in config.TRYON_QUALITY_TIERS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"Unknown quality {quality!r}, expected one of {sorted(config.TRYON_QUALITY_TIERS)}",
+        )
+    return quality
+
+def queue_full_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many try-on requests in progress, please retry shortly",
+        headers={"Retry-After": "5"},
+    )
+
+@router.post("/", response_model=TryOnJob, status_code=status.HTTP_202_ACCEPTED)
 async def try_on(
+    response: Response,
     userImage: UploadFile = File(...),
-    productId: int = Form(...)
+    productId: int = Form(...),
+    color: Optional[str] = Form(None),
+    inline: bool = False,
+    quality: str = Depends(quality_tier),
+    budget: float = Depends(deadline_budget),
+    queue: JobQueue = Depends(get_job_queue)
 ):
+    """
+    Queue a try-on render and return its job id right away.
+    Poll GET /try-on/jobs/{job_id} or stream /try-on/jobs/{job_id}/events for the result.
+    The result is a URL under /try-on/results/, or with ?inline=1 a base64 data URI.
+    With quality=preview a quick render shows up as preview_image while the job
+    is still running, and result_image is the full-quality render.
+    Renders not done within the X-Request-Deadline budget get the fallback image;
+    DELETE /try-on/jobs/{job_id} cancels one.
+    """
+    user_image = await receive_photo(userImage)
+
+    deadline = Deadline(budget)
     try:
-        result_url = await agent.perform_virtual_try_on(userImage, productId)
-        return {"result_image": result_url}
-    except Exception as e:
-        print(f"Try-on failed: {e}")
-        return {"result_image": "/assets/try-on-fallback.jpg"}
+        job = queue.submit(run_try_on, user_image, productId, color, inline, deadline, quality,
+                           on_cancel=deadline.cancel)
+    except QueueFullError:
+        user_image.close()
+        raise queue_full_exception()
+
+    response.headers["Location"] = f"/try-on/jobs/{job.id}"
+    return job_response(job.to_dict())
+
+batch_items_adapter = TypeAdapter(list[TryOnBatchItem])
+
+@router.post("/batch")
+async def try_on_batch(
+    userImage: UploadFile = File(...),
+    items: str = Form(..., description='JSON list like [{"productId": 1, "color": "Navy"}]'),
+    quality: str = Depends(quality_tier),
+    budget: float = Depends(deadline_budget),
+    queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Try one photo on several garments. The photo is uploaded, hashed and
+    preprocessed once for the whole batch. Renders run on the job queue, at
+    most TRYON_BATCH_CONCURRENCY at a time, and are streamed back as NDJSON,
+    one line per garment in the order they finish. Each render gets the
+    deadline budget from when it is submitted; disconnecting cancels the
+    ones still in flight.
+    """
+    try:
+        batch = batch_items_adapter.validate_json(items)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    if not 1 <= len(batch) <= config.TRYON_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"A batch takes 1 to {config.TRYON_BATCH_MAX_ITEMS} items",
+        )
+
+    photo = SharedUpload(await receive_photo(userImage), users=len(batch))
+    waiting = deque(enumerate(batch))
+
+    def submit(item: TryOnBatchItem):
+        deadline = Deadline(budget)
+        return queue.submit(run_batch_item, photo, item.productId, item.color, deadline, quality,
+                            on_cancel=deadline.cancel)
+
+    # Submit the first render before answering, so a full queue is a plain 429
+    index, item = waiting.popleft()
+    try:
+        first_job = submit(item)
+    except QueueFullError:
+        photo.upload.close()
+        raise queue_full_exception()
+
+    def line(index: int, item: TryOnBatchItem, snapshot: dict) -> str:
+        return json.dumps({
+            "index": index, "productId": item.productId, "color": item.color,
+            **job_response(snapshot),
+        }) + "\n"
+
+    # Job id -> its wait task, for renders submitted and not yet streamed back
+    running = {first_job.id: None}
+
+    def stop():
+        """
+        Client went away: cancel the renders in flight, the ones never
+        submitted give their share of the photo back. Safe to call twice.
+        """
+        for job_id, task in list(running.items()):
+            if task is not None:
+                task.cancel()
+            queue.cancel(job_id)
+        running.clear()
+        while waiting:
+            waiting.popleft()
+            photo.release()
+
+    async def results():
+        running[first_job.id] = asyncio.ensure_future(queue.wait(first_job.id))
+        items = {first_job.id: (index, item)}
+        try:
+            while waiting or running:
+                while waiting and len(running) < config.TRYON_BATCH_CONCURRENCY:
+                    next_index, next_item = waiting.popleft()
+                    try:
+                        job = submit(next_item)
+                    except QueueFullError:
+                        photo.release()
+                        yield line(next_index, next_item, {
+                            "job_id": None, "status": FAILED, "result": None,
+                            "error": "Too many try-on requests in progress",
+                        })
+                        continue
+                    running[job.id] = asyncio.ensure_future(queue.wait(job.id))
+                    items[job.id] = (next_index, next_item)
+
+                if not running:
+                    continue
+                tasks = {task: job_id for job_id, task in running.items()}
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job_id = tasks[task]
+                    del running[job_id]
+                    yield line(*items.pop(job_id), task.result())
+        finally:
+            stop()
+
+    # The generator's finally only runs if it was started and gets closed;
+    # the response runs stop() however the stream ends
+    return ClosingStreamingResponse(results(), on_close=stop, media_type="application/x-ndjson")
+
+@router.get("/stats")
+async def try_on_stats(queue: JobQueue = Depends(get_job_queue)):
+    """Queue and cache counters, for capacity planning."""
+    return {
+        "queue": queue.stats(),
+        "cache": render_cache.stats(),
+        "garments": garment_registry.stats(),
+        "backend": backend_pool.stats(),
+        "deadlines": deadline_counters.stats(),
+        "coalescing": render_flights.stats(),
+    }
+
+@router.get("/health")
+async def try_on_health(response: Response):
+    """
+    Model backend health: warm connections and circuit breaker state.
+    503 while renders would fall back (nothing connected or breaker open).
+    """
+    pool = backend_pool.stats()
+    healthy = pool["connected"] > 0 and backend_pool.available()
+    if not healthy:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ok" if healthy else "unavailable",
+        "backend": config.TRYON_BACKEND,
+        **pool,
+    }
+
+@router.get("/jobs/{job_id}", response_model=TryOnJob)
+async def get_try_on_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    job = queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job.to_dict())
+
+@router.delete("/jobs/{job_id}", response_model=TryOnJob, status_code=status.HTTP_202_ACCEPTED)
+async def cancel_try_on_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    """Cancel a render the client no longer wants, including upstream on the model backend."""
+    job = queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Try-on job not found")
+    return job_response(job.to_dict())
+
+@router.get("/jobs/{job_id}/events")
+async def stream_try_on_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    """
+    Server-sent events: one `status` event per job state change,
+    the last one carrying the result.
+    """
+    if not queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for snapshot in queue.watch(job_id):
+            yield f"event: status\ndata: {json.dumps(job_response(snapshot))}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+@router.get("/results/{result_id}")
+async def get_try_on_result(result_id: str, request: Request):
+    """
+    Stream a stored render. Results are immutable, so they carry a strong
+    ETag and may be cached indefinitely; Range requests are supported.
+    """
+    path = result_store.locate(result_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+
+    etag = f'"{result_id.split(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    tier = result_tier(result_id)
+    if tier:
+        headers["X-Try-On-Quality"] = tier
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(path, media_type=media_type(result_id), headers=headers)
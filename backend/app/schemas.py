@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 # User Models
 class UserBase(BaseModel):
@@ -29,8 +29,13 @@ class TokenData(BaseModel):
 
 class AuthResponse(BaseModel):
     token: str
+    # For POST /auth/refresh once the token expires
+    refresh_token: Optional[str] = None
     user: User
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 # Product Models
 class Product(BaseModel):
     id: int
@@ -44,6 +49,13 @@ class Product(BaseModel):
     sizes: List[str]
     details: List[str]
 
+class ProductSearchResults(BaseModel):
+    # Matching products on all pages
+    total: int
+    # Counts per value of category, brand, color and size among the matches
+    facets: Dict[str, Dict[str, int]]
+    items: List[Product]
+
 # Cart Models
 class CartItemCreate(BaseModel):
     product_id: int
@@ -63,6 +75,17 @@ class Cart(BaseModel):
     items: List[CartItem]
     total: float
 
+class CartReplace(BaseModel):
+    items: List[CartItemCreate]
+
+class CartBatchOperation(CartItemCreate):
+    # "add" raises the line's quantity, "set" replaces it (0 removes the line),
+    # "remove" drops the line. Lines are identified by product, size and color.
+    op: Literal["add", "set", "remove"] = "add"
+
+class CartBatch(BaseModel):
+    operations: List[CartBatchOperation]
+
 # Wishlist Models
 class WishlistItemCreate(BaseModel):
     product_id: int
@@ -70,3 +93,15 @@ class WishlistItemCreate(BaseModel):
 # Try On Models
 class TryOnResult(BaseModel):
     result_image: str
+
+class TryOnJob(BaseModel):
+    job_id: str
+    status: str
+    result_image: Optional[str] = None
+    # Quick low-quality render, available before result_image with quality=preview
+    preview_image: Optional[str] = None
+    error: Optional[str] = None
+
+class TryOnBatchItem(BaseModel):
+    productId: int
+    color: Optional[str] = None
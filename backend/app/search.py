@@ -0,0 +1,286 @@
+"""
+Full-text product search for GET /products/search.
+
+A query is tokenized like the catalog text (lowercased, accents dropped, split
+on anything that isn't a letter or digit). Every query term must match; with
+prefix matching the last term also matches the words it starts, for
+type-ahead. Matches are ranked by BM25 over name, brand, description and
+details, with a match in the name worth more than one in the description.
+
+Two backends find and score the matches:
+
+- MemorySearch keeps an inverted index in the worker. It is built from the
+  in-memory catalog (catalog.CatalogSnapshot) at startup, and after that
+  only the products written since are re-indexed: committed product writes
+  are reported by catalog.subscribe(). Versions it hasn't seen the writes of
+  (another worker's, or a bulk catalog.bump()) make it rebuild.
+- Fts5Search asks a SQLite FTS5 table over the products, which triggers keep
+  current. Nothing is held in the worker, so it suits large catalogs and
+  many workers; it needs SQLite with FTS5.
+
+Filters, facet counts and the products themselves come from the in-memory
+catalog either way.
+"""
+import asyncio
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import catalog, config
+
+# Field weights: a term in the name counts three times
+FIELD_WEIGHTS = {"name": 3.0, "brand": 2.0, "description": 1.0, "details": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Changes remembered between searches; past this the index rebuilds
+MAX_PENDING_VERSIONS = 1024
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(value: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", value.casefold())
+    return _WORD.findall("".join(c for c in folded if not unicodedata.combining(c)))
+
+
+def document_terms(product) -> Counter:
+    """Weighted term frequencies of a product."""
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = getattr(product, field)
+        if isinstance(value, list):
+            value = " ".join(value)
+        for term in tokenize(value or ""):
+            terms[term] += weight
+    return terms
+
+
+class InvertedIndex:
+    """Postings per term, and the sorted vocabulary for prefix lookups."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.vocabulary: List[str] = []
+        self.lengths: Dict[int, float] = {}
+        self.total_length = 0.0
+        self._terms: Dict[int, Counter] = {}
+
+    def build(self, products) -> None:
+        for product in products:
+            self._add(product)
+        self.vocabulary = sorted(self.postings)
+
+    def update(self, product) -> None:
+        self.remove(product.id)
+        self._add(product)
+        for term in self._terms[product.id]:
+            i = bisect.bisect_left(self.vocabulary, term)
+            if i == len(self.vocabulary) or self.vocabulary[i] != term:
+                self.vocabulary.insert(i, term)
+
+    def remove(self, product_id: int) -> None:
+        terms = self._terms.pop(product_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(product_id)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[product_id]
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def _add(self, product) -> None:
+        terms = document_terms(product)
+        self._terms[product.id] = terms
+        length = sum(terms.values())
+        self.lengths[product.id] = length
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings[term][product.id] = frequency
+
+    def expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff")
+        return self.vocabulary[start:end]
+
+    def search(self, terms: List[str], prefix: bool) -> Dict[int, float]:
+        """BM25 score of every product matching all terms."""
+        if not terms or not self.lengths:
+            return {}
+        average_length = self.total_length / len(self.lengths)
+        scores: Optional[Dict[int, float]] = None
+        for n, term in enumerate(terms):
+            last = n == len(terms) - 1
+            candidates = self.expand(term) if prefix and last else [term]
+            # A product matching several expansions of a prefix counts its best
+            term_scores: Dict[int, float] = {}
+            for candidate in candidates:
+                for product_id, score in self._scores(candidate, average_length).items():
+                    if score > term_scores.get(product_id, 0.0):
+                        term_scores[product_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {i: s + term_scores[i] for i, s in scores.items() if i in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def _scores(self, term: str, average_length: float) -> Dict[int, float]:
+        postings = self.postings.get(term)
+        if not postings:
+            return {}
+        count = len(self.lengths)
+        idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+        return {
+            product_id: idf * frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[product_id] / average_length)
+            )
+            for product_id, frequency in postings.items()
+        }
+
+
+class MemorySearch:
+    def __init__(self):
+        self.index = InvertedIndex()
+        # Catalog version the index reflects, and the product ids written in
+        # each version since
+        self.version: Optional[int] = None
+        self._changes: Dict[int, set] = {}
+        self._lock = threading.Lock()
+        catalog.subscribe(self._note_changes)
+
+    def _note_changes(self, version: int, product_ids: set) -> None:
+        # Called from whichever thread committed
+        with self._lock:
+            if len(self._changes) < MAX_PENDING_VERSIONS:
+                self._changes[version] = product_ids
+
+    def _written_since(self, version: int) -> Optional[set]:
+        """Products written after the index's version up to `version`; None if unknown."""
+        with self._lock:
+            if self.version is None:
+                return None
+            versions = range(self.version + 1, version + 1)
+            if any(v not in self._changes for v in versions):
+                return None
+            return set().union(*(self._changes[v] for v in versions))
+
+    def _done(self, version: int) -> None:
+        with self._lock:
+            self.version = version
+            self._changes = {v: ids for v, ids in self._changes.items() if v > version}
+
+    async def sync(self, snapshot: catalog.CatalogSnapshot) -> None:
+        """Bring the index to the snapshot's version."""
+        if self.version is not None and self.version >= snapshot.version:
+            return
+        written = self._written_since(snapshot.version)
+        if written is None:
+            # Searches keep using the old index while the new one is built.
+            # Concurrent rebuilds may each build one; the newest is kept.
+            index = InvertedIndex()
+            await asyncio.to_thread(index.build, snapshot.products.values())
+            if self.version is None or self.version < snapshot.version:
+                self.index = index
+                self._done(snapshot.version)
+            return
+        # A few products: updated in place, on the event loop, so no search
+        # sees the index half-updated
+        for product_id in written:
+            product = snapshot.products.get(product_id)
+            if product is None:
+                self.index.remove(product_id)
+            else:
+                self.index.update(product)
+        self._done(snapshot.version)
+
+    async def warm(self, db: AsyncSession) -> None:
+        await self.sync(await catalog.catalog_cache.snapshot(db))
+
+    async def match(self, db: AsyncSession, snapshot: catalog.CatalogSnapshot,
+                    terms: List[str], prefix: bool) -> Dict[int, float]:
+        await self.sync(snapshot)
+        return self.index.search(terms, prefix)
+
+
+def create_fts_table(engine) -> None:
+    """The products_fts table and the triggers keeping it in step with products."""
+    if engine.dialect.name != "sqlite":
+        raise ValueError("SEARCH_BACKEND=fts5 needs SQLite")
+    columns = ", ".join(FIELD_WEIGHTS)
+    new_values = ", ".join(f"new.{c}" for c in FIELD_WEIGHTS)
+    old_values = ", ".join(f"old.{c}" for c in FIELD_WEIGHTS)
+    delete_old = (f"INSERT INTO products_fts(products_fts, rowid, {columns}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    insert_new = f"INSERT INTO products_fts(rowid, {columns}) VALUES (new.id, {new_values});"
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )).first()
+        if exists:
+            return
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE products_fts USING fts5({columns}, "
+            "content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(f"CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN {insert_new} END"))
+        conn.execute(text(f"CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN {delete_old} END"))
+        conn.execute(text(
+            f"CREATE TRIGGER products_fts_au AFTER UPDATE ON products BEGIN {delete_old} {insert_new} END"
+        ))
+        conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+        print("Created the products_fts full-text table")
+
+
+class Fts5Search:
+    async def warm(self, db: AsyncSession) -> None:
+        pass
+
+    async def match(self, db: AsyncSession, snapshot: catalog.CatalogSnapshot,
+                    terms: List[str], prefix: bool) -> Dict[int, float]:
+        if not terms:
+            return {}
+        query = " ".join(f'"{term}"' for term in terms)
+        if prefix:
+            query += "*"
+        weights = ", ".join(str(w) for w in FIELD_WEIGHTS.values())
+        # bm25() is lower for better matches
+        rows = await db.execute(
+            text(f"SELECT rowid, -bm25(products_fts, {weights}) FROM products_fts WHERE products_fts MATCH :query"),
+            {"query": query},
+        )
+        return dict(rows.all())
+
+
+def create_search_backend():
+    if config.SEARCH_BACKEND == "memory":
+        return MemorySearch()
+    if config.SEARCH_BACKEND == "fts5":
+        return Fts5Search()
+    raise ValueError(f"Unknown SEARCH_BACKEND: {config.SEARCH_BACKEND}")
+
+
+product_search = create_search_backend()
+
+
+def facet_counts(snapshot: catalog.CatalogSnapshot, product_ids: List[int]) -> Dict[str, Dict[str, int]]:
+    """Matches per category, brand, and available color and size, most common first."""
+    products = [snapshot.products[i] for i in product_ids]
+    options = [snapshot.options.get(i, ()) for i in product_ids]
+    counts = {
+        "category": Counter(p.category for p in products),
+        "brand": Counter(p.brand for p in products),
+        "color": Counter(chain.from_iterable({color for _, color in o} for o in options)),
+        "size": Counter(chain.from_iterable({size for size, _ in o} for o in options)),
+    }
+    return {facet: dict(counter.most_common()) for facet, counter in counts.items()}
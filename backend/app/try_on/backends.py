@@ -0,0 +1,272 @@
+"""
+Try-on model backends.
+
+A backend turns a shopper photo and a garment image into a rendered try-on
+image. TryOnAgent only talks to this interface, so the model can be swapped
+by configuration (TRYON_BACKEND):
+
+- "gradio": OOTDiffusion on Hugging Face, through gradio_client.
+- "stub": deterministic in-process engine that pastes the garment onto the
+  photo after an optional artificial delay. No network, no GPU; used by the
+  test suite and for throughput tests on CI hardware.
+- "subprocess": a model server running as a child process and speaking a
+  line-based JSON protocol over stdin/stdout (see model_server.py). Lets a
+  self-hosted model run out of process, with its own interpreter and memory.
+  POSIX only: render deadlines wait on the pipe with select(), which Windows
+  only supports for sockets.
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import select
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin
+
+from PIL import Image, UnidentifiedImageError
+
+from .. import config
+from .deadlines import Deadline, DeadlineExceeded, RequestCancelled
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+
+# Where the garment goes on the photo, as (left, top, right, bottom) fractions
+GARMENT_REGIONS = {
+    "Upper-body": (0.2, 0.15, 0.8, 0.55),
+    "Lower-body": (0.25, 0.45, 0.75, 0.95),
+    "Dress": (0.2, 0.15, 0.8, 0.9),
+}
+
+
+class TryOnBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def render(self, user_img: Path, garment_img: Path, category: str, params: dict,
+               deadline: Optional[Deadline] = None, garment_data: Optional[bytes] = None) -> bytes:
+        """
+        Blocking: render and return the encoded result image. With a deadline,
+        raises DeadlineExceeded or RequestCancelled as soon as it runs out or
+        is cancelled, after cancelling the work upstream.
+
+        garment_data is the content of garment_img when the caller already
+        has it in memory (the garment registry's cache). Backends that decode
+        the garment in this process use it; the ones handing the image to
+        another process pass the path on.
+        """
+
+    async def render_async(self, user_img: Path, garment_img: Path, category: str,
+                           params: dict, deadline: Optional[Deadline] = None,
+                           garment_data: Optional[bytes] = None) -> bytes:
+        return await asyncio.to_thread(
+            self.render, user_img, garment_img, category, params, deadline, garment_data
+        )
+
+    def health_check(self) -> None:
+        """Blocking: raise if the backend can no longer render."""
+
+    def close(self) -> None:
+        pass
+
+
+class GradioBackend(TryOnBackend):
+    name = "gradio"
+
+    def __init__(self, space: str = "levihsu/OOTDiffusion", hf_token: Optional[str] = None):
+        from gradio_client import Client
+
+        if hf_token:
+            os.environ["HF_TOKEN"] = hf_token
+        self.client = Client(space)
+
+    def render(self, user_img: Path, garment_img: Path, category: str, params: dict,
+               deadline: Optional[Deadline] = None, garment_data: Optional[bytes] = None) -> bytes:
+        from gradio_client import handle_file
+
+        job = self.client.submit(
+            vton_img=handle_file(str(user_img)),
+            garm_img=handle_file(str(garment_img)),
+            category=category,
+            n_samples=params.get("n_samples", 1),
+            n_steps=params.get("n_steps", 30),
+            image_scale=params.get("image_scale", 2.5),
+            seed=params.get("seed", -1),
+            api_name="/process_dc",
+        )
+        if deadline is not None:
+            try:
+                while not job.done():
+                    deadline.sleep(0.1)
+            except (DeadlineExceeded, RequestCancelled):
+                # Frees our slot in the Space's queue, or stops the running job
+                job.cancel()
+                raise
+        result = job.result()
+        if not result:
+            raise RuntimeError("OOTDiffusion returned no image")
+        return Path(result[0]["image"]).read_bytes()
+
+    def health_check(self) -> None:
+        import httpx
+
+        response = httpx.get(
+            urljoin(self.client.src, "config"), headers=self.client.headers, timeout=10
+        )
+        response.raise_for_status()
+
+
+def composite(user_data: bytes, garment_data: bytes, category: str, width: int = 768,
+              height: int = 1024) -> bytes:
+    """
+    Paste the garment over the part of the photo it would cover.
+    Photos that cannot be decoded are replaced by a blank width x height canvas.
+    """
+    try:
+        person = Image.open(io.BytesIO(user_data)).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        person = Image.new("RGB", (width, height), (255, 255, 255))
+    garment = Image.open(io.BytesIO(garment_data)).convert("RGB")
+
+    w, h = person.size
+    left, top, right, bottom = GARMENT_REGIONS.get(category, GARMENT_REGIONS["Upper-body"])
+    box = (round(left * w), round(top * h), round(right * w), round(bottom * h))
+    garment.thumbnail((box[2] - box[0], box[3] - box[1]), Image.Resampling.BILINEAR)
+    x = box[0] + (box[2] - box[0] - garment.width) // 2
+    y = box[1] + (box[3] - box[1] - garment.height) // 2
+    person.paste(garment, (x, y))
+
+    out = io.BytesIO()
+    person.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+class StubBackend(TryOnBackend):
+    """
+    Takes `latency` seconds per 30-step render, proportionally less or more
+    for other step counts, so quality tiers behave like they do on the model.
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def render(self, user_img: Path, garment_img: Path, category: str, params: dict,
+               deadline: Optional[Deadline] = None, garment_data: Optional[bytes] = None) -> bytes:
+        with self._lock:
+            self.calls += 1
+        latency = self.latency * params.get("n_steps", 30) / 30
+        if deadline is not None:
+            deadline.sleep(latency)
+        elif latency:
+            time.sleep(latency)
+        if garment_data is None:
+            garment_data = Path(garment_img).read_bytes()
+        return composite(Path(user_img).read_bytes(), garment_data, category)
+
+
+class SubprocessBackend(TryOnBackend):
+    """
+    Sends renders to a model server child process, one at a time.
+    The process is started on first use and restarted if it dies. The line
+    protocol has no way to abort a render, so a render that runs out of time
+    or is cancelled kills the process; the next render starts a fresh one.
+    POSIX only (select() on pipes).
+    """
+    name = "subprocess"
+
+    def __init__(self, command: list[str]):
+        if sys.platform == "win32":
+            raise RuntimeError("TRYON_BACKEND=subprocess needs select() on pipes, which Windows doesn't support")
+        self.command = command
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def render(self, user_img: Path, garment_img: Path, category: str, params: dict,
+               deadline: Optional[Deadline] = None, garment_data: Optional[bytes] = None) -> bytes:
+        request = json.dumps({
+            "user_img": str(Path(user_img).resolve()),
+            "garment_img": str(Path(garment_img).resolve()),
+            "category": category,
+            "params": params,
+        })
+        with self._lock:
+            proc = self._ensure_started()
+            try:
+                proc.stdin.write(request + "\n")
+                proc.stdin.flush()
+                if deadline is not None:
+                    self._wait_for_reply(proc, deadline)
+                line = proc.stdout.readline()
+            except (BrokenPipeError, OSError) as e:
+                raise RuntimeError(f"Model server unavailable: {e}") from e
+        if not line:
+            raise RuntimeError(f"Model server exited with code {proc.poll()}")
+
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"Model server failed: {reply['error']}")
+        return base64.b64decode(reply["image"])
+
+    def health_check(self) -> None:
+        if self._proc is not None and self._proc.poll() is not None:
+            raise RuntimeError(f"Model server exited with code {self._proc.returncode}")
+
+    def close(self) -> None:
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is not None and proc.poll() is None:
+            proc.stdin.close()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    def _wait_for_reply(self, proc: subprocess.Popen, deadline: Deadline) -> None:
+        """Caller holds the lock."""
+        try:
+            while not select.select([proc.stdout], [], [], min(0.1, deadline.remaining()))[0]:
+                deadline.check()
+        except (DeadlineExceeded, RequestCancelled):
+            proc.kill()
+            proc.wait()
+            self._proc = None
+            raise
+
+    def _ensure_started(self) -> subprocess.Popen:
+        """Caller holds the lock."""
+        if self._proc is None or self._proc.poll() is not None:
+            print(f"Starting model server: {shlex.join(self.command)}")
+            self._proc = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                cwd=BACKEND_DIR,
+            )
+        return self._proc
+
+
+def create_backend() -> TryOnBackend:
+    """The backend selected by TRYON_BACKEND. May raise if it cannot be reached."""
+    if config.TRYON_BACKEND == "gradio":
+        return GradioBackend(hf_token=os.getenv("HUGGINGFACE_TOKEN"))
+    if config.TRYON_BACKEND == "stub":
+        return StubBackend(latency=config.TRYON_STUB_LATENCY)
+    if config.TRYON_BACKEND == "subprocess":
+        command = shlex.split(config.TRYON_SUBPROCESS_COMMAND) or [
+            sys.executable, "-m", "app.try_on.model_server",
+            "--latency", str(config.TRYON_STUB_LATENCY),
+        ]
+        return SubprocessBackend(command)
+    raise ValueError(f"Unknown TRYON_BACKEND: {config.TRYON_BACKEND}")
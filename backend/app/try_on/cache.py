@@ -0,0 +1,169 @@
+"""
+Content-addressed on-disk cache of rendered try-on images.
+
+A render is identified by the hash of everything that goes into it: the
+shopper's photo, the garment image, the garment category and the sampler
+parameters. Entries expire after a TTL and the least recently used ones are
+evicted once the cache grows past its size budget. Worker processes can
+share the directory: entries written by another worker are picked up on
+lookup.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from .. import config
+
+
+def render_key(user_image_hash: str, garment_hash: str, category: str, params: dict) -> str:
+    """Cache key for one render. `params` must be JSON serializable."""
+    payload = json.dumps(
+        [user_image_hash, garment_hash, category, params],
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a file on disk, recomputed only when the file changes."""
+    stat = os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=256)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class RenderCache:
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (size, created_at), least recently used first
+        self._entries: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._adopt(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                data = self._path(key).read_bytes()
+            except OSError:
+                # Removed behind our back
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            self._load()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+            self._forget(key)
+            self._entries[key] = (len(data), time.time())
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._evict(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._load()
+            for key in list(self._entries):
+                self._evict(key)
+            self.hits = self.misses = self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.img"
+
+    def _load(self) -> None:
+        """Index entries left on disk by a previous run, oldest first."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.directory.exists():
+            return
+        found = []
+        for path in self.directory.glob("*/*.img"):
+            stat = path.stat()
+            found.append((stat.st_mtime, path.stem, stat.st_size))
+        for created_at, key, size in sorted(found):
+            self._entries[key] = (size, created_at)
+            self._size += size
+
+    def _adopt(self, key: str) -> Optional[tuple[int, float]]:
+        """
+        Index an entry another worker process wrote since we loaded.
+        Caller holds the lock.
+        """
+        try:
+            stat = self._path(key).stat()
+        except FileNotFoundError:
+            return None
+        entry = self._entries[key] = (stat.st_size, stat.st_mtime)
+        self._size += stat.st_size
+        return entry
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[0]
+
+    def _evict(self, key: str) -> None:
+        self._forget(key)
+        self.evictions += 1
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+render_cache = RenderCache(
+    directory=config.TRYON_CACHE_DIR,
+    max_bytes=config.TRYON_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=config.TRYON_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,84 @@
+"""
+Deadlines and cancellation for try-on renders.
+
+Every render gets a Deadline when it is submitted: TRYON_DEADLINE_SECONDS by
+default, or the budget the client sent in X-Request-Deadline. It covers the
+wait in the job queue and the render itself, is passed down to the model
+backend, and doubles as the render's cancellation token: cancelling the job
+(DELETE /try-on/jobs/{id}, or a batch client disconnecting) cancels the
+upstream render instead of spending model time on a result nobody reads.
+A render that runs out of time degrades to the fallback image.
+"""
+import threading
+import time
+from typing import Callable
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a render runs out of time."""
+
+
+class RequestCancelled(Exception):
+    """Raised when the client gave up on a render."""
+
+
+class Deadline:
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.budget = seconds
+        self.clock = clock
+        self.expires_at = clock() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.clock() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        """Raise if the render should stop now."""
+        if self._cancelled.is_set():
+            raise RequestCancelled("Cancelled by the client")
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.budget:.0f}s exceeded")
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep, waking up early to raise when cancelled or out of time."""
+        self._cancelled.wait(min(seconds, self.remaining()))
+        self.check()
+
+
+class Counters:
+    """Named event counters, for /try-on/stats."""
+
+    def __init__(self, *names: str):
+        self._counts = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+deadline_counters = Counters(
+    # Submissions that set their own budget with X-Request-Deadline
+    "client_deadlines",
+    # Out of time before a backend started rendering
+    "expired_in_queue",
+    # Render cut off by the deadline, upstream job cancelled
+    "expired_in_render",
+    # Client cancelled; renders in flight were cancelled upstream
+    "cancelled",
+)
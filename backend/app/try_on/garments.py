@@ -0,0 +1,207 @@
+"""
+Garment images for try-on.
+
+Which products can be tried on, in which OOTDiffusion category and with which
+garment image comes from the catalog (Product.garment_category and
+Product.try_on_image). The registry loads that into memory at startup and
+reloads it when the catalog version changes, so a request never queries the
+database for it.
+
+Colour variants are found by naming convention next to the base image:
+/assets/clothing-1.jpg has clothing-1-navy.png for "Navy". Every image is
+resized to the model's resolution once and written to a prepared-assets
+directory keyed by source hash; the prepared bytes are kept in a size-bounded
+LRU. Startup prepares all of them, anything added later is prepared on first
+use.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from .. import catalog, config, models
+from ..database import SessionLocal
+from .cache import file_hash
+from .preprocess import preprocess_image
+
+# Product.try_on_image paths are relative to the frontend's public directory
+PUBLIC_DIR = Path(__file__).parent.parent.parent.parent / "frontend" / "public"
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def color_slug(color: str) -> str:
+    """'Heather Grey' -> 'heather-grey', the spelling used in asset names."""
+    return re.sub(r"[^a-z0-9]+", "-", color.lower()).strip("-")
+
+
+@dataclass(frozen=True)
+class GarmentInfo:
+    category: str
+    # Source images by colour slug, None for the default one
+    sources: dict
+
+
+@dataclass(frozen=True)
+class GarmentAsset:
+    product_id: int
+    category: str
+    # Colour slug, None for the product's default image
+    color: Optional[str]
+    # Prepared, model-resolution JPEG
+    path: Path
+    sha256: str
+    size: int
+
+
+class GarmentRegistry:
+    def __init__(self, public_dir: Path, prepared_dir: str, width: int, height: int,
+                 cache_bytes: int, session_factory: Callable = SessionLocal):
+        self.public_dir = Path(public_dir)
+        self.prepared_dir = Path(prepared_dir)
+        self.width = width
+        self.height = height
+        self.cache_bytes = cache_bytes
+        self.session_factory = session_factory
+        self._garments: dict[int, GarmentInfo] = {}
+        self._catalog_version: Optional[int] = None
+        # Source image path -> (prepared path, sha256, size)
+        self._prepared: dict[Path, tuple[Path, str, int]] = {}
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._data_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self) -> None:
+        """(Re)load try-on metadata from the catalog."""
+        version = catalog.version()
+        with self.session_factory() as db:
+            rows = db.query(
+                models.Product.id, models.Product.garment_category, models.Product.try_on_image
+            ).filter(
+                models.Product.garment_category.isnot(None),
+                models.Product.try_on_image.isnot(None),
+            ).all()
+
+        listings: dict[Path, list[Path]] = {}
+        garments = {}
+        for product_id, category, image in rows:
+            source = self.public_dir / image.lstrip("/")
+            if source.parent not in listings:
+                listings[source.parent] = sorted(source.parent.iterdir()) if source.parent.is_dir() else []
+            sources = {None: source}
+            prefix = f"{source.stem}-"
+            for candidate in listings[source.parent]:
+                if candidate.name.startswith(prefix) and candidate.suffix.lower() in IMAGE_SUFFIXES:
+                    sources[candidate.stem[len(prefix):]] = candidate
+            garments[product_id] = GarmentInfo(category=category, sources=sources)
+
+        with self._lock:
+            self._garments = garments
+            self._catalog_version = version
+            self.reloads += 1
+
+    def warm(self) -> None:
+        """Load the catalog and prepare every garment image up front."""
+        self._ensure_fresh()
+        for info in list(self._garments.values()):
+            for source in info.sources.values():
+                if source not in self._prepared and source.exists():
+                    self._prepare(source)
+        print(f"✓ Prepared {len(self._prepared)} garment images")
+
+    def get(self, product_id: int, color: Optional[str] = None) -> Optional[GarmentAsset]:
+        """
+        The asset for a product in a colour, falling back to its default image.
+        None if the product can't be tried on.
+        """
+        self._ensure_fresh()
+        info = self._garments.get(product_id)
+        if info is None:
+            return None
+        slug = color_slug(color) if color else None
+        if slug not in info.sources:
+            slug = None
+        source = info.sources[slug]
+        prepared = self._prepared.get(source)
+        if prepared is None:
+            if not source.exists():
+                return None
+            prepared = self._prepare(source)
+        path, sha256, size = prepared
+        return GarmentAsset(product_id, info.category, slug, path, sha256, size)
+
+    def read(self, asset: GarmentAsset) -> bytes:
+        """The prepared image bytes, from memory when possible."""
+        with self._lock:
+            data = self._data.get(asset.sha256)
+            if data is not None:
+                self._data.move_to_end(asset.sha256)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = asset.path.read_bytes()
+        with self._lock:
+            self._remember(asset.sha256, data)
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "products": len(self._garments),
+                "prepared": len(self._prepared),
+                "cached": len(self._data),
+                "cached_bytes": self._data_size,
+                "max_bytes": self.cache_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+            }
+
+    def _ensure_fresh(self) -> None:
+        if self._catalog_version == catalog.version():
+            return
+        with self._load_lock:
+            if self._catalog_version != catalog.version():
+                self.load()
+
+    def _prepare(self, source: Path) -> tuple[Path, str, int]:
+        prepared = self.prepared_dir / f"{file_hash(str(source))[:24]}-{self.width}x{self.height}.jpg"
+        if prepared.exists():
+            data = prepared.read_bytes()
+        else:
+            data = preprocess_image(source.read_bytes(), self.width, self.height, fit="pad")
+            self.prepared_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = prepared.with_name(f"{prepared.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(prepared)
+
+        entry = (prepared, hashlib.sha256(data).hexdigest(), len(data))
+        with self._lock:
+            self._prepared[source] = entry
+            self._remember(entry[1], data)
+        return entry
+
+    def _remember(self, key: str, data: bytes) -> None:
+        """Add bytes to the LRU, evicting as needed. Caller holds the lock."""
+        if key in self._data or len(data) > self.cache_bytes:
+            return
+        self._data[key] = data
+        self._data_size += len(data)
+        while self._data_size > self.cache_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._data_size -= len(evicted)
+
+
+garment_registry = GarmentRegistry(
+    public_dir=PUBLIC_DIR,
+    prepared_dir=config.TRYON_GARMENT_DIR,
+    width=config.TRYON_MODEL_WIDTH,
+    height=config.TRYON_MODEL_HEIGHT,
+    cache_bytes=config.TRYON_GARMENT_CACHE_MB * 1024 * 1024,
+)
@@ -0,0 +1,231 @@
+"""
+Background job queue for virtual try-on renders.
+
+A render calls out to a diffusion model and can take tens of seconds, so it
+runs on a bounded pool of worker threads instead of the event loop. Clients
+submit a job, get its id back immediately and poll or stream its status.
+A job body can publish an intermediate result (e.g. a quick preview render)
+with publish_partial() before it finishes.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from .. import config
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+# The (queue, job) a worker thread is running, for publish_partial()
+_current = threading.local()
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs."""
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = QUEUED
+    result: Any = None
+    # Latest intermediate result, while the final one is being worked on
+    partial: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # Asks the job body to stop early; see JobQueue.cancel()
+    on_cancel: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "partial": self.partial,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int, queue_size: int, ttl_seconds: int):
+        self.workers = workers
+        # Running jobs plus the ones waiting for a worker
+        self.max_pending = workers + queue_size
+        self.ttl_seconds = ttl_seconds
+        self._jobs: dict[str, Job] = {}
+        self._subscribers: dict[str, list] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, fn: Callable, *args, on_cancel: Optional[Callable[[], None]] = None,
+               **kwargs) -> Job:
+        """
+        Queue fn(*args, **kwargs) to run on a worker thread.
+        Raises QueueFullError instead of queueing without bound.
+        on_cancel is called by cancel(); fn is expected to notice and stop.
+        """
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} try-on jobs already pending")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="try-on"
+                )
+            job = Job(id=uuid.uuid4().hex, on_cancel=on_cancel)
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        future = self._executor.submit(self._run, job, fn, args, kwargs)
+        future.add_done_callback(lambda f: self._cancelled(job) if f.cancelled() else None)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Ask a job to stop. Queued jobs still go through a worker, so the body
+        can release what it holds, but stop right away. None if unknown.
+        """
+        job = self.get(job_id)
+        if job is not None and not job.done and job.on_cancel is not None:
+            job.on_cancel()
+        return job
+
+    def update(self, job: Job, **changes) -> None:
+        """Apply changes to a job and notify everyone watching it."""
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            if job.done and job.finished_at is None:
+                job.finished_at = time.time()
+            snapshot = job.to_dict()
+            subscribers = list(self._subscribers.get(job.id, ()))
+
+        for loop, updates in subscribers:
+            try:
+                loop.call_soon_threadsafe(updates.put_nowait, snapshot)
+            except RuntimeError:
+                # The watcher's event loop has already shut down
+                pass
+
+    async def watch(self, job_id: str):
+        """
+        Async generator yielding job snapshots: the current state first,
+        then every change until the job finishes.
+        """
+        updates: asyncio.Queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), updates)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            snapshot = job.to_dict()
+            self._subscribers.setdefault(job_id, []).append(subscriber)
+
+        try:
+            yield snapshot
+            while snapshot["status"] not in FINISHED_STATES:
+                snapshot = await updates.get()
+                yield snapshot
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(job_id, None)
+
+    async def wait(self, job_id: str) -> Optional[dict]:
+        """Final snapshot of a job, once it has finished."""
+        snapshot = None
+        async for snapshot in self.watch(job_id):
+            pass
+        return snapshot
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "jobs": len(self._jobs),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict) -> None:
+        self.update(job, status=RUNNING)
+        _current.job = (self, job)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            changes = {"status": FAILED, "error": str(e)}
+        else:
+            changes = {"status": SUCCEEDED, "result": result}
+        finally:
+            _current.job = None
+
+        # Free the slot before announcing completion, so a client reacting to
+        # the final status can immediately submit again.
+        with self._lock:
+            self._pending -= 1
+        self.update(job, **changes)
+
+    def _cancelled(self, job: Job) -> None:
+        """A queued job dropped by shutdown() before a worker picked it up."""
+        with self._lock:
+            self._pending -= 1
+        self.update(job, status=FAILED, error="Cancelled")
+
+    def _prune(self) -> None:
+        """Forget finished jobs older than the TTL. Caller holds the lock."""
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def publish_partial(result: Any) -> None:
+    """
+    From inside a job body: make an intermediate result visible to pollers
+    and watchers. Does nothing when not called from a job.
+    """
+    current = getattr(_current, "job", None)
+    if current is not None:
+        queue, job = current
+        queue.update(job, partial=result)
+
+
+job_queue = JobQueue(
+    workers=config.TRYON_WORKERS,
+    queue_size=config.TRYON_QUEUE_SIZE,
+    ttl_seconds=config.TRYON_JOB_TTL_SECONDS,
+)
+
+
+def get_job_queue() -> JobQueue:
+    return job_queue
@@ -0,0 +1,51 @@
+"""
+Model server for SubprocessBackend.
+
+Reads one JSON request per line on stdin:
+
+    {"user_img": "/abs/photo.jpg", "garment_img": "/abs/garment.jpg",
+     "category": "Upper-body", "params": {...}}
+
+and answers each with one JSON line on stdout, either {"image": "<base64>"}
+or {"error": "..."}. This one hosts the stub engine; a self-hosted model only
+needs to speak the same protocol. Logs go to stderr, stdout is the protocol.
+
+    python -m app.try_on.model_server [--latency 0.5]
+"""
+import argparse
+import base64
+import json
+import sys
+from typing import TextIO
+
+from .backends import StubBackend, TryOnBackend
+
+
+def serve(backend: TryOnBackend, stdin: TextIO, stdout: TextIO) -> None:
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            image = backend.render(
+                request["user_img"], request["garment_img"], request["category"],
+                request.get("params", {}),
+            )
+            reply = {"image": base64.b64encode(image).decode("ascii")}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub try-on model server")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per render")
+    args = parser.parse_args()
+
+    print(f"Model server ready (stub, latency {args.latency}s)", file=sys.stderr)
+    serve(StubBackend(latency=args.latency), sys.stdin, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Warm, health-checked model backends.
+
+BackendPool connects TRYON_BACKEND_POOL_SIZE backends when the app starts, so
+the first shopper after a deploy doesn't pay for the connection handshake. A
+background task health-checks idle backends, drops broken ones and reconnects
+with exponential backoff; a failed connect is retried, never given up on.
+
+Renders go through a circuit breaker. After TRYON_BREAKER_THRESHOLD failures
+in a row it opens and renders fail fast (the caller serves the fallback image)
+instead of each one waiting on a dead backend. After TRYON_BREAKER_RESET_SECONDS
+a single trial render is let through; its outcome closes or reopens it.
+"""
+import asyncio
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from .. import config
+from .backends import TryOnBackend, create_backend
+from .deadlines import Deadline, DeadlineExceeded, RequestCancelled
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BackendUnavailableError(Exception):
+    """Raised when no backend can take a render right now."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. Every allowed call must be recorded."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        """True while calls are being refused. Unlike allow(), doesn't start a trial."""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self._opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._trial_running
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self) -> None:
+        """Settle an allowed call whose outcome says nothing about the backend."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self._opened_at = self.clock()
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "retry_in": retry_in,
+            }
+
+
+class BackendPool:
+    def __init__(self, factory: Callable[[], TryOnBackend], size: int, breaker: CircuitBreaker,
+                 acquire_timeout: float, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.factory = factory
+        self.size = size
+        self.breaker = breaker
+        self.acquire_timeout = acquire_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self._idle: "queue.Queue[TryOnBackend]" = queue.Queue()
+        self._connected = 0
+        self._connect_failures = 0
+        self._next_connect = 0.0
+        self.renders = 0
+        self.render_failures = 0
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+
+    def connect(self) -> None:
+        """Blocking: bring the pool up to size, unless backing off after a failure."""
+        with self._connect_lock:
+            while self._connected < self.size and self.clock() >= self._next_connect:
+                try:
+                    backend = self.factory()
+                except Exception as e:
+                    with self._lock:
+                        self._connect_failures += 1
+                        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._connect_failures - 1))
+                        self._next_connect = self.clock() + delay
+                    print(f"✗ Try-on backend connect failed ({e}), retrying in {delay:.0f}s")
+                    return
+                with self._lock:
+                    self._connected += 1
+                    self._connect_failures = 0
+                self._idle.put(backend)
+                print(f"✓ Try-on backend {backend.name} connected ({self._connected}/{self.size})")
+
+    def check(self) -> None:
+        """Blocking: health-check idle backends, drop broken ones and reconnect."""
+        for _ in range(self._idle.qsize()):
+            try:
+                backend = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                backend.health_check()
+            except Exception as e:
+                print(f"✗ Try-on backend {backend.name} failed its health check: {e}")
+                self._drop(backend)
+            else:
+                self._idle.put(backend)
+        self.connect()
+
+    def render(self, user_img: Path, garment_img: Path, category: str, params: dict,
+               deadline: Optional[Deadline] = None, garment_data: Optional[bytes] = None) -> bytes:
+        """
+        Blocking: render on an idle backend. Raises BackendUnavailableError
+        right away while the breaker is open or nothing is connected.
+        A render timing out counts as a backend failure, a cancelled one doesn't.
+        """
+        if not self.breaker.allow():
+            raise BackendUnavailableError("Circuit breaker is open")
+        backend = self._acquire(deadline)
+        try:
+            result = backend.render(user_img, garment_img, category, params, deadline, garment_data)
+        except RequestCancelled:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            with self._lock:
+                self.render_failures += 1
+            raise
+        finally:
+            self._idle.put(backend)
+        self.breaker.record_success()
+        with self._lock:
+            self.renders += 1
+        return result
+
+    def available(self) -> bool:
+        """Whether a render would be attempted right now."""
+        return not self.breaker.is_open()
+
+    def next_check_in(self, interval: float) -> float:
+        """Seconds until the health checker should run again."""
+        with self._lock:
+            if self._connected < self.size:
+                return min(interval, max(0.5, self._next_connect - self.clock()))
+        return interval
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "connected": self._connected,
+                "idle": self._idle.qsize(),
+                "connect_failures": self._connect_failures,
+                "renders": self.renders,
+                "render_failures": self.render_failures,
+                "reconnect_in": max(0.0, self._next_connect - self.clock()) if self._connect_failures else None,
+                "breaker": self.breaker.stats(),
+            }
+
+    def close(self) -> None:
+        """Close the idle backends. Later renders reconnect."""
+        while True:
+            try:
+                backend = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._drop(backend)
+
+    def _acquire(self, deadline: Optional[Deadline] = None) -> TryOnBackend:
+        with self._lock:
+            connected = self._connected
+        if connected == 0:
+            # Used before startup connected it, or everything was dropped
+            self.connect()
+            with self._lock:
+                connected = self._connected
+        try:
+            if connected == 0:
+                return self._idle.get_nowait()
+            timeout = self.acquire_timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            if deadline is not None and deadline.expired:
+                self.breaker.release()
+                raise DeadlineExceeded("No try-on backend freed up before the deadline") from None
+            # Not the backend's fault, but a half-open trial must be settled
+            self.breaker.record_failure()
+            raise BackendUnavailableError("No try-on backend available") from None
+
+    def _drop(self, backend: TryOnBackend) -> None:
+        with self._lock:
+            self._connected -= 1
+        try:
+            backend.close()
+        except Exception as e:
+            print(f"Error closing try-on backend: {e}")
+
+
+async def run_health_checks(pool: BackendPool, interval: float) -> None:
+    """Health-check and reconnect the pool until cancelled."""
+    while True:
+        await asyncio.sleep(pool.next_check_in(interval))
+        await asyncio.to_thread(pool.check)
+
+
+backend_pool = BackendPool(
+    factory=create_backend,
+    size=config.TRYON_BACKEND_POOL_SIZE,
+    breaker=CircuitBreaker(config.TRYON_BREAKER_THRESHOLD, config.TRYON_BREAKER_RESET_SECONDS),
+    acquire_timeout=config.TRYON_BACKEND_ACQUIRE_TIMEOUT,
+    backoff_max=config.TRYON_BACKEND_BACKOFF_MAX,
+)
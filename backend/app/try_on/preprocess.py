@@ -0,0 +1,124 @@
+"""
+Image preprocessing in front of the try-on model.
+
+OOTDiffusion works on a fixed 768x1024 canvas, so sending a 12 MP phone photo
+only costs upload bandwidth and model-side resize time. Photos are decoded,
+rotated upright according to their EXIF orientation, padded or cropped to
+the model's aspect ratio, downscaled and re-encoded as JPEG.
+
+The work is CPU bound, so it runs in a process pool rather than on the
+job queue's threads.
+"""
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .. import config
+
+
+class InvalidImageError(Exception):
+    """Raised when the upload cannot be decoded as an image."""
+
+
+def preprocess_image(data: bytes, width: int, height: int, fit: str = "pad",
+                     quality: int = 90) -> bytes:
+    """
+    Return `data` as a JPEG of at most width x height with that aspect ratio.
+    `fit` is "pad" (letterbox on white) or "crop" (center crop).
+    Images smaller than the target are not upscaled.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder downscale by a power of two while decoding.
+        # The EXIF rotation may swap the sides, so ask for the long side both ways.
+        longest = max(width, height)
+        img.draft("RGB", (longest, longest))
+        img = ImageOps.exif_transpose(img)
+        # Pixel data is only decoded here: truncated or corrupt files fail now
+        img = img.convert("RGB")
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    img = _fit_aspect(img, width / height, fit)
+    img.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def _fit_aspect(img: Image.Image, aspect: float, fit: str) -> Image.Image:
+    w, h = img.size
+    if abs(w / h - aspect) < 0.01:
+        return img
+
+    if fit == "crop":
+        if w / h > aspect:
+            new_w = round(h * aspect)
+            left = (w - new_w) // 2
+            return img.crop((left, 0, left + new_w, h))
+        new_h = round(w / aspect)
+        top = (h - new_h) // 2
+        return img.crop((0, top, w, top + new_h))
+
+    if w / h > aspect:
+        size = (w, round(w / aspect))
+    else:
+        size = (round(h * aspect), h)
+    canvas = Image.new("RGB", size, (255, 255, 255))
+    canvas.paste(img, ((size[0] - w) // 2, (size[1] - h) // 2))
+    return canvas
+
+
+class Preprocessor:
+    def __init__(self, workers: int, width: int, height: int, fit: str, quality: int):
+        self.workers = workers
+        self.width = width
+        self.height = height
+        self.fit = fit
+        self.quality = quality
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def params(self) -> dict:
+        """Settings that change the output, for cache keys."""
+        return {"width": self.width, "height": self.height, "fit": self.fit, "quality": self.quality}
+
+    def run(self, data: bytes, width: Optional[int] = None, height: Optional[int] = None) -> bytes:
+        """
+        Blocking: preprocess `data` on the process pool (inline with 0 workers),
+        to the model resolution unless another size is given.
+        """
+        width, height = width or self.width, height or self.height
+        if self.workers == 0:
+            return preprocess_image(data, width, height, self.fit, self.quality)
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that runs worker threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            pool = self._pool
+        future = pool.submit(preprocess_image, data, width, height, self.fit, self.quality)
+        return future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+preprocessor = Preprocessor(
+    workers=config.TRYON_PREPROCESS_WORKERS,
+    width=config.TRYON_MODEL_WIDTH,
+    height=config.TRYON_MODEL_HEIGHT,
+    fit=config.TRYON_PREPROCESS_FIT,
+    quality=config.TRYON_JPEG_QUALITY,
+)
@@ -0,0 +1,138 @@
+"""
+Storage for rendered try-on images.
+
+Results are content addressed: the id is the sha256 of the image, the quality
+tier it was rendered at and its extension (`<sha256>-preview.jpg`), so a
+stored result never changes and can be cached forever by browsers and CDNs.
+
+Only LocalResultStore exists for now; other backends (object storage behind
+a CDN, ...) implement the same methods. Results are kept as long as rendered
+images are cached (TRYON_CACHE_TTL_SECONDS) after they were last stored, and
+run_result_sweeper() deletes older ones.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from .. import config
+
+# Results stored before quality tiers existed have no tier in their id
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}(-(?P<tier>[a-z0-9_]+))?\.(jpg|png|webp)$")
+
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+
+def sniff_extension(data: bytes) -> str:
+    """File extension for an encoded image, from its magic bytes."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "jpg"
+
+
+def media_type(result_id: str) -> str:
+    return MEDIA_TYPES[result_id.rsplit(".", 1)[1]]
+
+
+def result_tier(result_id: str) -> Optional[str]:
+    """Quality tier a result was rendered at, None if unknown."""
+    match = RESULT_ID_PATTERN.match(result_id)
+    return match["tier"] if match else None
+
+
+class ResultStore(ABC):
+    @abstractmethod
+    def save(self, data: bytes, tier: Optional[str] = None) -> str:
+        """Store an encoded image rendered at `tier` and return its result id."""
+
+    @abstractmethod
+    def locate(self, result_id: str) -> Optional[Path]:
+        """Local file holding the result, or None if it is not stored here."""
+
+    @abstractmethod
+    def url_for(self, result_id: str) -> str:
+        """URL clients should fetch the result from."""
+
+    def sweep(self) -> int:
+        """Delete expired results and return how many. Stores that expire them on their own do nothing."""
+        return 0
+
+
+class LocalResultStore(ResultStore):
+    def __init__(self, directory: str, ttl_seconds: int, base_url: str = "/try-on/results"):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.base_url = base_url.rstrip("/")
+        self._lock = threading.Lock()
+
+    def save(self, data: bytes, tier: Optional[str] = None) -> str:
+        tag = f"-{tier}" if tier else ""
+        result_id = f"{hashlib.sha256(data).hexdigest()}{tag}.{sniff_extension(data)}"
+        path = self._path(result_id)
+        with self._lock:
+            if path.exists():
+                # Stored again: the TTL starts over
+                os.utime(path)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+        return result_id
+
+    def locate(self, result_id: str) -> Optional[Path]:
+        if not RESULT_ID_PATTERN.match(result_id):
+            return None
+        path = self._path(result_id)
+        return path if path.is_file() else None
+
+    def url_for(self, result_id: str) -> str:
+        return f"{self.base_url}/{result_id}"
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Delete results, and temp files left by a crash, last stored more than ttl_seconds ago."""
+        cutoff = (time.time() if now is None else now) - self.ttl_seconds
+        removed = 0
+        if not self.directory.exists():
+            return 0
+        for path in self.directory.glob("*/*"):
+            with self._lock:
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _path(self, result_id: str) -> Path:
+        return self.directory / result_id[:2] / result_id
+
+
+def create_result_store() -> ResultStore:
+    if config.TRYON_RESULT_STORE == "local":
+        return LocalResultStore(config.TRYON_RESULT_DIR, config.TRYON_CACHE_TTL_SECONDS)
+    raise ValueError(f"Unknown TRYON_RESULT_STORE: {config.TRYON_RESULT_STORE}")
+
+
+async def run_result_sweeper(store: ResultStore, interval_seconds: int) -> None:
+    """Delete expired results every interval_seconds, until cancelled."""
+    while True:
+        removed = await asyncio.to_thread(store.sweep)
+        if removed:
+            print(f"Removed {removed} expired try-on result(s)")
+        await asyncio.sleep(interval_seconds)
+
+
+result_store = create_result_store()
@@ -0,0 +1,220 @@
+"""
+Single-flight coalescing of identical try-on renders.
+
+Double-clicks and retries produce bursts of identical requests. Each render
+key (the same key as the render cache: photo hash, garment, category and
+sampler settings) is rendered at most once at a time; identical requests
+arriving meanwhile attach to the render in flight and share its result.
+
+Within a process, followers wait on the leader's flight. Across uvicorn
+workers, leaders take an exclusive file lock per key in TRYON_FLIGHT_DIR
+and leave the result id next to it for TRYON_FLIGHT_RESULT_TTL seconds, so
+a leader in another worker that waited on the lock picks the result up
+instead of rendering again. File locking needs fcntl; elsewhere only
+in-process coalescing is done.
+
+run_sweeper() deletes lock and result files unused for
+TRYON_FLIGHT_MAX_AGE_SECONDS. A lock file is only deleted while the sweeper
+holds its lock, so a render in progress keeps its lock however long it takes.
+"""
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .. import config
+from .deadlines import Deadline, DeadlineExceeded, RequestCancelled
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, directory: str, result_ttl: float):
+        self.directory = Path(directory)
+        self.result_ttl = result_ttl
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_across_workers = 0
+        self.retries = 0
+        self._flights: dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], str], deadline: Optional[Deadline] = None) -> str:
+        """
+        fn() once for all concurrent callers with the same key; returns its
+        result (a result id) or raises its error to every caller. If the
+        leader is cancelled or runs out of time, a waiting caller with time
+        left takes over.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Flight()
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                return self._lead(key, flight, fn, deadline)
+
+            self._wait(flight.done, deadline)
+            if isinstance(flight.error, (RequestCancelled, DeadlineExceeded)):
+                with self._lock:
+                    self.retries += 1
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_across_workers": self.coalesced_across_workers,
+                "retries": self.retries,
+            }
+
+    def sweep(self, max_age_seconds: float) -> int:
+        """Delete lock and result files unused for max_age_seconds. Returns how many."""
+        if not self.directory.exists():
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for path in self.directory.iterdir():
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                if path.suffix == ".lock" and fcntl is not None:
+                    removed += self._remove_unheld_lock(path, cutoff)
+                else:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @staticmethod
+    def _remove_unheld_lock(path: Path, cutoff: float) -> int:
+        """Delete a lock file unless a leader holds it. Returns 1 if deleted."""
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                # Used while we were getting to it
+                if os.fstat(lock_file.fileno()).st_mtime >= cutoff:
+                    return 0
+                path.unlink()
+                return 1
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lead(self, key: str, flight: Flight, fn: Callable[[], str],
+              deadline: Optional[Deadline]) -> str:
+        try:
+            flight.result = self._across_workers(key, fn, deadline)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _across_workers(self, key: str, fn: Callable[[], str], deadline: Optional[Deadline]) -> str:
+        if fcntl is None:
+            return fn()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_path = self.directory / f"{key}.lock"
+        result_path = self.directory / f"{key}.result"
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                self._flock(lock_file, deadline)
+            except BaseException:
+                lock_file.close()
+                raise
+            # The sweeper may have deleted the file before we locked it; a
+            # lock on a deleted file excludes nobody, so lock the new one
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        with lock_file:
+            try:
+                # Another worker may have rendered it while we waited for the lock
+                result = self._recent_result(result_path)
+                if result is not None:
+                    with self._lock:
+                        self.coalesced_across_workers += 1
+                    return result
+                result = fn()
+                tmp_path = result_path.with_name(f"{result_path.name}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(result)
+                tmp_path.replace(result_path)
+                lock_path.touch()
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _flock(self, lock_file, deadline: Optional[Deadline]) -> None:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                self._sleep(0.05, deadline)
+
+    def _recent_result(self, result_path: Path) -> Optional[str]:
+        try:
+            if time.time() - result_path.stat().st_mtime > self.result_ttl:
+                return None
+            return result_path.read_text() or None
+        except FileNotFoundError:
+            return None
+
+    def _wait(self, event: threading.Event, deadline: Optional[Deadline]) -> None:
+        if deadline is None:
+            event.wait()
+            return
+        while not event.wait(min(0.05, deadline.remaining())):
+            deadline.check()
+
+    @staticmethod
+    def _sleep(seconds: float, deadline: Optional[Deadline]) -> None:
+        if deadline is not None:
+            deadline.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+
+async def run_sweeper(flights: SingleFlight, interval_seconds: int, max_age_seconds: int) -> None:
+    """Remove stale lock and result files every interval_seconds, until cancelled."""
+    while True:
+        await asyncio.to_thread(flights.sweep, max_age_seconds)
+        await asyncio.sleep(interval_seconds)
+
+
+render_flights = SingleFlight(config.TRYON_FLIGHT_DIR, config.TRYON_FLIGHT_RESULT_TTL)
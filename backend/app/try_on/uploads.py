@@ -0,0 +1,189 @@
+"""
+Upload handling for the shopper's photo.
+
+The photo is copied out of the request in chunks on a worker thread, hashed
+on the way and size-checked. Small photos stay in memory; bigger ones spill
+to a file in a managed temp directory. SpooledUpload is a context manager
+and removes its files on close; a periodic janitor sweeps files orphaned by
+crashes or jobs cancelled before they ran.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from .. import config
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+upload_dir = Path(config.TRYON_UPLOAD_TMP_DIR)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+class SpooledUpload:
+    def __init__(self, sha256: str, size: int, buffer: Optional[io.BytesIO] = None,
+                 path: Optional[Path] = None, suffix: str = ".jpg"):
+        self.sha256 = sha256
+        self.size = size
+        self.suffix = suffix
+        self._buffer = buffer
+        self._path = path
+        self._derived: dict[str, "SpooledUpload"] = {}
+        self._lock = threading.Lock()
+        self._derive_lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, suffix: str = ".jpg") -> "SpooledUpload":
+        return cls(hashlib.sha256(data).hexdigest(), len(data), buffer=io.BytesIO(data), suffix=suffix)
+
+    @property
+    def in_memory(self) -> bool:
+        return self._buffer is not None
+
+    def read_bytes(self) -> bytes:
+        if self._buffer is not None:
+            return self._buffer.getvalue()
+        return self.as_file().read_bytes()
+
+    def as_file(self) -> Path:
+        """
+        Path to a file with the upload's content, for consumers that need one.
+        In-memory uploads are written out on first use only.
+        """
+        with self._lock:
+            if self._path is None:
+                self._path = _new_temp_path(self.suffix)
+                self._path.write_bytes(self._buffer.getvalue())
+            return self._path
+
+    def derived(self, name: str, make: Callable[[], "SpooledUpload"]) -> "SpooledUpload":
+        """
+        A transformed copy of this upload (e.g. preprocessed for the model),
+        made on first request only and shared by every later caller.
+        Closed together with this upload.
+        """
+        with self._derive_lock:
+            if name not in self._derived:
+                self._derived[name] = make()
+            return self._derived[name]
+
+    def close(self) -> None:
+        with self._derive_lock:
+            derived, self._derived = self._derived, {}
+        for upload in derived.values():
+            upload.close()
+        with self._lock:
+            self._buffer = None
+            if self._path is not None:
+                self._path.unlink(missing_ok=True)
+                self._path = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SharedUpload:
+    """An upload used by several renders, closed once the last one releases it."""
+
+    def __init__(self, upload: SpooledUpload, users: int):
+        self.upload = upload
+        self._users = users
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            last = self._users == 0
+        if last:
+            self.upload.close()
+
+
+def spool(source: BinaryIO, max_bytes: int, memory_limit: int, suffix: str = ".jpg") -> SpooledUpload:
+    """Blocking: copy `source` into a SpooledUpload, hashing as it goes."""
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    out, path, size = buffer, None, 0
+    try:
+        while chunk := source.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            if path is None and size > memory_limit:
+                # Spill what we have so far to disk and continue there
+                path = _new_temp_path(suffix)
+                out = open(path, "wb")
+                out.write(buffer.getvalue())
+                buffer = None
+            out.write(chunk)
+    except BaseException:
+        if path is not None:
+            out.close()
+            path.unlink(missing_ok=True)
+        raise
+
+    if path is not None:
+        out.close()
+        return SpooledUpload(digest.hexdigest(), size, path=path, suffix=suffix)
+    return SpooledUpload(digest.hexdigest(), size, buffer=buffer, suffix=suffix)
+
+
+async def receive_upload(upload: UploadFile) -> SpooledUpload:
+    """Spool a request upload without blocking the event loop."""
+    suffix = Path(upload.filename or "").suffix.lower()
+    if suffix not in IMAGE_SUFFIXES:
+        suffix = ".jpg"
+    return await run_in_threadpool(
+        spool,
+        upload.file,
+        config.TRYON_UPLOAD_MAX_MB * 1024 * 1024,
+        config.TRYON_UPLOAD_MEMORY_KB * 1024,
+        suffix,
+    )
+
+
+def sweep_orphans(max_age_seconds: int) -> int:
+    """Delete temp files older than max_age_seconds. Returns how many were removed."""
+    if not upload_dir.exists():
+        return 0
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for path in upload_dir.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def run_janitor(interval_seconds: int, max_age_seconds: int) -> None:
+    """Sweep orphaned upload files every interval_seconds, until cancelled."""
+    while True:
+        removed = await asyncio.to_thread(sweep_orphans, max_age_seconds)
+        if removed:
+            print(f"Removed {removed} orphaned upload file(s)")
+        await asyncio.sleep(interval_seconds)
+
+
+def _new_temp_path(suffix: str) -> Path:
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix="user_", suffix=suffix, dir=upload_dir)
+    os.close(fd)
+    return Path(name)
@@ -0,0 +1,100 @@
+"""
+Product variants: the sizes and colors a product is actually sold in.
+
+Product.sizes and Product.colors stay the lists shown to shoppers, and every
+size is offered in every color. The product_variants table holds one row per
+combination, indexed, so filtering by size and color and checking a cart
+line are index lookups instead of parsing JSON. It is kept in step from the
+ORM: inserting a product, or changing its sizes or colors, adds the missing
+variants and removes the ones no longer offered, keeping the stock and SKU
+of the others. Rows written without the ORM (bulk inserts, databases from
+before variants) are filled in by backfill_product_variants().
+
+A variant's SKU is its product id and its own id ("12-345"): sizes and colors
+are free text, and two of them can read the same once made SKU-safe
+("Navy Blue", "navy-blue").
+"""
+from itertools import product as combinations
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import String, cast, delete, event, exists, inspect, or_, select, tuple_, update
+from sqlalchemy.engine import Connection
+
+from . import models
+
+Variant = models.ProductVariant
+
+
+def assign_skus(connection: Connection, product_id: Optional[int] = None) -> None:
+    """Give variants without a SKU one, from their ids; only the product's if one is given."""
+    statement = update(Variant).where(Variant.sku.is_(None))
+    if product_id is not None:
+        statement = statement.where(Variant.product_id == product_id)
+    connection.execute(statement.values(sku=cast(Variant.product_id, String) + "-" + cast(Variant.id, String)))
+
+
+def offered(sizes: Optional[Iterable[str]], colors: Optional[Iterable[str]]) -> List[Tuple[str, str]]:
+    """The (size, color) combinations a product with these lists is sold in."""
+    return list(dict.fromkeys(combinations(sizes or [], colors or [])))
+
+
+def available():
+    """Variants that can be bought: stock not tracked, or some left."""
+    return or_(Variant.stock.is_(None), Variant.stock > 0)
+
+
+def sync_variants(connection: Connection, product_id: int, sizes, colors) -> None:
+    """Make the product's variants match its sizes and colors."""
+    wanted = offered(sizes, colors)
+    current = set(connection.execute(
+        select(Variant.size, Variant.color).where(Variant.product_id == product_id)
+    ).all())
+    stale = current - set(wanted)
+    if stale:
+        connection.execute(delete(Variant).where(
+            Variant.product_id == product_id,
+            tuple_(Variant.size, Variant.color).in_(stale),
+        ))
+    missing = [option for option in wanted if option not in current]
+    if missing:
+        connection.execute(Variant.__table__.insert(), [
+            {"product_id": product_id, "size": size, "color": color} for size, color in missing
+        ])
+        assign_skus(connection, product_id)
+
+
+@event.listens_for(models.Product, "after_insert")
+def _variants_on_insert(mapper, connection, target):
+    sync_variants(connection, target.id, target.sizes, target.colors)
+
+
+@event.listens_for(models.Product, "after_update")
+def _variants_on_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.sizes.history.has_changes() or state.attrs.colors.history.has_changes():
+        sync_variants(connection, target.id, target.sizes, target.colors)
+
+
+@event.listens_for(models.Product, "after_delete")
+def _variants_on_delete(mapper, connection, target):
+    # SQLite doesn't enforce the foreign key's ON DELETE CASCADE
+    connection.execute(delete(Variant).where(Variant.product_id == target.id))
+
+
+def backfill_product_variants(engine) -> None:
+    """Create the variants of products that have none, from their JSON sizes and colors."""
+    Product = models.Product
+    with engine.begin() as conn:
+        products = conn.execute(
+            select(Product.id, Product.sizes, Product.colors)
+            .where(~exists().where(Variant.product_id == Product.id))
+        ).all()
+        rows = [
+            {"product_id": product_id, "size": size, "color": color}
+            for product_id, sizes, colors in products
+            for size, color in offered(sizes, colors)
+        ]
+        if rows:
+            conn.execute(Variant.__table__.insert(), rows)
+            assign_skus(conn)
+            print(f"Created {len(rows)} variants for {len(products)} products")
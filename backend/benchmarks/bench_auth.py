@@ -0,0 +1,112 @@
+"""
+Cost of the get_current_user dependency, with and without the auth caches.
+
+Calls the dependency directly, the way every cart, wishlist and /auth/me
+request does, for one signed-up user:
+
+- uncached: as it was, jwt.decode and the user looked up by email
+- uid, uncached: jwt.decode and the user fetched by primary key
+- token cached: claims from the cache, user fetched by primary key
+- warm: both from the caches
+
+and reports the time per call and the SQL statements it ran. Every call also
+checks the token against the revocation list, filled with --revoked other
+tokens. --db-latency adds a wait to every statement, standing in for the
+round trip to a database server (see bench_db).
+
+    cd backend
+    python -m benchmarks.bench_auth [--calls 2000] [--db-latency 2] [--revoked 100000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--db-latency", type=float, default=2.0, help="added per statement, ms")
+    parser.add_argument("--revoked", type=int, default=100000, help="revoked tokens in the list")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-auth-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    from sqlalchemy import event
+
+    import app.main  # noqa: F401  creates the tables
+    from app import auth_cache, models
+    from app.revocation import revoked_tokens
+    from app.auth_utils import create_access_token, get_password_hash
+    from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+    from app.routers.auth import get_current_user
+    from benchmarks.bench_db import add_latency
+    from benchmarks.bench_preprocess import percentile
+
+    with SessionLocal() as db:
+        user = models.User(email="bench@example.com", hashed_password=get_password_hash("password123"))
+        db.add(user)
+        db.commit()
+        claims = {"sub": user.email, "uid": user.id}
+        db.execute(models.RevokedToken.__table__.insert(), [
+            {"jti": f"revoked-{i}", "expires_at": int(time.time()) + 3600} for i in range(args.revoked)
+        ])
+        db.commit()
+    revoked_tokens.rebuild(engine)
+    add_latency(args.db_latency / 1000)
+
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    def clear_all():
+        auth_cache.verified_tokens.clear()
+        auth_cache.principals.clear()
+
+    scenarios = (
+        ("uncached", {"sub": claims["sub"]}, clear_all),
+        ("uid, uncached", claims, clear_all),
+        ("token cached", claims, auth_cache.principals.clear),
+        ("warm", claims, lambda: None),
+    )
+
+    async def run(token, before_call):
+        timings = []
+        async with AsyncSessionLocal() as db:
+            await get_current_user(token, db)
+            statements.clear()
+            for _ in range(args.calls):
+                before_call()
+                start = time.perf_counter()
+                await get_current_user(token, db)
+                timings.append(time.perf_counter() - start)
+        return timings, len(statements) / args.calls
+
+    print(f"{args.calls} calls, {args.db_latency:g} ms per statement")
+    print(f"{'':14} {'p50 us':>8} {'p99 us':>8} {'queries':>8}")
+    for label, token_claims, before_call in scenarios:
+        token = create_access_token(token_claims)
+        timings, queries = asyncio.run(run(token, before_call))
+        print(f"{label:14} {percentile(timings, 50) * 1e6:8.0f} {percentile(timings, 99) * 1e6:8.0f} "
+              f"{queries:8.1f}")
+
+    jtis = [f"valid-{i}" for i in range(args.calls)]
+    start = time.perf_counter()
+    for jti in jtis:
+        revoked_tokens.might_be_revoked(jti)
+    per_check = (time.perf_counter() - start) / args.calls
+    stats = revoked_tokens.stats()
+    print(f"revocation filter: {stats['tokens']} tokens in {stats['bits'] // 8 // 1024} KiB, "
+          f"{per_check * 1e6:.1f} us per check, {stats['false_positives']} false positives in {stats['checks']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Syncing many cart lines: one POST /cart/items per line vs one batch call.
+
+Each round signs up a fresh user and puts --lines products in their cart,
+once with a request per line and once with a single POST /cart/items:batch,
+reporting the time per sync and the SQL statements it ran. --db-latency adds
+a wait to every statement, standing in for the round trip to a database
+server (see bench_db).
+
+    cd backend
+    python -m benchmarks.bench_cart [--lines 50] [--rounds 10] [--db-latency 2]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=2.0, help="added per statement, ms")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-cart-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app.database import async_engine, engine
+    from app.main import app
+    from benchmarks.bench_db import add_latency, pad_catalog
+    from benchmarks.bench_preprocess import percentile
+
+    pad_catalog(args.lines)
+    engine.dispose()
+    add_latency(args.db_latency / 1000)
+
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    # The seeded catalog comes first, the generated products after it
+    lines = [{"product_id": 10 + i, "quantity": 1, "size": "M", "color": "Black"} for i in range(args.lines)]
+
+    def one_by_one(client, headers):
+        for line in lines:
+            client.post("/cart/items", json=line, headers=headers).raise_for_status()
+
+    def batched(client, headers):
+        client.post("/cart/items:batch", json={"operations": lines}, headers=headers).raise_for_status()
+
+    with TestClient(app) as client:
+        print(f"{args.lines} lines, {args.rounds} rounds, {args.db_latency:g} ms per statement")
+        print(f"{'':12} {'p50 ms':>8} {'max ms':>8} {'statements':>11}")
+        for label, sync in (("single adds", one_by_one), ("batch", batched)):
+            timings = []
+            counts = []
+            for n in range(args.rounds):
+                res = client.post("/auth/signup", json={
+                    "email": f"{label.replace(' ', '-')}-{n}@example.com", "password": "password123",
+                })
+                headers = {"Authorization": f"Bearer {res.json()['token']}"}
+                statements.clear()
+                start = time.perf_counter()
+                sync(client, headers)
+                timings.append(time.perf_counter() - start)
+                counts.append(len(statements))
+                cart = client.get("/cart", headers=headers).json()
+                assert len(cart["items"]) == args.lines
+            print(f"{label:12} {percentile(timings, 50) * 1000:8.1f} {max(timings) * 1000:8.1f} "
+                  f"{max(counts):11d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Catalog endpoints under concurrent load: async sessions vs sync-in-async.
+
+Runs the app under uvicorn and fires concurrent catalog requests at it, once
+at the real product routes (AsyncSession, queries awaited off the event loop)
+and once at copies of them written the way they were before: `async def`
+handlers calling a blocking Session, which stalls the event loop for every
+query. Reports requests per second and p50/p99 latency for each. The real
+routes answer from the in-memory catalog; run with CATALOG_CACHE_ENABLED=false
+to compare database access alone.
+
+The catalog is padded with generated products so queries do real work; page
+offsets are random, like shoppers scrolling a category. SQLite answers from
+the page cache in microseconds, which hides what a database server costs:
+--db-latency adds a wait to every statement, in the thread running it, as a
+stand-in for the network round trip to Postgres.
+
+Keep --concurrency below the sync engine's pool limit (15 connections) when
+comparing: past it, sync-in-async deadlocks. A handler blocks the event loop
+waiting for a pooled connection, while the connections are only returned by
+request teardown, which needs the event loop. It recovers only when the
+checkout times out (30s) with a 500.
+
+    cd backend
+    python -m benchmarks.bench_db [--requests 2000] [--concurrency 10] [--products 50000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sync_in_async_router():
+    """The product routes as they were, on a blocking Session."""
+    from typing import List, Optional
+
+    from fastapi import APIRouter, Depends, HTTPException
+    from sqlalchemy.orm import Session
+
+    from app import models, schemas
+    from app.database import SessionLocal
+
+    def get_sync_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    router = APIRouter(prefix="/sync/products")
+
+    @router.get("/", response_model=List[schemas.Product])
+    async def get_products(category: Optional[str] = None, limit: int = 20, offset: int = 0,
+                           db: Session = Depends(get_sync_db)):
+        query = db.query(models.Product)
+        if category and category != "All":
+            query = query.filter(models.Product.category == category)
+        return query.offset(offset).limit(limit).all()
+
+    @router.get("/{id}", response_model=schemas.Product)
+    async def get_product(id: int, db: Session = Depends(get_sync_db)):
+        product = db.query(models.Product).filter(models.Product.id == id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product
+
+    return router
+
+
+def pad_catalog(count: int) -> None:
+    from app import models
+    from app.database import engine
+    from app.variants import backfill_product_variants
+
+    categories = ["Tops", "Bottoms", "Dresses", "Outerwear", "Accessories"]
+    rows = [{
+        "name": f"Generated product {i}",
+        "brand": "Bench",
+        "price": 10.0 + i % 300,
+        "image": "/assets/clothing-1.jpg",
+        "category": categories[i % len(categories)],
+        "description": "Generated for the database benchmark. " * 4,
+        "colors": ["Black", "White"],
+        "sizes": ["S", "M", "L"],
+        "details": ["Generated"],
+    } for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), rows)
+    backfill_product_variants(engine)
+
+
+def add_latency(seconds: float) -> None:
+    """Delay every statement on both engines by `seconds`, in the thread executing it."""
+    from sqlalchemy import event
+
+    from app.database import async_engine, engine
+
+    def delay(statement):
+        time.sleep(seconds)
+
+    @event.listens_for(engine, "connect")
+    def on_sync_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(delay)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def on_async_connect(dbapi_connection, connection_record):
+        # aiosqlite runs statements on its own thread; register the callback there
+        dbapi_connection.run_async(lambda conn: conn.set_trace_callback(delay))
+
+
+async def load(base_url: str, prefix: str, requests: int, concurrency: int, products: int):
+    import httpx
+
+    categories = ["Tops", "Bottoms", "Dresses", "Outerwear", "Accessories"]
+    rng = random.Random(0)
+    paths = []
+    for _ in range(requests):
+        if rng.random() < 0.5:
+            offset = rng.randrange(products // len(categories))
+            paths.append(f"{prefix}/products/?category={rng.choice(categories)}&offset={offset}")
+        else:
+            paths.append(f"{prefix}/products/{rng.randrange(1, products)}")
+
+    latencies = []
+    failed = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal failed
+        while paths:
+            path = paths.pop()
+            start = time.perf_counter()
+            res = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            failed += res.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--products", type=int, default=50000, help="generated catalog size")
+    parser.add_argument("--db-latency", type=float, default=2.0, help="added per statement, ms")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-db-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    import uvicorn
+    from app.main import app
+    from benchmarks.bench_preprocess import percentile
+
+    pad_catalog(args.products)
+    # Connections made so far (startup, seeding) are dropped so new ones get the delay
+    from app.database import engine
+    engine.dispose()
+    add_latency(args.db_latency / 1000)
+    app.include_router(sync_in_async_router())
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.products} products, "
+          f"{args.db_latency:g} ms per statement")
+    print(f"{'':14} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for label, prefix in (("sync-in-async", "/sync"), ("async", "")):
+            # Warm up connections and the page cache
+            asyncio.run(load(base_url, prefix, 50, 5, args.products))
+            latencies, elapsed, failed = asyncio.run(
+                load(base_url, prefix, args.requests, args.concurrency, args.products)
+            )
+            print(f"{label:14} {len(latencies) / elapsed:8.1f} "
+                  f"{percentile(latencies, 50) * 1000:8.1f} {percentile(latencies, 99) * 1000:8.1f} "
+                  f"{failed:7d}")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Catalog latency during a login storm: Argon2 on the event loop vs off it.
+
+Runs the app under uvicorn and keeps --logins clients logging in as fast as
+they can for --seconds, while one client fetches GET /products and records
+how long each takes. Done twice: with password hashing run inline on the
+event loop, as login used to, and on the bounded hashing threads
+(AUTH_HASH_WORKERS, AUTH_HASH_QUEUE_SIZE). Reports catalog p50/p99 latency,
+logins per second and how many logins were turned away with a 429.
+
+    cd backend
+    python -m benchmarks.bench_login [--logins 20] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+
+class InlineHasher:
+    """Hashes on the calling thread: the event loop, as before."""
+
+    async def hash(self, password):
+        from app.auth_utils import pwd_context
+        return pwd_context.hash(password)
+
+    async def verify_and_update(self, password, hashed_password):
+        from app.auth_utils import pwd_context
+        return pwd_context.verify_and_update(password, hashed_password)
+
+
+async def storm(base_url: str, logins: int, seconds: float, users: int):
+    import httpx
+
+    catalog_latencies = []
+    counts = {"ok": 0, "busy": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def login(client: httpx.AsyncClient, n: int):
+        while time.perf_counter() < deadline:
+            res = await client.post("/auth/login", json={
+                "email": f"storm{(n + counts['ok']) % users}@example.com", "password": "password123",
+            })
+            if res.status_code == 429:
+                counts["busy"] += 1
+                await asyncio.sleep(float(res.headers.get("Retry-After", "1")))
+            else:
+                res.raise_for_status()
+                counts["ok"] += 1
+
+    async def browse(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            (await client.get("/products/", params={"category": "Tops"})).raise_for_status()
+            catalog_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.02)
+
+    limits = httpx.Limits(max_connections=logins + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await asyncio.gather(browse(client), *(login(client, n) for n in range(logins)))
+    return catalog_latencies, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=20, help="concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-login-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    import uvicorn
+    from app import config, models
+    from app.auth_utils import password_hasher, pwd_context
+    from app.database import SessionLocal
+    from app.main import app
+    from app.routers import auth
+    from benchmarks.bench_db import free_port
+    from benchmarks.bench_preprocess import percentile
+
+    # One hash for every user: setting up shouldn't take a storm of its own
+    hashed_password = pwd_context.hash("password123")
+    with SessionLocal() as db:
+        db.add_all(models.User(email=f"storm{i}@example.com", hashed_password=hashed_password)
+                   for i in range(args.users))
+        db.commit()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"{args.logins} clients logging in for {args.seconds:g}s; {config.AUTH_HASH_WORKERS} hashing threads, "
+          f"queue {config.AUTH_HASH_QUEUE_SIZE}")
+    print(f"{'':10} {'p50 ms':>8} {'p99 ms':>8} {'logins/s':>9} {'429s':>6}")
+    try:
+        for label, hasher in (("inline", InlineHasher()), ("offloaded", password_hasher)):
+            auth.password_hasher = hasher
+            latencies, counts = asyncio.run(
+                storm(f"http://127.0.0.1:{port}", args.logins, args.seconds, args.users)
+            )
+            print(f"{label:10} {percentile(latencies, 50) * 1000:8.1f} {percentile(latencies, 99) * 1000:8.1f} "
+                  f"{counts['ok'] / args.seconds:9.1f} {counts['busy']:6d}")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Photo preprocessing benchmark: what reaches the try-on model, before and after.
+
+Generates a synthetic 12 MP phone photo (noisy, EXIF-rotated) and reports,
+for sending it as-is versus preprocessed: bytes sent, preprocessing latency
+and the estimated upload time to the model backend at a given bandwidth.
+Also measures throughput of the process pool against running inline.
+
+    cd backend
+    python -m benchmarks.bench_preprocess [--runs 10] [--mbps 20]
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app.try_on.preprocess import Preprocessor, preprocess_image
+
+
+def phone_photo(width=4032, height=3024) -> bytes:
+    # Random noise makes the JPEG about as large as a real photo
+    noise = Image.frombytes("L", (width // 4, height // 4), os.urandom(width * height // 16))
+    img = Image.merge("RGB", (noise, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT), noise))
+    img = img.resize((width, height))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 CW, like a portrait shot on most phones
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def percentile(samples, pct):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--mbps", type=float, default=20.0, help="uplink to the model backend, Mbit/s")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    photo = phone_photo()
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        processed = preprocess_image(photo, 768, 1024)
+        timings.append(time.perf_counter() - start)
+
+    def upload_seconds(size):
+        return size * 8 / (args.mbps * 1_000_000)
+
+    print(f"{'':<14}{'bytes sent':>12}{'preprocess p50':>16}{'p95':>10}{'upload est.':>13}")
+    print(f"{'as-is':<14}{len(photo):>12,}{'-':>16}{'-':>10}{upload_seconds(len(photo)) * 1000:>11.0f}ms")
+    print(
+        f"{'preprocessed':<14}{len(processed):>12,}"
+        f"{statistics.median(timings) * 1000:>14.1f}ms{percentile(timings, 95) * 1000:>8.1f}ms"
+        f"{upload_seconds(len(processed)) * 1000:>11.0f}ms"
+    )
+    print(f"bytes saved: {1 - len(processed) / len(photo):.1%}")
+
+    # Throughput: N concurrent jobs, inline on threads (GIL-bound) vs the process pool
+    jobs = args.workers * 4
+    with ThreadPoolExecutor(args.workers) as threads:
+        start = time.perf_counter()
+        list(threads.map(lambda _: preprocess_image(photo, 768, 1024), range(jobs)))
+        inline = time.perf_counter() - start
+
+    pool = Preprocessor(args.workers, 768, 1024, "pad", 90)
+    pool.run(photo)  # start the worker processes
+    with ThreadPoolExecutor(args.workers) as threads:
+        start = time.perf_counter()
+        list(threads.map(lambda _: pool.run(photo), range(jobs)))
+        pooled = time.perf_counter() - start
+    pool.shutdown()
+
+    print(f"{jobs} photos on {args.workers} workers: threads {jobs / inline:.1f}/s, process pool {jobs / pooled:.1f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Paging deep into the catalog: offset vs cursor.
+
+Fills the catalog with --products generated products and fetches one page of
+GET /products at increasing depths, once with ?offset= and once with the
+cursor the previous page would have returned, sorted by price within a
+category and by name across the catalog. Reports the time per page. An
+offset page reads and throws away every row before it; a cursor page starts
+at its position in the (category, price, id) or (name, id) index.
+
+The database path is measured unless --cached is given, in which case both
+run against the in-memory catalog.
+
+    cd backend
+    python -m benchmarks.bench_products [--products 100000] [--repeat 20] [--cached]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=100000, help="generated catalog size")
+    parser.add_argument("--repeat", type=int, default=20, help="requests per depth")
+    parser.add_argument("--cached", action="store_true", help="serve from the in-memory catalog")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-products-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "CATALOG_CACHE_ENABLED": "true" if args.cached else "false",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select
+
+    from app import models
+    from app.database import SessionLocal
+    from app.listing import SORTS, encode_cursor
+    from app.main import app
+    from benchmarks.bench_db import pad_catalog
+    from benchmarks.bench_preprocess import percentile
+
+    pad_catalog(args.products)
+
+    def cursor_at(sort: str, category, depth: int):
+        """The cursor a client holds after paging through `depth` products."""
+        if depth == 0:
+            return None
+        attribute, _ = SORTS[sort]
+        column = getattr(models.Product, attribute)
+        query = select(column, models.Product.id).order_by(column, models.Product.id)
+        if category:
+            query = query.where(models.Product.category == category)
+        with SessionLocal() as db:
+            key, product_id = db.execute(query.offset(depth - 1).limit(1)).one()
+        return encode_cursor(sort, key, product_id)
+
+    def timed(client, params):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get("/products/", params=params).raise_for_status()
+            timings.append(time.perf_counter() - start)
+        return percentile(timings, 50) * 1000
+
+    scenarios = (("price, Tops", "price", "Tops"), ("name, all", "name", None))
+    with TestClient(app) as client:
+        print(f"{args.products} products, {'in-memory catalog' if args.cached else 'database'}, "
+              f"p50 of {args.repeat} requests")
+        print(f"{'':12} {'depth':>8} {'offset ms':>10} {'cursor ms':>10}")
+        for label, sort, category in scenarios:
+            size = args.products // 5 if category else args.products
+            for depth in (0, size // 100, size // 10, size // 2, size - 20):
+                params = {"sort": sort, "limit": 20, **({"category": category} if category else {})}
+                offset_ms = timed(client, {**params, "offset": depth})
+                cursor = cursor_at(sort, category, depth)
+                cursor_ms = timed(client, {**params, **({"cursor": cursor} if cursor else {})})
+                print(f"{label:12} {depth:8d} {offset_ms:10.2f} {cursor_ms:10.2f}")
+
+            params = {"sort": sort, **({"category": category} if category else {})}
+            total_ms = timed(client, {**params, "total": True}) - timed(client, params)
+            print(f"{label:12} {'total':>8} {'':10} {total_ms:+10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Product search on a large synthetic catalog: in-memory index vs SQLite FTS5.
+
+Fills the catalog with --products products whose names, descriptions and
+details are drawn from a small fashion vocabulary, then times GET
+/products/search for a few kinds of query with each backend: a material, a
+style, two words, and a type-ahead prefix. Also reports how long the
+in-memory index takes to build and to take in one product write (the
+catalog reload that comes with a write is reported separately).
+
+    cd backend
+    python -m benchmarks.bench_search [--products 100000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+MATERIALS = ["cotton", "linen", "silk", "wool", "denim", "leather", "cashmere", "velvet", "satin", "hemp"]
+GARMENTS = ["shirt", "blouse", "dress", "skirt", "trousers", "jacket", "coat", "sweater", "tee", "shorts"]
+ADJECTIVES = ["classic", "slim", "relaxed", "cropped", "oversized", "tailored", "vintage", "organic",
+              "summer", "winter", "evening", "casual", "striped", "floral", "pleated", "quilted"]
+QUERIES = {
+    "material": "cotton",
+    "style": "quilted",
+    "two words": "silk dress",
+    "prefix": "cas",
+}
+
+
+def fill_catalog(count: int) -> None:
+    from app import models
+    from app.database import engine
+    from app.variants import backfill_product_variants
+
+    rng = random.Random(0)
+    categories = ["Tops", "Bottoms", "Dresses", "Outerwear", "Accessories"]
+    rows = []
+    for i in range(count):
+        material, garment = rng.choice(MATERIALS), rng.choice(GARMENTS)
+        words = rng.sample(ADJECTIVES, 4)
+        rows.append({
+            "name": f"{words[0].title()} {material.title()} {garment.title()} {i}",
+            "brand": f"Brand {i % 50}",
+            "price": 10.0 + i % 300,
+            "image": "/assets/clothing-1.jpg",
+            "category": categories[i % len(categories)],
+            "description": f"A {words[1]} {garment} in {rng.choice(MATERIALS)}, {words[2]} and {words[3]}.",
+            "colors": rng.sample(["Black", "White", "Blue", "Red", "Green"], 2),
+            "sizes": ["S", "M", "L"],
+            "details": [f"100% {material}", f"{rng.choice(ADJECTIVES).title()} fit"],
+        })
+    with engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), rows)
+    backfill_product_variants(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20, help="requests per query")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "TRYON_BACKEND": "stub",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    from fastapi.testclient import TestClient
+
+    from app import catalog, models, search
+    from app.database import AsyncReadSessionLocal, SessionLocal, engine
+    from app.main import app
+    from benchmarks.bench_preprocess import percentile
+
+    fill_catalog(args.products)
+    catalog.bump()
+    start = time.perf_counter()
+    search.create_fts_table(engine)
+    fts_build = time.perf_counter() - start
+
+    memory = search.product_search
+
+    async def build():
+        async with AsyncReadSessionLocal() as db:
+            snapshot = await catalog.catalog_cache.snapshot(db)
+            start = time.perf_counter()
+            await memory.sync(snapshot)
+            return time.perf_counter() - start
+
+    memory_build = asyncio.run(build())
+    print(f"{args.products} products; index build: memory {memory_build:.1f} s, fts5 {fts_build:.1f} s")
+
+    with TestClient(app) as client:
+        print(f"{'':12} {'matches':>8} {'memory ms':>10} {'fts5 ms':>10}")
+        for label, q in QUERIES.items():
+            row = []
+            for backend in (memory, search.Fts5Search()):
+                search.product_search = backend
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    res = client.get("/products/search", params={"q": q})
+                    timings.append(time.perf_counter() - start)
+                row.append(percentile(timings, 50) * 1000)
+            print(f"{label:12} {res.json()['total']:8d} {row[0]:10.1f} {row[1]:10.1f}")
+
+        # One write: the catalog reloads, the index re-indexes just that product
+        search.product_search = memory
+        with SessionLocal() as db:
+            db.get(models.Product, 1).name = "Renamed Product"
+            db.commit()
+
+    async def after_write():
+        async with AsyncReadSessionLocal() as db:
+            start = time.perf_counter()
+            snapshot = await catalog.catalog_cache.snapshot(db)
+            reload = time.perf_counter() - start
+            start = time.perf_counter()
+            await memory.sync(snapshot)
+            return reload, time.perf_counter() - start
+
+    reload, reindex = asyncio.run(after_write())
+    print(f"after one write: catalog reload {reload * 1000:.0f} ms, index update {reindex * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+End-to-end try-on throughput on the stub backend.
+
+Submits a burst of try-on requests through the HTTP API and waits for all of
+them, reporting jobs per second and submit-to-finish latency. The stub engine
+stands in for the model with a fixed delay per render, so this measures the
+pipeline around the model (upload, preprocessing, queueing, storage) and runs
+on CI hardware without network access.
+
+    cd backend
+    python -m benchmarks.bench_try_on [--jobs 40] [--latency 0.2] [--workers 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub render time, seconds")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", choices=["stub", "subprocess"], default="stub")
+    args = parser.parse_args()
+
+    # Settings are read at import time
+    os.environ.update({
+        "TRYON_BACKEND": args.backend,
+        "TRYON_STUB_LATENCY": str(args.latency),
+        "TRYON_WORKERS": str(args.workers),
+        "TRYON_QUEUE_SIZE": str(args.jobs),
+        "TRYON_CACHE_ENABLED": "false",
+        "TRYON_RESULT_DIR": tempfile.mkdtemp(prefix="bench-results-"),
+        "TRYON_UPLOAD_TMP_DIR": tempfile.mkdtemp(prefix="bench-uploads-"),
+        "TRYON_GARMENT_DIR": tempfile.mkdtemp(prefix="bench-garments-"),
+    })
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from benchmarks.bench_preprocess import percentile, phone_photo
+
+    photo = phone_photo(1500, 2000)
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        submitted = {}
+        for i in range(args.jobs):
+            res = client.post(
+                "/try-on/",
+                data={"productId": str(i % 6 + 1)},
+                files={"userImage": ("me.jpg", photo, "image/jpeg")},
+            )
+            res.raise_for_status()
+            submitted[res.json()["job_id"]] = time.perf_counter()
+
+        latencies = []
+        failed = 0
+        pending = set(submitted)
+        while pending:
+            for job_id in list(pending):
+                job = client.get(f"/try-on/jobs/{job_id}").json()
+                if job["status"] in ("succeeded", "failed"):
+                    latencies.append(time.perf_counter() - submitted[job_id])
+                    failed += job["status"] == "failed" or job["result_image"].startswith("/assets/")
+                    pending.discard(job_id)
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.jobs} jobs on {args.workers} workers, {args.backend} backend at {args.latency}s/render")
+    # The subprocess backend has one model server, renders one at a time
+    parallel = args.workers if args.backend == "stub" else 1
+    bound = f" (model bound: {parallel / args.latency:.2f})" if args.latency else ""
+    print(f"throughput   {args.jobs / elapsed:8.2f} jobs/s{bound}")
+    print(f"latency p50  {percentile(latencies, 50) * 1000:8.0f} ms")
+    print(f"latency p95  {percentile(latencies, 95) * 1000:8.0f} ms")
+    print(f"fallbacks    {failed:8d}")
+
+
+if __name__ == "__main__":
+    main()
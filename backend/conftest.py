@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Never call out to Hugging Face from the test suite
+os.environ.setdefault("TRYON_BACKEND", "stub")
+# Keep rendered images out of the working tree
+os.environ.setdefault("TRYON_CACHE_DIR", tempfile.mkdtemp(prefix="try-on-cache-"))
+os.environ.setdefault("TRYON_RESULT_DIR", tempfile.mkdtemp(prefix="try-on-results-"))
+os.environ.setdefault("TRYON_UPLOAD_TMP_DIR", tempfile.mkdtemp(prefix="try-on-uploads-"))
+os.environ.setdefault("TRYON_GARMENT_DIR", tempfile.mkdtemp(prefix="try-on-garments-"))
+os.environ.setdefault("TRYON_FLIGHT_DIR", tempfile.mkdtemp(prefix="try-on-flights-"))
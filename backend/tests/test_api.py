@@ -1,3 +1,4 @@
+import time
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -59,7 +60,7 @@ def test_cart_flow():
         "product_id": 1,
         "quantity": 2,
         "size": "M",
-        "color": "Blue"
+        "color": "Navy"
     }
     response = client.post("/cart/items", json=item_data, headers=headers)
     assert response.status_code == 200
@@ -74,7 +75,7 @@ def test_cart_flow():
 
 def test_try_on():
     # Need to simulate file upload
-    # Since it's a mock, we just check response structure
+    # The test suite runs against the stub backend (see conftest.py)
     
     files = {'userImage': ('test.jpg', b'fakeimagebytes', 'image/jpeg')}
     data = {'productId': '1'}
@@ -84,5 +85,15 @@ def test_try_on():
     # Router prefix is "/try-on". Function is check path.
     # Check router implementation: prefix="/try-on", path="/" -> "/try-on/"
     
-    assert response.status_code == 200
-    assert "result_image" in response.json()
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    # Poll until the job finishes
+    for _ in range(50):
+        job = client.get(f"/try-on/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.1)
+
+    assert job["status"] == "succeeded"
+    assert job["result_image"]
@@ -1,26 +1,33 @@
 import pytest
 import os
 import sys
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add the project root to python path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from app.database import Base, get_db
+from sqlalchemy.pool import NullPool
+from app.database import Base, create_async_db_engine, create_db_engine, get_db, get_read_db
 from app.main import app
-from app import models
+from app import auth_cache, catalog, models
 
 # Use a separate test database file
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_integration.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Same pool settings and SQLite pragmas as the app's engines
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The app's requests go through an async session on the same file. Each
+# TestClient runs its own event loop, so connections aren't pooled across them.
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 @pytest.fixture(scope="session")
 def db_engine():
     # Create the database and tables
@@ -33,34 +40,92 @@ def db_engine():
     
     # Teardown
     Base.metadata.drop_all(bind=engine)
-    if os.path.exists("./test_integration.db"):
-        os.remove("./test_integration.db")
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"./test_integration.db{suffix}"):
+            os.remove(f"./test_integration.db{suffix}")
 
 @pytest.fixture(scope="function")
 def db(db_engine):
     """
     Creates a new database session for a test.
-    Rolls back the transaction after the test is complete.
+    The app commits through its own connections, so instead of rolling back a
+    transaction the tables are emptied after the test.
     """
-    connection = db_engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    # The in-memory catalog and the auth caches may hold another database's rows
+    catalog.bump()
+    auth_cache.principals.clear()
+    session = TestingSessionLocal()
     
     yield session
     
     session.close()
-    transaction.rollback()
-    connection.close()
+    with db_engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    catalog.bump()
+    auth_cache.principals.clear()
 
 @pytest.fixture(scope="function")
 def client(db):
-    def override_get_db():
-        try:
-            yield db
-        finally:
-            pass
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
+
+@pytest.fixture
+def add_product(db):
+    """
+    Adds a product and returns it, committed. Any column can be given; the
+    rest get placeholder values:
+
+        product_id = add_product("Linen Shirt", colors=["White"], sizes=["M", "L"]).id
+    """
+    def add(name, **fields):
+        product = models.Product(**{
+            "brand": "Brand", "price": 10.0, "image": "test.jpg", "category": "Tops", "description": "Desc",
+            "colors": ["Red"], "sizes": ["M"], "details": [], **fields, "name": name,
+        })
+        db.add(product)
+        db.commit()
+        return product
+
+    return add
+
+@pytest.fixture
+def variants_of(db):
+    """A product's variants as they are in the table, by (size, color)."""
+    def variants(product_id):
+        query = select(models.ProductVariant).where(models.ProductVariant.product_id == product_id)
+        return {(v.size, v.color): v for v in db.scalars(query)}
+
+    return variants
+
+@pytest.fixture
+def count_queries():
+    """
+    Records the SQL statements the app runs inside a `with` block:
+
+        with count_queries() as queries:
+            client.get("/cart", headers=headers)
+        assert len(queries) <= 4
+    """
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    return counting
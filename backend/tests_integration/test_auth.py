@@ -1,3 +1,8 @@
+import pytest
+from jose import jwt
+
+from app import auth_cache, models
+
 def test_signup(client):
     response = client.post(
         "/auth/signup",
@@ -77,3 +82,195 @@ def test_get_me(client):
     )
     assert response.status_code == 200
     assert response.json()["email"] == "me@example.com"
+
+def test_get_me_served_from_auth_caches(client, db, count_queries):
+    signup_res = client.post("/auth/signup", json={"email": "fast@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    assert jwt.get_unverified_claims(signup_res.json()["token"])["uid"] == signup_res.json()["user"]["id"]
+
+    client.get("/auth/me", headers=headers)
+    with count_queries() as queries:
+        res = client.get("/auth/me", headers=headers)
+    assert res.json()["email"] == "fast@example.com"
+    assert queries == []
+
+    # A committed change to the user evicts it
+    user = db.query(models.User).filter_by(email="fast@example.com").one()
+    user.full_name = "Renamed"
+    db.commit()
+    assert client.get("/auth/me", headers=headers).json()["full_name"] == "Renamed"
+
+    db.delete(user)
+    db.commit()
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+def test_cached_token_expires_with_its_exp(client, monkeypatch):
+    client.post("/auth/signup", json={"email": "expiring@example.com", "password": "password123"})
+    token = client.post(
+        "/auth/login", json={"email": "expiring@example.com", "password": "password123"}
+    ).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    assert auth_cache.verified_tokens.get(auth_cache.token_key(token)) is not None
+
+    exp = jwt.get_unverified_claims(token)["exp"]
+    monkeypatch.setattr(auth_cache.time, "time", lambda: exp + 1)
+    assert auth_cache.verified_tokens.get(auth_cache.token_key(token)) is None
+
+def test_logout_drops_token_from_cache(client):
+    token = client.post(
+        "/auth/signup", json={"email": "bye@example.com", "password": "password123"}
+    ).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/auth/me", headers=headers)
+
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert auth_cache.verified_tokens.get(auth_cache.token_key(token)) is None
+
+def test_login_rehashes_password_with_new_parameters(client, db):
+    from passlib.context import CryptContext
+
+    from app.auth_utils import pwd_context
+
+    old_context = CryptContext(schemes=["argon2"], argon2__rounds=1, argon2__memory_cost=8192)
+    db.add(models.User(email="rehash@example.com", hashed_password=old_context.hash("password123")))
+    db.commit()
+
+    res = client.post("/auth/login", json={"email": "rehash@example.com", "password": "password123"})
+    assert res.status_code == 200
+    db.expire_all()
+    new_hash = db.query(models.User).filter_by(email="rehash@example.com").one().hashed_password
+    assert not pwd_context.needs_update(new_hash)
+    assert pwd_context.verify("password123", new_hash)
+
+    assert client.post(
+        "/auth/login", json={"email": "rehash@example.com", "password": "password123"}
+    ).status_code == 200
+    assert client.post(
+        "/auth/login", json={"email": "rehash@example.com", "password": "wrong-password"}
+    ).status_code == 401
+
+def test_password_hasher_refuses_past_its_queue(client, monkeypatch):
+    import asyncio
+    import threading
+
+    from app import auth_utils
+    from app.routers import auth
+
+    hasher = auth_utils.PasswordHasher(workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        try:
+            await hasher.hash("password123")
+        finally:
+            release.set()
+            await asyncio.gather(*running)
+
+    with pytest.raises(auth_utils.HasherBusyError):
+        asyncio.run(scenario())
+    # Finished hashes free their slots
+    assert asyncio.run(hasher.verify_and_update("password123", asyncio.run(hasher.hash("password123")))) == (True, None)
+    hasher.shutdown()
+
+    # No slots at all
+    monkeypatch.setattr(auth, "password_hasher", auth_utils.PasswordHasher(workers=1, queue_size=-1))
+    res = client.post("/auth/signup", json={"email": "storm@example.com", "password": "password123"})
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "1"
+
+def test_refresh_token_gets_new_tokens_once(client):
+    tokens = client.post(
+        "/auth/signup", json={"email": "refresh@example.com", "password": "password123"}
+    ).json()
+    # Not an access token
+    assert client.get(
+        "/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    ).status_code == 401
+
+    res = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert res.status_code == 200
+    renewed = res.json()
+    assert renewed["user"]["email"] == "refresh@example.com"
+    assert client.get(
+        "/auth/me", headers={"Authorization": f"Bearer {renewed['token']}"}
+    ).status_code == 200
+
+    # Used refresh tokens are revoked; the new one works
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": renewed["refresh_token"]}).status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": renewed["token"]}).status_code == 401
+
+def test_logout_revokes_tokens(client):
+    tokens = client.post(
+        "/auth/signup", json={"email": "revoke@example.com", "password": "password123"}
+    ).json()
+    headers = {"Authorization": f"Bearer {tokens['token']}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    res = client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    assert res.status_code == 200
+    res = client.get("/auth/me", headers=headers)
+    assert res.status_code == 401
+    assert res.json()["detail"] == "Token has been revoked"
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_revocations_reach_other_workers_and_expire(client, db):
+    import time
+
+    from app.revocation import BloomFilter, RevocationList
+
+    client.post("/auth/signup", json={"email": "worker@example.com", "password": "password123"})
+    tokens = client.post(
+        "/auth/login", json={"email": "worker@example.com", "password": "password123"}
+    ).json()
+    jti = jwt.get_unverified_claims(tokens["token"])["jti"]
+    exp = jwt.get_unverified_claims(tokens["token"])["exp"]
+    # Another worker's list, which hasn't seen the logout
+    other_worker = RevocationList(capacity=100, error_rate=0.01)
+    other_worker.rebuild(db.get_bind())
+    client.post("/auth/logout", headers={"Authorization": f"Bearer {tokens['token']}"})
+
+    assert not other_worker.might_be_revoked(jti)
+    assert other_worker.sync(db.get_bind()) == 1
+    assert other_worker.might_be_revoked(jti)
+
+    assert other_worker.purge(db.get_bind(), now=time.time()) == 0
+    assert other_worker.purge(db.get_bind(), now=exp + 1) == 1
+    assert db.query(models.RevokedToken).count() == 0
+    assert not other_worker.might_be_revoked(jti)
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"revoked-{i}")
+    assert all(f"revoked-{i}" in bloom for i in range(1000))
+    assert sum(f"valid-{i}" in bloom for i in range(10000)) < 300
+
+def test_revocations_after_another_worker_purges(db):
+    from app.revocation import RevocationList
+
+    engine = db.get_bind()
+    worker_a = RevocationList(capacity=100, error_rate=0.01)
+    worker_b = RevocationList(capacity=100, error_rate=0.01)
+    db.add_all([models.RevokedToken(jti=f"old-{i}", expires_at=100) for i in range(3)])
+    db.commit()
+    worker_a.rebuild(engine)
+    worker_b.rebuild(engine)
+
+    assert worker_a.purge(engine, now=200) == 3
+    db.add(models.RevokedToken(jti="fresh", expires_at=10**10))
+    db.commit()
+    # The purged ids aren't handed out again
+    assert db.query(models.RevokedToken).one().id > 3
+    assert worker_b.sync(engine) == 1
+    assert worker_b.might_be_revoked("fresh")
+
+    # A table made before AUTOINCREMENT reuses them; the other worker notices and rebuilds
+    assert worker_a.purge(engine, now=10**11) == 1
+    db.add(models.RevokedToken(id=1, jti="reused", expires_at=10**10))
+    db.commit()
+    worker_b.sync(engine)
+    assert worker_b.might_be_revoked("reused")
+    assert not worker_b.might_be_revoked("old-0")
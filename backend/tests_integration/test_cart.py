@@ -99,3 +99,238 @@ def test_remove_from_cart(client, db):
     cart_final = client.get("/cart", headers=headers).json()
     assert len(cart_final["items"]) == 0
     assert cart_final["total"] == 0.0
+
+def test_add_same_item_twice_merges_quantities(client, db):
+    signup_res = client.post(
+        "/auth/signup",
+        json={
+            "email": "merge@example.com",
+            "password": "password123",
+            "full_name": "Merge User"
+        },
+    )
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+
+    product = models.Product(
+        name="Merge Shirt",
+        brand="Brand",
+        price=15.0,
+        image="test.jpg",
+        category="Tops",
+        description="Desc",
+        colors=["Red"],
+        sizes=["M"],
+        details=[]
+    )
+    db.add(product)
+    db.commit()
+
+    item = {"product_id": product.id, "quantity": 1, "size": "M", "color": "Red"}
+    client.post("/cart/items", json=item, headers=headers)
+    data = client.post("/cart/items", json=item, headers=headers).json()
+
+    assert len(data["items"]) == 1
+    assert data["items"][0]["quantity"] == 2
+    assert data["total"] == 30.0
+
+    # Adding can't take a line down to zero or below
+    for quantity in (0, -5):
+        res = client.post("/cart/items", json={**item, "quantity": quantity}, headers=headers)
+        assert res.status_code == 422
+    assert client.get("/cart", headers=headers).json()["total"] == 30.0
+
+def test_wishlist_add_and_remove(client, db):
+    signup_res = client.post(
+        "/auth/signup",
+        json={
+            "email": "wishlist@example.com",
+            "password": "password123",
+            "full_name": "Wishlist User"
+        },
+    )
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+
+    product = models.Product(
+        name="Wish Dress",
+        brand="Brand",
+        price=99.0,
+        image="test.jpg",
+        category="Dresses",
+        description="Desc",
+        colors=["Black"],
+        sizes=["S"],
+        details=[]
+    )
+    db.add(product)
+    db.commit()
+
+    res = client.post("/wishlist/items", json={"product_id": product.id}, headers=headers)
+    assert res.json() == {"message": "Product added to wishlist"}
+    res = client.post("/wishlist/items", json={"product_id": product.id}, headers=headers)
+    assert res.json() == {"message": "Product already in wishlist"}
+    assert [p["name"] for p in client.get("/wishlist", headers=headers).json()] == ["Wish Dress"]
+
+    client.delete(f"/wishlist/items/{product.id}", headers=headers)
+    assert client.get("/wishlist", headers=headers).json() == []
+
+def fill_cart_and_wishlist(client, db, add_product, email, size):
+    """A user whose cart holds `size` different products, all also on their wishlist."""
+    signup_res = client.post("/auth/signup", json={"email": email, "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+
+    user = db.query(models.User).filter(models.User.email == email).one()
+    products = [add_product(f"{email} product {i}", price=1.0 + i, sizes=["M", "L"]) for i in range(size)]
+    cart = models.Cart(user=user, total=0.0)
+    cart.items = [models.CartItem(product=p, quantity=1, size="M", color="Red") for p in products]
+    user.wishlist = products
+    db.add(cart)
+    db.commit()
+    return headers, products[0].id, cart.items[0].id
+
+def endpoint_query_counts(client, count_queries, headers, product_id, item_id):
+    counts = {}
+    requests = {
+        "get cart": lambda: client.get("/cart", headers=headers),
+        "add new item": lambda: client.post(
+            "/cart/items", json={"product_id": product_id, "quantity": 1, "size": "L", "color": "Red"},
+            headers=headers),
+        "add existing item": lambda: client.post(
+            "/cart/items", json={"product_id": product_id, "quantity": 1, "size": "M", "color": "Red"},
+            headers=headers),
+        "remove item": lambda: client.delete(f"/cart/items/{item_id}", headers=headers),
+        "get wishlist": lambda: client.get("/wishlist", headers=headers),
+    }
+    for name, request in requests.items():
+        with count_queries() as queries:
+            assert request().status_code == 200
+        counts[name] = len(queries)
+    return counts
+
+def test_cart_and_wishlist_queries_do_not_grow_with_size(client, db, add_product, count_queries):
+    small = endpoint_query_counts(
+        client, count_queries, *fill_cart_and_wishlist(client, db, add_product, "small@example.com", 1)
+    )
+    large = endpoint_query_counts(
+        client, count_queries, *fill_cart_and_wishlist(client, db, add_product, "large@example.com", 200)
+    )
+
+    assert large == small
+    # User, cart, its items with their products
+    assert small["get cart"] <= 3
+    assert small["get wishlist"] <= 2
+    # Plus variant check, cart lock, line upsert, total update
+    assert max(small.values()) <= 7
+
+def test_concurrent_adds_and_removes_keep_total_consistent(client, db, add_product):
+    from concurrent.futures import ThreadPoolExecutor
+
+    signup_res = client.post("/auth/signup", json={"email": "hammer@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    product_ids = [add_product(f"Hammer {i}", price=float(i + 1), sizes=["S", "M"]).id for i in range(5)]
+
+    # Lines to remove while the adds run, on a size nobody adds
+    removable = []
+    for product_id in product_ids:
+        cart = client.post(
+            "/cart/items", json={"product_id": product_id, "quantity": 3, "size": "S", "color": "Red"},
+            headers=headers,
+        ).json()
+        removable.append(next(i["id"] for i in cart["items"] if i["product"]["id"] == product_id))
+
+    def add(n):
+        item = {"product_id": product_ids[n % 5], "quantity": 1, "size": "M", "color": "Red"}
+        return client.post("/cart/items", json=item, headers=headers).status_code
+
+    def remove(item_id):
+        return client.delete(f"/cart/items/{item_id}", headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        adds = pool.map(add, range(100))
+        removes = pool.map(remove, removable)
+        assert list(adds) == [200] * 100
+        assert list(removes) == [200] * 5
+
+    cart = client.get("/cart", headers=headers).json()
+    assert sorted((i["product"]["id"], i["quantity"]) for i in cart["items"]) == [(p, 20) for p in product_ids]
+    assert cart["total"] == 20 * sum(range(1, 6))
+
+def test_replace_cart(client, db, add_product):
+    signup_res = client.post("/auth/signup", json={"email": "replace@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    a, b, c = (add_product(f"Replace {i}", price=float(i + 1), sizes=["M", "L"]).id for i in range(3))
+    client.post("/cart/items", json={"product_id": a, "quantity": 5, "size": "M", "color": "Red"}, headers=headers)
+
+    res = client.put("/cart", json={"items": [
+        {"product_id": b, "quantity": 1, "size": "M", "color": "Red"},
+        {"product_id": b, "quantity": 2, "size": "M", "color": "Red"},
+        {"product_id": c, "quantity": 1, "size": "L", "color": "Red"},
+    ]}, headers=headers)
+
+    assert res.status_code == 200
+    cart = res.json()
+    assert sorted((i["product"]["id"], i["size"], i["quantity"]) for i in cart["items"]) == [(b, "M", 3), (c, "L", 1)]
+    assert cart["total"] == 3 * 2.0 + 3.0
+
+def test_batch_update_cart(client, db, add_product, count_queries):
+    signup_res = client.post("/auth/signup", json={"email": "batch@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    ids = [add_product(f"Batch {i}", price=float(i + 1), sizes=["M", "L"]).id for i in range(50)]
+    client.put("/cart", json={"items": [
+        {"product_id": ids[0], "quantity": 2, "size": "M", "color": "Red"},
+        {"product_id": ids[1], "quantity": 2, "size": "M", "color": "Red"},
+    ]}, headers=headers)
+
+    operations = [{"product_id": i, "quantity": 1, "size": "M", "color": "Red"} for i in ids]
+    operations += [
+        {"op": "set", "product_id": ids[0], "quantity": 7, "size": "M", "color": "Red"},
+        {"op": "remove", "product_id": ids[1], "size": "M", "color": "Red"},
+        {"op": "set", "product_id": ids[2], "quantity": 0, "size": "M", "color": "Red"},
+    ]
+    with count_queries() as queries:
+        res = client.post("/cart/items:batch", json={"operations": operations}, headers=headers)
+
+    assert res.status_code == 200
+    quantities = {i["product"]["id"]: i["quantity"] for i in res.json()["items"]}
+    assert quantities == {ids[0]: 7, **{i: 1 for i in ids[3:]}}
+    assert res.json()["total"] == 7 * 1.0 + sum(range(4, 51))
+    # User, variants, cart lock, delete, set, add, total, reload
+    assert len(queries) <= 9
+
+def test_batch_update_cart_is_all_or_nothing(client, db, add_product):
+    signup_res = client.post("/auth/signup", json={"email": "batch404@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    product_id = add_product("Atomic", price=1.0, sizes=["M", "L"]).id
+
+    res = client.post("/cart/items:batch", json={"operations": [
+        {"product_id": product_id, "quantity": 1, "size": "M", "color": "Red"},
+        {"product_id": 999999, "quantity": 1, "size": "M", "color": "Red"},
+    ]}, headers=headers)
+
+    assert res.status_code == 404
+    assert client.get("/cart", headers=headers).json()["items"] == []
+
+def test_cart_accepts_only_available_variants(client, db, add_product):
+    signup_res = client.post("/auth/signup", json={"email": "variants@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {signup_res.json()['token']}"}
+    product_id = add_product("Variant", price=1.0, sizes=["M", "L"]).id
+    db.query(models.ProductVariant).filter_by(product_id=product_id, size="L").update({"stock": 0})
+    db.commit()
+
+    def add(size, color, product=product_id):
+        item = {"product_id": product, "quantity": 1, "size": size, "color": color}
+        return client.post("/cart/items", json=item, headers=headers).status_code
+
+    assert add("M", "Red") == 200
+    assert add("XXL", "Red") == 422
+    assert add("M", "Plaid") == 422
+    # Out of stock
+    assert add("L", "Red") == 422
+    assert add("M", "Red", product=999999) == 404
+
+    res = client.post("/cart/items:batch", json={"operations": [
+        {"product_id": product_id, "quantity": 1, "size": "M", "color": "Red"},
+        {"product_id": product_id, "quantity": 1, "size": "XXL", "color": "Red"},
+    ]}, headers=headers)
+    assert res.status_code == 422
+    assert "XXL/Red" in res.json()["detail"]
+    assert [i["quantity"] for i in client.get("/cart", headers=headers).json()["items"]] == [1]
@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.database import create_async_db_engine
+
+
+def test_sqlite_pragmas_applied(db):
+    with db.get_bind().connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+def test_read_only_engine_refuses_writes(db):
+    async def scenario():
+        read_engine = create_async_db_engine(str(db.get_bind().url), read_only=True)
+        try:
+            async with read_engine.connect() as conn:
+                assert (await conn.execute(text("SELECT count(*) FROM products"))).scalar() == 0
+                with pytest.raises(OperationalError, match="readonly"):
+                    await conn.execute(text("DELETE FROM products"))
+        finally:
+            await read_engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_cart_writes_do_not_lock(client, db, add_product):
+    product_id = add_product("Stress Tee", price=5.0, sizes=["S", "M", "L"]).id
+
+    users = []
+    for i in range(4):
+        res = client.post(
+            "/auth/signup",
+            json={"email": f"stress{i}@example.com", "password": "password123"},
+        )
+        headers = {"Authorization": f"Bearer {res.json()['token']}"}
+        client.get("/cart", headers=headers)
+        users.append(headers)
+
+    def add(n):
+        item = {"product_id": product_id, "quantity": 1, "size": ["S", "M", "L"][n % 3], "color": "Red"}
+        res = client.post("/cart/items", json=item, headers=users[n % len(users)])
+        client.get(f"/products/{product_id}")
+        return res.status_code
+
+    # Writers from several users interleaved with readers; without WAL and a
+    # busy timeout some of these fail with "database is locked"
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(add, range(96)))
+
+    assert statuses == [200] * 96
+
+
+def test_merging_duplicate_cart_lines_without_size_or_color(db, add_product):
+    from app.database import merge_duplicate_cart_items
+
+    product = add_product("Tote", price=20.0, category="Accessories", colors=[], sizes=[])
+    cart = models.Cart(total=0.0)
+    db.add(cart)
+    db.commit()
+    # Lines from before the unique index; it doesn't stop NULL duplicates either
+    for _ in range(3):
+        db.execute(text(
+            "INSERT INTO cart_items (cart_id, product_id, quantity, size, color) VALUES (:cart, :product, 2, NULL, NULL)"
+        ), {"cart": cart.id, "product": product.id})
+    db.commit()
+
+    for _ in range(2):
+        merge_duplicate_cart_items(db.get_bind())
+    lines = db.execute(text("SELECT quantity FROM cart_items WHERE cart_id = :cart"), {"cart": cart.id}).all()
+    assert [quantity for quantity, in lines] == [6]
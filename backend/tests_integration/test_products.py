@@ -0,0 +1,144 @@
+import pytest
+
+from app import catalog, config, models
+
+
+def test_products_served_with_etag_and_304(client, db, add_product, count_queries):
+    product_id = add_product("Etag Shirt").id
+    add_product("Etag Skirt", category="Bottoms")
+
+    res = client.get("/products/", params={"category": "Tops"})
+    assert res.status_code == 200
+    assert [p["name"] for p in res.json()] == ["Etag Shirt"]
+    assert res.headers["Cache-Control"].startswith("public, max-age=")
+    etag = res.headers["ETag"]
+
+    with count_queries() as queries:
+        again = client.get("/products/", params={"category": "Tops"}, headers={"If-None-Match": etag})
+        one = client.get(f"/products/{product_id}")
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert one.json()["name"] == "Etag Shirt"
+    # Served from memory
+    assert queries == []
+
+    assert client.get(f"/products/{product_id}", headers={"If-None-Match": one.headers["ETag"]}).status_code == 304
+    assert client.get("/products/999999").status_code == 404
+
+
+def test_product_write_invalidates_catalog(client, db, add_product):
+    add_product("First")
+    res = client.get("/products/")
+    etag = res.headers["ETag"]
+    assert [p["name"] for p in res.json()] == ["First"]
+
+    product = db.query(models.Product).filter(models.Product.name == "First").one()
+    product.price = 12.5
+    db.commit()
+    add_product("Second")
+
+    res = client.get("/products/", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert [(p["name"], p["price"]) for p in res.json()] == [("First", 12.5), ("Second", 10.0)]
+    assert res.headers["ETag"] != etag
+
+
+def test_file_version_is_shared_between_workers(tmp_path):
+    path = tmp_path / "catalog.version"
+    worker_a = catalog.FileVersion(str(path))
+    worker_b = catalog.FileVersion(str(path))
+
+    assert worker_a.get() == worker_b.get() == 0
+    worker_a.bump()
+    assert worker_b.get() == 1
+    worker_b.bump()
+    assert worker_a.get() == 2
+
+
+@pytest.fixture(params=[True, False], ids=["cached", "database"])
+def catalog_mode(request, monkeypatch):
+    monkeypatch.setattr(config, "CATALOG_CACHE_ENABLED", request.param)
+
+
+def add_listing_products(add_product):
+    # Repeated prices and names, so pages split ties
+    products = [
+        add_product(
+            f"Item {i % 7}", brand="Acme" if i % 2 else "Other", price=float(10 + i % 5),
+            category="Tops" if i % 3 else "Bottoms",
+            colors=["Red", "Blue"] if i % 4 == 0 else ["Red"], sizes=["S", "M"] if i % 2 else ["L"],
+        )
+        for i in range(23)
+    ]
+    return {p.id: p for p in products}
+
+
+def page_through(client, params):
+    ids = []
+    cursor = None
+    while True:
+        res = client.get("/products/", params={**params, "limit": 4, "total": True,
+                                               **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        ids += [p["id"] for p in res.json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, int(res.headers["X-Total-Count"])
+
+
+@pytest.mark.parametrize("sort", ["id", "-id", "price", "-price", "name", "-name"])
+def test_products_cursor_pagination(client, db, catalog_mode, sort, add_product):
+    products = add_listing_products(add_product)
+    attribute = sort.lstrip("-")
+
+    ids, total = page_through(client, {"sort": sort})
+    expected = sorted(products, key=lambda i: (getattr(products[i], attribute), i), reverse=sort.startswith("-"))
+    assert ids == expected
+    assert total == len(products)
+
+    ids, total = page_through(client, {"sort": sort, "category": "Tops"})
+    assert ids == [i for i in expected if products[i].category == "Tops"]
+    assert total == len(ids)
+
+
+def test_products_filters(client, db, catalog_mode, add_product):
+    products = add_listing_products(add_product)
+    params = {"category": "Tops", "min_price": 11, "max_price": 13, "brand": "Acme", "size": "M", "color": "Blue"}
+
+    ids, total = page_through(client, {**params, "sort": "-price"})
+    expected = [
+        i for i, p in products.items()
+        if p.category == "Tops" and 11 <= p.price <= 13 and p.brand == "Acme" and "M" in p.sizes and "Blue" in p.colors
+    ]
+    assert sorted(ids) == sorted(expected)
+    assert total == len(expected)
+
+    res = client.get("/products/", params={"limit": 5, "offset": 20})
+    assert [p["id"] for p in res.json()] == sorted(products)[20:]
+
+
+def test_products_rejects_foreign_cursor(client, db, catalog_mode, add_product):
+    add_listing_products(add_product)
+    cursor = client.get("/products/", params={"sort": "price", "limit": 2}).headers["X-Next-Cursor"]
+
+    assert client.get("/products/", params={"sort": "price", "cursor": cursor}).status_code == 200
+    assert client.get("/products/", params={"sort": "name", "cursor": cursor}).status_code == 400
+    assert client.get("/products/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/products/", params={"sort": "brand"}).status_code == 422
+
+
+@pytest.mark.parametrize("sort,key,product_id", [
+    ("price", "cheap", 1),
+    ("name", 12.5, 1),
+    ("id", "1", 1),
+    ("price", True, 1),
+    ("price", 10.0, "1"),
+    ("name", ["a"], 1),
+])
+def test_products_rejects_cursor_with_wrong_types(client, db, catalog_mode, add_product, sort, key, product_id):
+    from app.listing import encode_cursor
+
+    add_listing_products(add_product)
+    cursor = encode_cursor(sort, key, product_id)
+    res = client.get("/products/", params={"sort": sort, "cursor": cursor})
+    assert res.status_code == 400
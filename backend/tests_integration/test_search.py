@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import text
+
+from app import models, search
+
+
+@pytest.fixture(params=["memory", "fts5"])
+def search_backend(request, db, monkeypatch):
+    if request.param == "memory":
+        backend = search.MemorySearch()
+    else:
+        search.create_fts_table(db.get_bind())
+        backend = search.Fts5Search()
+    monkeypatch.setattr(search, "product_search", backend)
+    yield backend
+    if request.param == "fts5":
+        with db.get_bind().begin() as conn:
+            for trigger in ("products_fts_ai", "products_fts_ad", "products_fts_au"):
+                conn.execute(text(f"DROP TRIGGER {trigger}"))
+            conn.execute(text("DROP TABLE products_fts"))
+
+
+def search_ids(client, **params):
+    res = client.get("/products/search", params=params)
+    assert res.status_code == 200
+    return [p["id"] for p in res.json()["items"]]
+
+
+def test_search_ranks_and_matches_all_words(client, db, add_product, search_backend):
+    in_name = add_product("Silk Blouse").id
+    in_details = add_product("Summer Blouse", details=["100% silk lining"]).id
+    in_description = add_product("Evening Dress", category="Dresses", description="Flowing silk dress",
+                                 colors=["Red"], sizes=["S", "M"]).id
+    add_product("Wool Coat", brand="Silkworth", category="Outerwear")
+
+    ids = search_ids(client, q="silk", prefix=False)
+    # The name counts most; the brand "Silkworth" is another word
+    assert ids[0] == in_name
+    assert sorted(ids[1:]) == [in_details, in_description]
+    assert search_ids(client, q="SILK blouse") == [in_name, in_details]
+    # Prefix of the last word, and accents folded
+    assert search_ids(client, q="blouse sil") == [in_name, in_details]
+    assert search_ids(client, q="évening") == [in_description]
+    assert search_ids(client, q="silk", category="Dresses") == [in_description]
+    assert search_ids(client, q="silk coat", prefix=False) == []
+
+
+def test_search_facets_and_pages(client, db, add_product, search_backend):
+    for i in range(5):
+        add_product(f"Linen Shirt {i}", brand="Acme" if i % 2 else "Other",
+                    colors=["White", "Blue"] if i < 2 else ["White"], sizes=["M"], price=10.0 + i)
+    add_product("Linen Trousers", brand="Acme", category="Bottoms", colors=["Black"], sizes=["L"])
+
+    res = client.get("/products/search", params={"q": "linen", "limit": 2, "offset": 2})
+    body = res.json()
+    assert body["total"] == 6
+    assert len(body["items"]) == 2
+    assert body["facets"] == {
+        "category": {"Tops": 5, "Bottoms": 1},
+        "brand": {"Acme": 3, "Other": 3},
+        "color": {"White": 5, "Blue": 2, "Black": 1},
+        "size": {"M": 5, "L": 1},
+    }
+
+    body = client.get("/products/search", params={"q": "linen", "color": "Blue", "max_price": 10.5}).json()
+    assert body["total"] == 1
+    assert body["facets"]["brand"] == {"Other": 1}
+
+
+def test_memory_index_updates_incrementally(client, db, add_product, search_backend):
+    if not isinstance(search_backend, search.MemorySearch):
+        pytest.skip("FTS5 is kept current by triggers")
+    product_id = add_product("Cotton Tee").id
+    assert search_ids(client, q="cotton") == [product_id]
+    index = search_backend.index
+
+    product = db.get(models.Product, product_id)
+    product.name = "Hemp Tee"
+    db.commit()
+    new_id = add_product("Cotton Polo").id
+    db.delete(db.get(models.Product, new_id))
+    db.commit()
+
+    assert search_ids(client, q="hemp") == [product_id]
+    assert search_ids(client, q="cotton") == []
+    # Only the written products were re-indexed
+    assert search_backend.index is index
+    assert search_ids(client, q="polo") == []
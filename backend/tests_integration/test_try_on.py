@@ -0,0 +1,689 @@
+import json
+import threading
+import time
+
+from app.try_on.jobs import JobQueue, get_job_queue
+from app.main import app
+
+USER_IMAGE = {"userImage": ("me.jpg", b"fakeimagebytes", "image/jpeg")}
+
+
+def wait_for_job(client, job_id):
+    for _ in range(50):
+        job = client.get(f"/try-on/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_try_on_returns_job_id(client):
+    res = client.post("/try-on/", data={"productId": "2"}, files=USER_IMAGE)
+    assert res.status_code == 202
+    body = res.json()
+    assert body["status"] in ("queued", "running", "succeeded")
+    assert res.headers["location"] == f"/try-on/jobs/{body['job_id']}"
+
+    job = wait_for_job(client, body["job_id"])
+    assert job["status"] == "succeeded"
+    assert job["result_image"].startswith("/try-on/results/")
+
+
+def test_try_on_result_is_served_with_caching_headers(client):
+    job_id = client.post("/try-on/", data={"productId": "5"}, files=USER_IMAGE).json()["job_id"]
+    result_url = wait_for_job(client, job_id)["result_image"]
+
+    res = client.get(result_url)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "image/jpeg"
+    assert "immutable" in res.headers["cache-control"]
+    etag = res.headers["etag"]
+
+    assert client.get(result_url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(result_url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == res.content[:10]
+
+    assert client.get("/try-on/results/../../etc/passwd").status_code == 404
+
+
+def test_expired_results_are_swept(tmp_path):
+    import os
+    from app.try_on.results import LocalResultStore
+
+    store = LocalResultStore(str(tmp_path), ttl_seconds=60)
+    old = store.save(b"old render")
+    fresh = store.save(b"fresh render")
+    stored_at = time.time()
+    os.utime(store.locate(old), (stored_at - 120, stored_at - 120))
+
+    assert store.sweep() == 1
+    assert store.locate(old) is None
+    assert store.locate(fresh) is not None
+    # Saving a result again restarts its TTL
+    os.utime(store.locate(fresh), (stored_at - 120, stored_at - 120))
+    store.save(b"fresh render")
+    assert store.sweep() == 0
+    assert store.sweep(now=stored_at + 120) == 1
+
+
+def test_try_on_inline_result(client):
+    res = client.post("/try-on/?inline=1", data={"productId": "5"}, files=USER_IMAGE)
+    job = wait_for_job(client, res.json()["job_id"])
+    assert job["result_image"].startswith("data:image/jpeg;base64,")
+
+
+def test_try_on_job_events_stream(client):
+    job_id = client.post("/try-on/", data={"productId": "3"}, files=USER_IMAGE).json()["job_id"]
+
+    with client.stream("GET", f"/try-on/jobs/{job_id}/events") as res:
+        assert res.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line[len("data: "):])
+            for line in res.iter_lines()
+            if line.startswith("data: ")
+        ]
+
+    assert events[-1]["job_id"] == job_id
+    assert events[-1]["status"] == "succeeded"
+    assert events[-1]["result_image"]
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/try-on/jobs/does-not-exist").status_code == 404
+    assert client.get("/try-on/jobs/does-not-exist/events").status_code == 404
+
+
+def test_full_queue_returns_429(client):
+    release = threading.Event()
+    queue = JobQueue(workers=1, queue_size=0, ttl_seconds=60)
+    queue.submit(release.wait)
+    app.dependency_overrides[get_job_queue] = lambda: queue
+    try:
+        res = client.post("/try-on/", data={"productId": "1"}, files=USER_IMAGE)
+        assert res.status_code == 429
+        assert "retry-after" in res.headers
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_repeated_try_on_is_served_from_cache(client):
+    from app.try_on.cache import render_cache
+    from app.try_on.pool import backend_pool
+
+    render_cache.clear()
+    photo = {"userImage": ("me.jpg", b"same-photo-every-time", "image/jpeg")}
+
+    first = wait_for_job(client, client.post("/try-on/", data={"productId": "4"}, files=photo).json()["job_id"])
+    renders = backend_pool.stats()["renders"]
+    second = wait_for_job(client, client.post("/try-on/", data={"productId": "4"}, files=photo).json()["job_id"])
+
+    assert second["result_image"] == first["result_image"]
+    assert backend_pool.stats()["renders"] == renders
+
+    stats = client.get("/try-on/stats").json()["cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    from app.try_on.cache import RenderCache
+
+    cache = RenderCache(str(tmp_path), max_bytes=10, ttl_seconds=60)
+    cache.put("aa01", b"1234")
+    cache.put("bb02", b"5678")
+    assert cache.get("aa01") == b"1234"
+
+    # Over budget: "bb02" is now the least recently used entry
+    cache.put("cc03", b"9012")
+    assert cache.get("bb02") is None
+    assert cache.get("aa01") == b"1234"
+    assert cache.stats()["evictions"] == 1
+
+    expired = RenderCache(str(tmp_path), max_bytes=10, ttl_seconds=-1)
+    assert expired.get("aa01") is None
+
+
+def test_oversized_photo_is_rejected(client, monkeypatch):
+    from app import config
+
+    monkeypatch.setattr(config, "TRYON_UPLOAD_MAX_MB", 1)
+    photo = {"userImage": ("big.jpg", b"x" * (1024 * 1024 + 1), "image/jpeg")}
+    res = client.post("/try-on/", data={"productId": "1"}, files=photo)
+    assert res.status_code == 413
+
+
+def test_spooled_upload_cleans_up(tmp_path, monkeypatch):
+    import hashlib
+    import io
+    import os
+    import time
+    from app.try_on import uploads
+
+    monkeypatch.setattr(uploads, "upload_dir", tmp_path)
+    data = os.urandom(300 * 1024)
+
+    with uploads.spool(io.BytesIO(data), max_bytes=1024 * 1024, memory_limit=1024) as upload:
+        assert upload.sha256 == hashlib.sha256(data).hexdigest()
+        assert not upload.in_memory
+        assert upload.as_file().read_bytes() == data
+    assert list(tmp_path.iterdir()) == []
+
+    with uploads.spool(io.BytesIO(b"small"), max_bytes=1024, memory_limit=1024) as upload:
+        assert upload.in_memory
+        assert list(tmp_path.iterdir()) == []
+        assert upload.as_file().read_bytes() == b"small"
+    assert list(tmp_path.iterdir()) == []
+
+    orphan = tmp_path / "user_orphan.jpg"
+    orphan.write_bytes(b"left behind")
+    os.utime(orphan, (time.time() - 7200, time.time() - 7200))
+    assert uploads.sweep_orphans(max_age_seconds=3600) == 1
+    assert not orphan.exists()
+
+
+def make_photo(size=(4000, 3000), orientation=None):
+    import io
+    from PIL import Image
+
+    img = Image.new("RGB", size, (200, 120, 90))
+    # Mark the top-left corner so the orientation can be checked
+    img.paste((0, 0, 255), (0, 0, size[0] // 10, size[1] // 10))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95, exif=exif)
+    return out.getvalue()
+
+
+def test_preprocess_orients_fits_and_downscales():
+    import io
+    import pytest
+    from PIL import Image
+    from app.try_on.preprocess import InvalidImageError, preprocess_image
+
+    # Landscape sensor image tagged "rotate 90 CW": upright it is a 3000x4000 portrait
+    photo = make_photo(orientation=6)
+    out = preprocess_image(photo, 768, 1024, fit="pad")
+    img = Image.open(io.BytesIO(out))
+    assert img.format == "JPEG"
+    assert img.size == (768, 1024)
+    assert len(out) < len(photo)
+    # After rotating 90 CW the marked corner ends up top-right
+    assert img.getpixel((760, 5))[2] > 200
+
+    cropped = Image.open(io.BytesIO(preprocess_image(make_photo((2000, 1000)), 768, 1024, fit="crop")))
+    assert cropped.size == (750, 1000)
+
+    with pytest.raises(InvalidImageError):
+        preprocess_image(b"not an image", 768, 1024)
+    # The header decodes, the pixel data is cut short
+    with pytest.raises(InvalidImageError):
+        preprocess_image(photo[:len(photo) // 2], 768, 1024)
+
+
+def test_try_on_with_real_photo(client):
+    photo = {"userImage": ("me.jpg", make_photo((1200, 1600)), "image/jpeg")}
+    job_id = client.post("/try-on/", data={"productId": "6"}, files=photo).json()["job_id"]
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "succeeded"
+    assert job["result_image"].startswith("/try-on/results/")
+
+
+def test_garment_colour_variants():
+    from app.try_on.garments import garment_registry
+
+    default = garment_registry.get(1)
+    navy = garment_registry.get(1, "Navy")
+    assert default.category == "Upper-body"
+    assert navy.color == "navy"
+    assert navy.sha256 != default.sha256
+    # Colours without their own image use the product's default one
+    assert garment_registry.get(1, "Ivory") == default
+    # Accessories have no try-on metadata
+    assert garment_registry.get(7) is None
+
+    data = garment_registry.read(navy)
+    assert len(data) == navy.size
+    assert garment_registry.stats()["hits"] >= 1
+
+
+def test_garment_metadata_comes_from_catalog(db, add_product, tmp_path):
+    from sqlalchemy.orm import sessionmaker
+    from app.try_on.garments import GarmentRegistry, PUBLIC_DIR
+
+    registry = GarmentRegistry(
+        PUBLIC_DIR, str(tmp_path), 768, 1024, cache_bytes=1024 * 1024,
+        session_factory=sessionmaker(bind=db.get_bind()),
+    )
+    product = add_product(
+        "Test Dress", price=50.0, image="/assets/clothing-3.jpg", category="Dresses", colors=["Sage"],
+        garment_category="Dress", try_on_image="/assets/clothing-3.jpg",
+    )
+
+    asset = registry.get(product.id, "Sage")
+    assert asset.category == "Dress"
+    assert asset.color == "sage"
+
+    # Lookups are served from memory until the catalog changes
+    reloads = registry.stats()["reloads"]
+    registry.get(product.id)
+    assert registry.stats()["reloads"] == reloads
+
+    product.garment_category = "Upper-body"
+    db.commit()
+    assert registry.get(product.id).category == "Upper-body"
+    assert registry.stats()["reloads"] == reloads + 1
+
+
+def test_try_on_uses_requested_colour(client):
+    from app.try_on.backends import composite
+    from app.try_on.garments import garment_registry
+
+    res = client.post("/try-on/", data={"productId": "2", "color": "Charcoal"}, files=USER_IMAGE)
+    job = wait_for_job(client, res.json()["job_id"])
+    # The stub backend is deterministic, so the render can be reproduced here
+    garment = garment_registry.get(2, "Charcoal")
+    expected = composite(USER_IMAGE["userImage"][1], garment_registry.read(garment), garment.category)
+    assert client.get(job["result_image"]).content == expected
+
+
+def test_render_takes_garment_from_registry_cache(client, monkeypatch):
+    from pathlib import Path
+    from app.try_on.garments import garment_registry
+
+    garment_registry.read(garment_registry.get(3))
+    hits = garment_registry.stats()["hits"]
+    # The prepared file isn't read again
+    read_bytes = Path.read_bytes
+
+    def no_garment_reads(path):
+        assert path != garment_registry.get(3).path
+        return read_bytes(path)
+
+    monkeypatch.setattr(Path, "read_bytes", no_garment_reads)
+    # A photo no other test renders, so nothing is served from a previous render
+    photo = {"userImage": ("me.jpg", f"registry-{time.time()}".encode(), "image/jpeg")}
+    res = client.post("/try-on/", data={"productId": "3"}, files=photo)
+    assert wait_for_job(client, res.json()["job_id"])["status"] == "succeeded"
+    assert garment_registry.stats()["hits"] > hits
+
+
+def test_stub_backend_composites_garment_onto_photo(tmp_path):
+    import io
+    from PIL import Image
+    from app.try_on.backends import StubBackend
+    from app.try_on.garments import garment_registry
+
+    photo = tmp_path / "me.jpg"
+    photo.write_bytes(make_photo((600, 800)))
+    garment = garment_registry.get(1)
+
+    backend = StubBackend()
+    first = backend.render(photo, garment.path, garment.category, {})
+    assert backend.render(photo, garment.path, garment.category, {}) == first
+    assert backend.calls == 2
+    assert Image.open(io.BytesIO(first)).size == (600, 800)
+
+
+def test_subprocess_backend_matches_stub(tmp_path):
+    import sys
+    import pytest
+    from app.try_on.backends import StubBackend, SubprocessBackend
+    from app.try_on.garments import garment_registry
+
+    photo = tmp_path / "me.jpg"
+    photo.write_bytes(make_photo((600, 800)))
+    garment = garment_registry.get(3)
+
+    backend = SubprocessBackend([sys.executable, "-m", "app.try_on.model_server"])
+    try:
+        rendered = backend.render(photo, garment.path, garment.category, {})
+        # Errors in the server come back as exceptions, and the server keeps running
+        with pytest.raises(RuntimeError):
+            backend.render(tmp_path / "missing.jpg", garment.path, garment.category, {})
+        assert backend.render(photo, garment.path, garment.category, {}) == rendered
+    finally:
+        backend.close()
+    assert rendered == StubBackend().render(photo, garment.path, garment.category, {})
+
+
+def test_batch_try_on_streams_each_garment(client, monkeypatch):
+    from app.try_on.preprocess import preprocessor
+
+    runs = []
+    original_run = preprocessor.run
+    monkeypatch.setattr(preprocessor, "run", lambda *args: runs.append(1) or original_run(*args))
+
+    photo = {"userImage": ("me.jpg", make_photo((1100, 1500)), "image/jpeg")}
+    items = [{"productId": 1, "color": "Navy"}, {"productId": 2}, {"productId": 6}]
+    with client.stream("POST", "/try-on/batch", data={"items": json.dumps(items)}, files=photo) as res:
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in res.iter_lines() if line]
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert all(line["status"] == "succeeded" for line in lines)
+    assert {line["productId"] for line in lines} == {1, 2, 6}
+    # One photo, three renders, one preprocessing pass
+    assert len(runs) == 1
+
+
+def test_batch_stream_cleans_up_when_client_disconnects():
+    import asyncio
+    import pytest
+    from app.routers.try_on import ClosingStreamingResponse
+
+    started, closed = [], []
+
+    async def body():
+        started.append(1)
+        yield b"line\n"
+
+    async def disconnected(message):
+        raise OSError("client went away")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    response = ClosingStreamingResponse(body(), on_close=lambda: closed.append(1))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(Exception):
+        asyncio.run(response(scope, receive, disconnected))
+    # Gone before the body was read: the generator's own cleanup never ran
+    assert started == []
+    assert closed == [1]
+
+
+def test_batch_try_on_validates_items(client):
+    res = client.post("/try-on/batch", data={"items": "[{\"color\": \"Navy\"}]"}, files=USER_IMAGE)
+    assert res.status_code == 422
+    res = client.post("/try-on/batch", data={"items": "[]"}, files=USER_IMAGE)
+    assert res.status_code == 422
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyBackend:
+    name = "flaky"
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.closed = False
+
+    def render(self, user_img, garment_img, category, params, deadline=None, garment_data=None):
+        if self.fail:
+            raise RuntimeError("model down")
+        return b"image"
+
+    def health_check(self):
+        if self.fail:
+            raise RuntimeError("model down")
+
+    def close(self):
+        self.closed = True
+
+
+def test_circuit_breaker_fails_fast_then_retries():
+    import pytest
+    from app.try_on.pool import BackendPool, BackendUnavailableError, CircuitBreaker
+
+    clock = FakeClock()
+    backend = FlakyBackend(fail=True)
+    pool = BackendPool(lambda: backend, size=1, breaker=CircuitBreaker(2, 30, clock=clock),
+                       acquire_timeout=1, clock=clock)
+    pool.connect()
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            pool.render("me.jpg", "garment.jpg", "Upper-body", {})
+    assert pool.stats()["breaker"]["state"] == "open"
+    assert not pool.available()
+    # Open: refused without touching the backend
+    with pytest.raises(BackendUnavailableError):
+        pool.render("me.jpg", "garment.jpg", "Upper-body", {})
+    assert pool.stats()["render_failures"] == 2
+
+    # After the reset timeout one trial goes through and closes the breaker
+    clock.now = 31
+    backend.fail = False
+    assert pool.available()
+    assert pool.render("me.jpg", "garment.jpg", "Upper-body", {}) == b"image"
+    assert pool.stats()["breaker"]["state"] == "closed"
+
+
+def test_backend_pool_reconnects_with_backoff():
+    from app.try_on.pool import BackendPool, CircuitBreaker
+
+    clock = FakeClock()
+    attempts = []
+
+    def connect():
+        attempts.append(clock.now)
+        if len(attempts) <= 2:
+            raise ConnectionError("handshake failed")
+        return FlakyBackend()
+
+    pool = BackendPool(connect, size=1, breaker=CircuitBreaker(5, 30, clock=clock),
+                       acquire_timeout=1, backoff_base=1, clock=clock)
+    pool.connect()
+    assert pool.stats()["connected"] == 0
+    # Backing off: nothing is attempted before the delay is up
+    pool.check()
+    assert attempts == [0.0]
+
+    clock.now = 1
+    pool.check()
+    assert pool.stats()["reconnect_in"] == 2
+    clock.now = 3
+    pool.check()
+    assert attempts == [0.0, 1, 3]
+    assert pool.stats()["connected"] == 1
+
+    # A backend failing its health check is dropped and replaced
+    broken = pool._idle.get()
+    broken.fail = True
+    pool._idle.put(broken)
+    pool.check()
+    assert broken.closed
+    assert pool.stats()["connected"] == 1
+
+
+def test_try_on_health(client):
+    res = client.get("/try-on/health")
+    assert res.status_code == 200
+    body = res.json()
+    assert body["status"] == "ok"
+    assert body["backend"] == "stub"
+    assert body["connected"] == body["size"]
+    assert body["breaker"]["state"] == "closed"
+
+
+def slow_down_backends(monkeypatch, seconds):
+    from app.try_on.pool import backend_pool
+
+    for backend in list(backend_pool._idle.queue):
+        monkeypatch.setattr(backend, "latency", seconds)
+
+
+def test_try_on_deadline_degrades_to_fallback(client, monkeypatch):
+    slow_down_backends(monkeypatch, 5)
+    expired = client.get("/try-on/stats").json()["deadlines"]["expired_in_render"]
+
+    started = time.monotonic()
+    photo = {"userImage": ("me.jpg", b"deadline-photo", "image/jpeg")}
+    res = client.post("/try-on/", data={"productId": "1"}, files=photo,
+                      headers={"X-Request-Deadline": "0.3"})
+    job = wait_for_job(client, res.json()["job_id"])
+
+    assert job["status"] == "succeeded"
+    assert job["result_image"] == "/assets/try-on-fallback.jpg"
+    assert time.monotonic() - started < 3
+    stats = client.get("/try-on/stats").json()["deadlines"]
+    assert stats["expired_in_render"] == expired + 1
+
+
+def test_cancelled_try_on_stops_rendering(client, monkeypatch):
+    slow_down_backends(monkeypatch, 5)
+    cancelled = client.get("/try-on/stats").json()["deadlines"]["cancelled"]
+
+    photo = {"userImage": ("me.jpg", b"cancelled-photo", "image/jpeg")}
+    job_id = client.post("/try-on/", data={"productId": "1"}, files=photo).json()["job_id"]
+    time.sleep(0.2)
+    assert client.delete(f"/try-on/jobs/{job_id}").status_code == 202
+    job = wait_for_job(client, job_id)
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Cancelled by the client"
+    assert client.get("/try-on/stats").json()["deadlines"]["cancelled"] == cancelled + 1
+    assert client.delete("/try-on/jobs/unknown").status_code == 404
+
+
+def test_subprocess_backend_kills_render_past_deadline(tmp_path):
+    import sys
+    import pytest
+    from app.try_on.backends import SubprocessBackend
+    from app.try_on.deadlines import Deadline, DeadlineExceeded
+    from app.try_on.garments import garment_registry
+
+    photo = tmp_path / "me.jpg"
+    photo.write_bytes(make_photo((600, 800)))
+    garment = garment_registry.get(1)
+
+    backend = SubprocessBackend([sys.executable, "-m", "app.try_on.model_server", "--latency", "5"])
+    started = time.monotonic()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            backend.render(photo, garment.path, garment.category, {}, Deadline(0.5))
+        assert time.monotonic() - started < 4
+        # The server was killed, the next render starts a fresh one
+        assert backend._proc is None
+    finally:
+        backend.close()
+
+
+def test_preview_quality_is_upgraded_to_final(client, monkeypatch):
+    import io
+    from PIL import Image
+
+    slow_down_backends(monkeypatch, 0.6)
+    photo = {"userImage": ("me.jpg", make_photo((1500, 2000)), "image/jpeg")}
+    job_id = client.post("/try-on/", data={"productId": "1", "quality": "preview"}, files=photo).json()["job_id"]
+
+    # The preview shows up while the full-quality render is still running
+    for _ in range(100):
+        job = client.get(f"/try-on/jobs/{job_id}").json()
+        if job["preview_image"] or job["status"] == "succeeded":
+            break
+        time.sleep(0.02)
+    assert job["status"] == "running"
+    assert job["preview_image"].endswith("-preview.jpg")
+
+    job = wait_for_job(client, job_id)
+    assert job["result_image"].endswith("-final.jpg")
+    assert job["preview_image"].endswith("-preview.jpg")
+
+    preview = client.get(job["preview_image"])
+    final = client.get(job["result_image"])
+    assert preview.headers["x-try-on-quality"] == "preview"
+    assert final.headers["x-try-on-quality"] == "final"
+    # Tiers render at their own resolution
+    assert Image.open(io.BytesIO(preview.content)).size == (384, 512)
+    assert Image.open(io.BytesIO(final.content)).size == (768, 1024)
+
+
+def test_unknown_quality_is_rejected(client):
+    res = client.post("/try-on/", data={"productId": "1", "quality": "ultra"}, files=USER_IMAGE)
+    assert res.status_code == 422
+
+
+def test_identical_concurrent_try_ons_share_one_render(client, monkeypatch):
+    from app.try_on.pool import backend_pool
+
+    slow_down_backends(monkeypatch, 0.5)
+    before = client.get("/try-on/stats").json()
+    photo = {"userImage": ("me.jpg", b"double-click-photo", "image/jpeg")}
+    job_ids = [
+        client.post("/try-on/", data={"productId": "3"}, files=photo).json()["job_id"]
+        for _ in range(2)
+    ]
+    jobs = [wait_for_job(client, job_id) for job_id in job_ids]
+
+    assert jobs[0]["result_image"] == jobs[1]["result_image"]
+    assert jobs[0]["result_image"].startswith("/try-on/results/")
+    after = client.get("/try-on/stats").json()
+    assert after["backend"]["renders"] == before["backend"]["renders"] + 1
+    assert after["coalescing"]["coalesced"] == before["coalescing"]["coalesced"] + 1
+
+
+def test_single_flight_coalesces_across_workers(tmp_path):
+    from app.try_on.singleflight import SingleFlight
+
+    # Two registries on one directory stand in for two uvicorn workers
+    worker_a = SingleFlight(str(tmp_path), result_ttl=60)
+    worker_b = SingleFlight(str(tmp_path), result_ttl=60)
+    calls = []
+
+    def slow_render():
+        calls.append("a")
+        time.sleep(0.3)
+        return "result-a"
+
+    leader = threading.Thread(target=worker_a.do, args=("key", slow_render))
+    leader.start()
+    time.sleep(0.1)
+    result = worker_b.do("key", lambda: calls.append("b") or "result-b")
+    leader.join()
+
+    assert result == "result-a"
+    assert calls == ["a"]
+    assert worker_b.stats()["coalesced_across_workers"] == 1
+
+
+def test_flight_sweeper_keeps_locks_held_by_long_renders(tmp_path):
+    import os
+    from app.try_on.singleflight import SingleFlight
+
+    flights = SingleFlight(str(tmp_path), result_ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def long_render():
+        # Pretend the render has been going for longer than the sweeper's max age
+        os.utime(tmp_path / "key.lock", (time.time() - 7200, time.time() - 7200))
+        started.set()
+        release.wait()
+        return "result"
+
+    leader = threading.Thread(target=flights.do, args=("key", long_render))
+    leader.start()
+    started.wait()
+    assert flights.sweep(max_age_seconds=3600) == 0
+    assert (tmp_path / "key.lock").exists()
+    release.set()
+    leader.join()
+
+    for path in tmp_path.iterdir():
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+    assert flights.sweep(max_age_seconds=3600) == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_backends_implement_render(monkeypatch):
+    import pytest
+    from app.try_on import backends
+
+    with pytest.raises(TypeError):
+        backends.TryOnBackend()
+    monkeypatch.setattr(backends.sys, "platform", "win32")
+    with pytest.raises(RuntimeError, match="Windows"):
+        backends.SubprocessBackend(["model-server"])
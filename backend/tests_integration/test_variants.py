@@ -0,0 +1,71 @@
+import pytest
+
+from app import config, models
+from app.variants import backfill_product_variants
+
+
+def test_variants_follow_sizes_and_colors(db, add_product, variants_of):
+    product = add_product("Variant Tee", sizes=["S", "M"], colors=["Red", "Navy Blue"])
+    skus = {option: v.sku for option, v in variants_of(product.id).items()}
+    assert set(skus) == {("S", "Red"), ("S", "Navy Blue"), ("M", "Red"), ("M", "Navy Blue")}
+    assert all(sku.startswith(f"{product.id}-") for sku in skus.values())
+    assert len(set(skus.values())) == 4
+
+    db.query(models.ProductVariant).filter_by(product_id=product.id, size="M", color="Red").update({"stock": 4})
+    db.commit()
+    product.sizes = ["M", "L"]
+    product.colors = ["Red"]
+    db.commit()
+    # Stock of the variants still sold is kept
+    variants = variants_of(product.id)
+    assert {option: (v.stock, v.sku) for option, v in variants.items()} == {
+        ("M", "Red"): (4, skus[("M", "Red")]),
+        ("L", "Red"): (None, variants[("L", "Red")].sku),
+    }
+    assert variants[("L", "Red")].sku not in skus.values()
+
+    product_id = product.id
+    db.delete(product)
+    db.commit()
+    assert variants_of(product_id) == {}
+
+
+def test_backfill_creates_missing_variants(db, variants_of):
+    with db.get_bind().begin() as conn:
+        conn.execute(models.Product.__table__.insert(), [{
+            "id": 4242, "name": "Bulk", "brand": "Brand", "price": 1.0, "image": "x.jpg", "category": "Tops",
+            "description": "Desc", "colors": ["Black"], "sizes": ["S", "M"], "details": [],
+        }])
+    assert variants_of(4242) == {}
+
+    backfill_product_variants(db.get_bind())
+    backfill_product_variants(db.get_bind())
+    variants = variants_of(4242)
+    assert set(variants) == {("S", "Black"), ("M", "Black")}
+    assert all(v.sku.startswith("4242-") for v in variants.values())
+
+
+def test_variants_whose_names_read_alike_get_distinct_skus(db, add_product, variants_of):
+    # Both spellings come out as NAVY-BLUE once made SKU-safe
+    product = add_product("Alike", sizes=["X L", "x-l"], colors=["Navy Blue", "navy-blue"])
+    assert len({v.sku for v in variants_of(product.id).values()}) == 4
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "database"])
+def test_products_filtered_by_one_variant(client, db, add_product, monkeypatch, cached):
+    monkeypatch.setattr(config, "CATALOG_CACHE_ENABLED", cached)
+    # M in Red and S in Navy, but no M in Navy
+    split = add_product("Split", sizes=["M"], colors=["Red"]).id
+    db.add(models.ProductVariant(product_id=split, size="S", color="Navy"))
+    db.commit()
+    both = add_product("Both", sizes=["S", "M"], colors=["Navy"]).id
+    sold_out = add_product("Sold Out", sizes=["M"], colors=["Navy"]).id
+    db.query(models.ProductVariant).filter_by(product_id=sold_out).update({"stock": 0})
+    db.commit()
+
+    def ids(**params):
+        return [p["id"] for p in client.get("/products/", params=params).json()]
+
+    assert ids(size="M", color="Navy") == [both]
+    assert ids(color="Navy") == [split, both]
+    assert ids(size="M") == [split, both]
@@ -5,7 +5,7 @@ import heroModel from "@/assets/hero-model.jpg";
 import clothing1 from "@/assets/clothing-1.jpg";
 import clothing2 from "@/assets/clothing-2.jpg";
 import clothing3 from "@/assets/clothing-3.jpg";
-import api from "@/lib/api";
+import { runTryOn } from "@/lib/tryOn";
 import { toast } from "sonner";
 
 const TryOnSection = () => {
@@ -48,12 +48,8 @@ const TryOnSection = () => {
     formData.append("productId", selectedClothing.toString());
 
     try {
-      const response = await api.post("/try-on/", formData, {
-        headers: {
-          "Content-Type": "multipart/form-data",
-        },
-      });
-      setResultImage(response.data.result_image);
+      const imageUrl = await runTryOn(formData);
+      setResultImage(imageUrl);
       toast.success("Virtual try-on complete!");
     } catch (error) {
       console.error(error);
@@ -1,7 +1,7 @@
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { X, Upload, Loader2, Sparkles } from "lucide-react";
 import { Button } from "@/components/ui/button";
-import api from "@/lib/api";
+import { runTryOn, TryOnCancelledError } from "@/lib/tryOn";
 import { toast } from "sonner";
 
 interface VirtualTryOnModalProps {
@@ -28,6 +28,14 @@ export const VirtualTryOnModal = ({
     const [resultImage, setResultImage] = useState<string | null>(null);
     const [loading, setLoading] = useState(false);
     const [progress, setProgress] = useState(0);
+    const tryOnAbort = useRef<AbortController | null>(null);
+
+    // Closing the modal cancels a render still in progress
+    useEffect(() => {
+        if (!isOpen) {
+            tryOnAbort.current?.abort();
+        }
+    }, [isOpen]);
 
     const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
         if (e.target.files && e.target.files[0]) {
@@ -61,20 +69,31 @@ export const VirtualTryOnModal = ({
         const formData = new FormData();
         formData.append("userImage", selectedImage);
         formData.append("productId", productId.toString());
+        if (selectedColor) {
+            formData.append("color", selectedColor);
+        }
+        // Show a quick preview first, the full-quality render replaces it
+        formData.append("quality", "preview");
+
+        tryOnAbort.current?.abort();
+        const abort = new AbortController();
+        tryOnAbort.current = abort;
 
         try {
-            const response = await api.post("/try-on/", formData, {
-                headers: {
-                    "Content-Type": "multipart/form-data",
-                },
+            const imageUrl = await runTryOn(formData, {
+                signal: abort.signal,
+                onPreview: setResultImage,
             });
 
             clearInterval(progressInterval);
             setProgress(100);
-            setResultImage(response.data.result_image);
+            setResultImage(imageUrl);
             toast.success("Virtual try-on complete!");
         } catch (error) {
             clearInterval(progressInterval);
+            if (error instanceof TryOnCancelledError || abort.signal.aborted) {
+                return;
+            }
             console.error(error);
             toast.error("Failed to generate try-on result");
         } finally {
@@ -1,5 +1,6 @@
 import { createContext, useContext, useState, useEffect, ReactNode } from "react";
 import { useNavigate } from "react-router-dom";
+import axios from "axios";
 import api from "@/lib/api";
 
 interface User {
@@ -11,7 +12,7 @@ interface User {
 interface AuthContextType {
     user: User | null;
     isAuthenticated: boolean;
-    login: (token: string, user: User) => void;
+    login: (token: string, user: User, refreshToken?: string) => void;
     logout: () => void;
     loading: boolean;
 }
@@ -40,6 +41,7 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
                 // Token is invalid or expired, clear it
                 console.error("Token validation failed:", error);
                 localStorage.removeItem("token");
+                localStorage.removeItem("refresh_token");
                 localStorage.removeItem("user");
                 setUser(null);
             } finally {
@@ -50,14 +52,27 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
         validateToken();
     }, []);
 
-    const login = (token: string, user: User) => {
+    const login = (token: string, user: User, refreshToken?: string) => {
         localStorage.setItem("token", token);
+        if (refreshToken) {
+            localStorage.setItem("refresh_token", refreshToken);
+        }
         localStorage.setItem("user", JSON.stringify(user));
         setUser(user);
     };
 
     const logout = () => {
+        // Revoke both tokens on the server; logging out here doesn't wait for it
+        const token = localStorage.getItem("token");
+        const refreshToken = localStorage.getItem("refresh_token");
+        if (token) {
+            // Not through api: an expired token shouldn't redirect to /login
+            axios.post("/api/auth/logout", refreshToken ? { refresh_token: refreshToken } : undefined, {
+                headers: { Authorization: `Bearer ${token}` },
+            }).catch(() => {});
+        }
         localStorage.removeItem("token");
+        localStorage.removeItem("refresh_token");
         localStorage.removeItem("user");
         setUser(null);
         // Redirect to home page after logout
@@ -21,13 +21,46 @@ api.interceptors.request.use(
     }
 );
 
+// One refresh at a time: requests failing together wait for the same one
+let refreshing: Promise<string> | null = null;
+
+const refreshAccessToken = (): Promise<string> => {
+    if (!refreshing) {
+        const refreshToken = localStorage.getItem("refresh_token");
+        refreshing = (refreshToken
+            ? axios.post("/api/auth/refresh", { refresh_token: refreshToken }).then((response) => {
+                localStorage.setItem("token", response.data.token);
+                localStorage.setItem("refresh_token", response.data.refresh_token);
+                return response.data.token as string;
+            })
+            : Promise.reject(new Error("No refresh token"))
+        ).finally(() => {
+            refreshing = null;
+        });
+    }
+    return refreshing;
+};
+
 // Add a response interceptor to handle errors (e.g., 401 Unauthorized)
 api.interceptors.response.use(
     (response) => response,
-    (error) => {
+    async (error) => {
+        const original = error.config;
+        // Access tokens are short-lived: get a new one and retry once
+        if (error.response?.status === 401 && original && !original._retried && !original.url?.startsWith("/auth/")) {
+            original._retried = true;
+            try {
+                const token = await refreshAccessToken();
+                original.headers.Authorization = `Bearer ${token}`;
+                return api(original);
+            } catch {
+                // Fall through to logging out
+            }
+        }
         if (error.response?.status === 401) {
             // Clear token and dispatch logout event
             localStorage.removeItem("token");
+            localStorage.removeItem("refresh_token");
             localStorage.removeItem("user");
 
             // Dispatch custom event for AuthContext to listen to
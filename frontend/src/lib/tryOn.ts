@@ -0,0 +1,62 @@
+import api from "@/lib/api";
+
+interface TryOnJob {
+    job_id: string;
+    status: "queued" | "running" | "succeeded" | "failed";
+    result_image: string | null;
+    preview_image: string | null;
+    error: string | null;
+}
+
+interface RunTryOnOptions {
+    // Aborting cancels the render on the server too
+    signal?: AbortSignal;
+    // Called with the quick preview render when asking for quality=preview
+    onPreview?: (imageUrl: string) => void;
+}
+
+const POLL_INTERVAL_MS = 1000;
+
+export class TryOnCancelledError extends Error {
+    constructor() {
+        super("Try-on cancelled");
+    }
+}
+
+// Stored renders are served by the API; the fallback image is a frontend asset
+function imageUrl(path: string): string {
+    return path.startsWith("/try-on/") ? `${api.defaults.baseURL}${path}` : path;
+}
+
+// Submit a try-on job and poll it until the render is finished.
+export async function runTryOn(
+    formData: FormData,
+    { signal, onPreview }: RunTryOnOptions = {},
+): Promise<string> {
+    const response = await api.post<TryOnJob>("/try-on/", formData, {
+        headers: {
+            "Content-Type": "multipart/form-data",
+        },
+        signal,
+    });
+
+    let job = response.data;
+    let preview: string | null = null;
+    while (job.status === "queued" || job.status === "running") {
+        if (job.preview_image && job.preview_image !== preview) {
+            preview = job.preview_image;
+            onPreview?.(imageUrl(preview));
+        }
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+        if (signal?.aborted) {
+            api.delete(`/try-on/jobs/${job.job_id}`).catch(() => undefined);
+            throw new TryOnCancelledError();
+        }
+        job = (await api.get<TryOnJob>(`/try-on/jobs/${job.job_id}`)).data;
+    }
+
+    if (job.status === "failed" || !job.result_image) {
+        throw new Error(job.error ?? "Try-on failed");
+    }
+    return imageUrl(job.result_image);
+}
@@ -24,7 +24,7 @@ const Login = () => {
     setLoading(true);
     try {
       const response = await api.post("/auth/login", { email, password });
-      login(response.data.token, response.data.user);
+      login(response.data.token, response.data.user, response.data.refresh_token);
       toast.success("Welcome back!");
 
       // Redirect to intended destination or home
@@ -36,7 +36,7 @@ const Signup = () => {
       });
 
       // Login with the returned token and user
-      login(response.data.token, response.data.user);
+      login(response.data.token, response.data.user, response.data.refresh_token);
       toast.success("Account created successfully!");
       navigate("/");
     } catch (error: any) {